@@ -0,0 +1,284 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from sales_model import TIME_BUCKET_COLUMNS, month_bucket_dates, row_indexer
+
+#共享聚合: 一次遍历过滤后的交易 (或预聚合的立方体), 计算KPI和四个图表需要的所有分组合计
+
+
+@dataclass
+class SalesAggregates:
+    """
+    Everything the KPIs and the charts show about the filtered transactions, computed by aggregate_sales.
+
+    Attributes:
+        total_sales (float): The sum of the totals.
+        average_sale (float): The mean of the totals, NaN without any total.
+        units_sold (float): The sum of the amounts.
+        transaction_count (int): The number of filtered transactions.
+        item_name_count (int): The number of distinct item names sold.
+        category_count (int): The number of distinct categories sold, a missing category counted as one.
+        item_totals (pd.DataFrame): item_name, category and total of every item sold.
+        category_totals (pd.DataFrame): The total per category.
+        item_name_totals (pd.DataFrame): The total per item name.
+        month_gender_totals (pd.DataFrame): The total per month (the date of its first day) and gender.
+        age_gender_totals (pd.DataFrame): The total per age and gender.
+    """
+    total_sales: float
+    average_sale: float
+    units_sold: float
+    transaction_count: int
+    item_name_count: int
+    category_count: int
+    item_totals: pd.DataFrame
+    category_totals: pd.DataFrame
+    item_name_totals: pd.DataFrame
+    month_gender_totals: pd.DataFrame
+    age_gender_totals: pd.DataFrame
+
+
+def float_values(values):
+    """
+    Get a numeric column as float64 values, NaN for the missing ones.
+    """
+    return values.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def category_codes(values):
+    """
+    Get the distinct values and the value code of every row of a column (-1 for a missing value).
+
+    Args:
+        values (pd.Series): The column, categorical or not.
+
+    Returns:
+        tuple: The categorical dtype and the codes.
+    """
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype('category')
+    return values.dtype, values.cat.codes.to_numpy()
+
+
+def group_totals(codes, weights, group_count):
+    """
+    Sum the weights of the rows of every group code, missing codes (-1) skipped.
+
+    Args:
+        codes (np.ndarray): The group code of every row.
+        weights (np.ndarray): The value of every row, the missing values already replaced by 0.
+        group_count (int): The number of groups.
+
+    Returns:
+        tuple: The number of rows and the sum of every group.
+    """
+    valid = codes >= 0
+    if not valid.all():
+        codes, weights = codes[valid], weights[valid]
+    return (np.bincount(codes, minlength=group_count),
+            np.bincount(codes, weights=weights, minlength=group_count))
+
+
+def transaction_totals(model, rows):
+    """
+    Get the total (amount * price) of some transactions.
+
+    Args:
+        model (SalesModel): The sales model.
+        rows (range | np.ndarray): The positions of the transactions.
+
+    Returns:
+        np.ndarray: The float64 totals, NaN when the amount or the price is missing.
+    """
+    rows = row_indexer(rows)
+    amounts = model.transactions['amount'].to_numpy()[rows].astype('float64')
+    return amounts * float_values(model.items['price'])[model.item_keys()[rows]]
+
+
+def item_group_totals(model, item_counts, item_sums):
+    """
+    Sum the totals of the items sold per category and per item name.
+
+    Args:
+        model (SalesModel): The sales model.
+        item_counts (np.ndarray): The number of transactions of every item.
+        item_sums (np.ndarray): The total of every item.
+
+    Returns:
+        dict: The item_totals, category_totals, item_name_totals, item_name_count and category_count.
+    """
+    sold = item_counts > 0
+    item_totals = pd.DataFrame({'item_name': model.items['item_name'][sold],
+                                'category': model.items['category'][sold],
+                                'total': item_sums[sold]}).reset_index(drop=True)
+    return group_item_totals(item_totals)
+
+
+def group_item_totals(item_totals):
+    """
+    Sum the totals of the items sold per category and per item name.
+
+    Args:
+        item_totals (pd.DataFrame): The item_name, category and total of every item sold.
+
+    Returns:
+        dict: The item_totals, category_totals, item_name_totals, item_name_count and category_count.
+    """
+    return {
+        'item_totals': item_totals,
+        'category_totals': item_totals.groupby('category', observed=True)['total'].sum().reset_index(),
+        'item_name_totals': item_totals.groupby('item_name', observed=True)['total'].sum().reset_index(),
+        'item_name_count': int(item_totals['item_name'].nunique()),
+        'category_count': int(item_totals['category'].nunique() + item_totals['category'].isna().any()),
+    }
+
+
+def user_group_totals(model, user_counts, user_sums):
+    """
+    Sum the totals of the users who bought something per age and gender.
+
+    Args:
+        model (SalesModel): The sales model.
+        user_counts (np.ndarray): The number of transactions of every user.
+        user_sums (np.ndarray): The total of every user.
+
+    Returns:
+        pd.DataFrame: The age, gender and total of every group.
+    """
+    bought = user_counts > 0
+    user_totals = pd.DataFrame({'age': model.users['age'][bought],
+                                'gender': model.users['gender'][bought],
+                                'total': user_sums[bought]})
+    return user_totals.groupby(['age', 'gender'], observed=True)['total'].sum().reset_index()
+
+
+def month_gender_group_totals(months, gender_codes, weights, gender_dtype):
+    """
+    Sum the totals per month (of every year) and gender.
+
+    Args:
+        months (np.ndarray): The month bucket of every row, -1 when undated.
+        gender_codes (np.ndarray): The gender code of every row, -1 when missing.
+        weights (np.ndarray): The total of every row, the missing values already replaced by 0.
+        gender_dtype (pd.CategoricalDtype): The genders of the codes.
+
+    Returns:
+        pd.DataFrame: The month (the date of its first day), gender and total of every group.
+    """
+    gender_count = len(gender_dtype.categories)
+    months = months.astype(np.int64)
+    valid = (months >= 0) & (gender_codes >= 0)
+    first_month = int(months[valid].min()) if valid.any() else 0
+    month_count = int(months[valid].max()) - first_month + 1 if valid.any() else 0
+    codes = np.where(valid, (months - first_month) * gender_count + gender_codes, -1)
+    counts, sums = group_totals(codes, weights, month_count * gender_count)
+    groups = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'month': month_bucket_dates(groups // gender_count + first_month),
+        'gender': pd.Categorical.from_codes(groups % gender_count, dtype=gender_dtype),
+        'total': sums[groups],
+    })
+
+
+def aggregate_sales(model, rows):
+    """
+    Aggregate the filtered transactions once for the KPIs and every chart: the totals are summed per item
+    and per user, then grouped on the dimension tables.
+
+    Args:
+        model (SalesModel): The sales model.
+        rows (range | np.ndarray): The positions of the filtered transactions.
+
+    Returns:
+        SalesAggregates: The aggregates.
+    """
+    row_totals = transaction_totals(model, rows)
+    rows = row_indexer(rows)
+    item_keys = model.item_keys()[rows]
+    user_keys = model.user_keys()[rows]
+    # Like a pandas sum, the missing totals count as 0
+    weights = np.nan_to_num(row_totals, nan=0.0)
+    total_count = int(np.count_nonzero(~np.isnan(row_totals)))
+
+    # The totals of every item, then of every category and item name
+    item_counts, item_sums = group_totals(item_keys, weights, len(model.items))
+
+    # The totals of every user, then of every age and gender
+    user_counts, user_sums = group_totals(user_keys, weights, len(model.users))
+    age_gender_totals = user_group_totals(model, user_counts, user_sums)
+
+    # The totals of every month and gender, the only groups mixing the fact table and a dimension
+    gender_dtype, user_gender_codes = category_codes(model.users['gender'])
+    months = model.transactions[TIME_BUCKET_COLUMNS['month']].to_numpy()[rows]
+    month_gender_totals = month_gender_group_totals(months, user_gender_codes[user_keys], weights, gender_dtype)
+
+    amounts = model.transactions['amount'].to_numpy()[rows].astype('float64')
+    return SalesAggregates(
+        total_sales=float(weights.sum()),
+        average_sale=float(weights.sum() / total_count) if total_count else float('nan'),
+        units_sold=float(np.nansum(amounts)),
+        transaction_count=len(row_totals),
+        month_gender_totals=month_gender_totals,
+        age_gender_totals=age_gender_totals,
+        **item_group_totals(model, item_counts, item_sums),
+    )
+
+
+def aggregate_cube(model, cube, cells):
+    """
+    Aggregate the cells of the OLAP cube holding the filtered transactions, the same groups aggregate_sales
+    computes from the transactions.
+
+    Args:
+        model (SalesModel): The sales model.
+        cube (OlapCube): The cube of the model.
+        cells (np.ndarray): The boolean mask of the cells matching the filters.
+
+    Returns:
+        SalesAggregates: The aggregates.
+    """
+    totals = cube.cell_total[cells]
+    profiles = cube.cell_profile[cells]
+    total_count = int(cube.cell_priced[cells].sum())
+
+    item_counts, item_sums = group_totals(cube.cell_item[cells], totals, len(model.items))
+
+    # The totals of every profile, then of every age and gender
+    profile_counts, profile_sums = group_totals(profiles, totals, len(cube.profiles))
+    bought = profile_counts > 0
+    profile_totals = cube.profiles[bought].assign(total=profile_sums[bought])
+    age_gender_totals = profile_totals.groupby(['age', 'gender'], observed=True)['total'].sum().reset_index()
+
+    gender_dtype, profile_gender_codes = category_codes(cube.profiles['gender'])
+    month_gender_totals = month_gender_group_totals(cube.cell_month[cells], profile_gender_codes[profiles],
+                                                    totals, gender_dtype)
+
+    return SalesAggregates(
+        total_sales=float(totals.sum()),
+        average_sale=float(totals.sum() / total_count) if total_count else float('nan'),
+        units_sold=float(cube.cell_amount[cells].sum()),
+        transaction_count=int(cube.cell_transactions[cells].sum()),
+        month_gender_totals=month_gender_totals,
+        age_gender_totals=age_gender_totals,
+        **item_group_totals(model, item_counts, item_sums),
+    )
+
+
+def summarize_sales(model, state, rows):
+    """
+    Aggregate the filtered transactions, from the OLAP cube of the model when it can answer the filters,
+    otherwise by scanning the rows.
+
+    Args:
+        model (SalesModel): The sales model.
+        state (FilterState): The filters.
+        rows (range | np.ndarray): The positions of the transactions matching the filters.
+
+    Returns:
+        SalesAggregates: The aggregates.
+    """
+    cells = model.cube.cell_mask(state) if model.cube is not None else None
+    if cells is not None:
+        return aggregate_cube(model, model.cube, cells)
+    return aggregate_sales(model, rows)
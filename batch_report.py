@@ -0,0 +1,245 @@
+import argparse
+import datetime
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import pandas as pd
+import streamlit.config
+import streamlit.logger
+
+from aggregation import summarize_sales
+from dashboard import CHARTS, create_sales_model, kpi_values
+from filter_index import FilterState
+from ingestion import SalesFileError, read_file_sheets, validate_file
+from sidebar import DEFAULT_AGE_RANGE, GENDER_VALUES, NO_VALUE_PARAM, SEASON_VALUES, filter_transactions
+
+#批量报表: 不启动Streamlit界面, 用进程池并行处理多个工作簿, 为每个文件输出KPI汇总和独立的HTML图表
+
+# The KPI summary table of the files, written to the output directory, and its columns
+SUMMARY_FILE = 'kpi_summary.csv'
+SUMMARY_COLUMNS = ['file', 'status', 'transactions', 'total_sales', 'avg_sale', 'units_sold', 'seconds', 'report']
+# The multiselect filters of a filter specification
+SELECTION_FILTERS = ['full_name', 'item_name', 'category', 'printing']
+# The checkbox filters of a filter specification and the values they may check
+CHECKBOX_FILTERS = {'gender': GENDER_VALUES, 'season': SEASON_VALUES}
+# The range filters of a filter specification
+RANGE_FILTERS = ['age', 'start_date', 'end_date']
+# How the reports get plotly.js: embedded in every report (opens offline) or loaded from the plotly CDN
+PLOTLYJS_MODES = {'inline': True, 'cdn': 'cdn'}
+
+
+def parse_filter_spec(spec):
+    """
+    Parse a filter specification, written like the query parameters of a shared link of the dashboard
+    (e.g. 'category=Tops&gender=female&age=20-60&start_date=2024-01-01'). A missing filter keeps its
+    default: every value, the ages of the age slider and every date.
+
+    Args:
+        spec (str): The filter specification, empty for the default filters.
+
+    Returns:
+        FilterState: The filters.
+
+    Raises:
+        ValueError: If a filter is unknown or a value malformed.
+    """
+    params = parse_qs(spec.lstrip('?'))
+    unknown = set(params) - set(SELECTION_FILTERS) - set(CHECKBOX_FILTERS) - set(RANGE_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+    checked = {}
+    for name, values in CHECKBOX_FILTERS.items():
+        wanted = set(params.get(name, values)) - {NO_VALUE_PARAM}
+        if wanted - set(values):
+            raise ValueError(f"Unknown {name} values: {', '.join(sorted(wanted - set(values)))}")
+        checked[name] = [value for value in values if value in wanted]
+    age_range = DEFAULT_AGE_RANGE
+    if 'age' in params:
+        age_range = sorted(int(bound) for bound in params['age'][0].split('-'))
+        if len(age_range) != 2:
+            raise ValueError(f"Malformed age range: {params['age'][0]}")
+    dates = {name: datetime.date.fromisoformat(params[name][0]) for name in ('start_date', 'end_date')
+             if name in params}
+    return FilterState.from_selection(**{name: params.get(name, []) for name in SELECTION_FILTERS}, **checked,
+                                      age_range=age_range, **dates)
+
+
+def silence_streamlit():
+    """
+    Silence the warnings of the Streamlit calls made outside of a running app: the config is parsed first
+    (it sets the log level), then only the errors are logged.
+    """
+    streamlit.config.get_option('logger.level')
+    streamlit.logger.set_log_level('error')
+
+
+def report_file(path, report_path, filter_state, plotlyjs):
+    """
+    Build the report of a workbook (or of a columnar snapshot), run in the worker processes: its KPIs for
+    the filters, and the four charts of the dashboard in a standalone HTML page.
+
+    Args:
+        path (Path): The workbook.
+        report_path (Path): The HTML report to write.
+        filter_state (FilterState): The filters.
+        plotlyjs (str): The key of PLOTLYJS_MODES.
+
+    Returns:
+        dict: The row of the file in the summary table.
+    """
+    started = time.perf_counter()
+    row = {'file': str(path), 'status': 'ok'}
+    try:
+        row.update(build_report(path, report_path, filter_state, plotlyjs))
+    except Exception as e:
+        # A corrupt file (not a zip, not a workbook, unexpected cells...) is reported, the batch goes on
+        message = str(e) if isinstance(e, SalesFileError) else f'{type(e).__name__}: {e}'
+        row['status'] = f'error: {message}'
+    row['seconds'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def build_report(path, report_path, filter_state, plotlyjs):
+    """
+    Read a file, then write its report.
+
+    Args:
+        path (Path): The workbook.
+        report_path (Path): The HTML report to write.
+        filter_state (FilterState): The filters.
+        plotlyjs (str): The key of PLOTLYJS_MODES.
+
+    Returns:
+        dict: The status and the KPIs of the file.
+
+    Raises:
+        SalesFileError: If the file misses a sheet or a column, or its sheets can't be joined.
+    """
+    # The sheets are parsed one after the other, the files are already parsed at the same time
+    validate_file(str(path), str(path))
+    sheets = read_file_sheets(str(path), str(path))
+    model = create_sales_model([(path.name, sheets)])
+    if model is None:
+        raise SalesFileError('the sheets could not be joined on user_id and item_id')
+
+    rows = filter_transactions(model, filter_state)
+    if not len(rows):
+        return {'status': 'no matching transactions', 'transactions': 0}
+    aggregates = summarize_sales(model, filter_state, rows)
+    kpis = kpi_values(aggregates)
+    figures = {name: create(aggregates) for name, (create, _) in CHARTS.items()}
+    write_report(report_path, path.name, kpis, figures, PLOTLYJS_MODES[plotlyjs])
+    return {'transactions': kpis['transactions'], 'total_sales': kpis['total_sales'], 'avg_sale': kpis['avg_sale'],
+            'units_sold': kpis['units_sold'], 'report': str(report_path)}
+
+
+def write_report(report_path, title, kpis, figures, include_plotlyjs):
+    """
+    Write the KPIs and the charts of a file to a standalone HTML page, plotly.js included once.
+
+    Args:
+        report_path (Path): The HTML page.
+        title (str): The title of the page, the name of the file.
+        kpis (dict): The KPIs of kpi_values.
+        figures (dict): The chart of every name of CHARTS.
+        include_plotlyjs (bool | str): The include_plotlyjs option of the first chart.
+
+    Returns:
+        None
+    """
+    kpi_rows = [('Total Sales', f"{kpis['total_sales']:,.2f}"), ('Avg Sale', f"{kpis['avg_sale']:,.2f}"),
+                ('Total Transactions', f"{kpis['transactions']:,}"), ('Total Units Sold', f"{kpis['units_sold']:,}")]
+    charts = [figure.to_html(full_html=False, include_plotlyjs=include_plotlyjs if index == 0 else False)
+              for index, figure in enumerate(figures.values())]
+    report_path.write_text('\n'.join([
+        '<!DOCTYPE html>',
+        f'<html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head><body>',
+        f'<h1>{html.escape(title)}</h1>',
+        '<table>' + ''.join(f'<tr><th>{name}</th><td>{value}</td></tr>' for name, value in kpi_rows) + '</table>',
+        *charts,
+        '</body></html>',
+    ]), encoding='utf-8')
+
+
+def report_paths(paths, output_dir):
+    """
+    Name the report of every file after the file, the files of a same name numbered.
+
+    Args:
+        paths (list): The workbooks.
+        output_dir (Path): The directory of the reports.
+
+    Returns:
+        list: The HTML report of every file.
+    """
+    names = {}
+    reports = []
+    for path in paths:
+        stem = path.name.split('.')[0]
+        names[stem] = names.get(stem, 0) + 1
+        reports.append(output_dir / (f'{stem}.html' if names[stem] == 1 else f'{stem}_{names[stem]}.html'))
+    return reports
+
+
+def run_batch(paths, output_dir, filter_state, workers=1, plotlyjs='inline'):
+    """
+    Report on several workbooks at the same time, one worker process per file, and write the KPI summary
+    table of the files.
+
+    Args:
+        paths (list): The workbooks (or columnar snapshots).
+        output_dir (Path): The directory of the reports and of the summary.
+        filter_state (FilterState): The filters applied to every file.
+        workers (int): The number of worker processes, 1 reports in this process.
+        plotlyjs (str): The key of PLOTLYJS_MODES.
+
+    Returns:
+        pd.DataFrame: The summary, one row per file in the order of the files.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [(path, report_path, filter_state, plotlyjs)
+             for path, report_path in zip(paths, report_paths(paths, output_dir))]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=silence_streamlit) as pool:
+            rows = list(pool.map(report_file, *zip(*tasks)))
+    else:
+        rows = [report_file(*task) for task in tasks]
+    # The counts of the files in error are missing, not NaN floats
+    summary = pd.DataFrame(rows).reindex(columns=SUMMARY_COLUMNS)
+    summary = summary.astype({'transactions': 'Int64', 'total_sales': 'Int64', 'units_sold': 'Int64'})
+    summary.to_csv(output_dir / SUMMARY_FILE, index=False)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the KPIs and the charts of many sales workbooks, '
+                                                 'without the dashboard.')
+    parser.add_argument('files', nargs='+', type=Path, help='the workbooks or columnar snapshots to report on')
+    parser.add_argument('--output', type=Path, default=Path('reports'), help='the directory of the reports')
+    parser.add_argument('--filters', default='',
+                        help="the filters, written like the query of a shared link of the dashboard, "
+                             "e.g. 'category=Tops&gender=female&age=20-60&start_date=2024-01-01'")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='the number of worker processes')
+    parser.add_argument('--plotlyjs', choices=list(PLOTLYJS_MODES), default='inline',
+                        help='embed plotly.js in every report (opens offline) or load it from the CDN')
+    args = parser.parse_args()
+    try:
+        filter_state = parse_filter_spec(args.filters)
+    except ValueError as e:
+        parser.error(str(e))
+    silence_streamlit()
+
+    started = time.perf_counter()
+    summary = run_batch(args.files, args.output, filter_state, max(1, args.workers), args.plotlyjs)
+    print(summary.drop(columns='report').to_string(index=False))
+    print(f'{len(summary)} files reported in {time.perf_counter() - started:.1f} s, '
+          f'summary written to: {(args.output / SUMMARY_FILE).absolute()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import streamlit.config
+import streamlit.logger
+
+from dashboard import create_charts, merge_sheets_in_excel_file, top_row_kpi
+from aggregation import summarize_sales
+from filter_index import FilterState
+from generate_fake_data import generate_dataset
+from ingestion import read_sheets
+from sales_model import build_sales_model, convert_birth_date_to_age_column
+from sidebar import filter_transactions, sidebar_config
+
+#端到端基准测试: 在不同规模的模拟数据上, 脱离Streamlit逐个阶段测量耗时和峰值内存, 结果写入JSON并与基线比较
+
+# The directory of the benchmark files
+BENCHMARK_DIR = Path(__file__).resolve().parent
+# The stored baseline the results are compared to
+BASELINE_FILE = BENCHMARK_DIR / 'baseline.json'
+# The number of clients selected by the many_clients state
+MANY_CLIENTS = 500
+# The Zipf exponents of the popularity of the synthetic users and items, a few hot keys like real sales
+USER_SKEW, ITEM_SKEW = 0.8, 1.1
+# Stages faster than this in the baseline and the results are not compared, their timing is mostly noise
+MIN_COMPARED_SECONDS = 0.005
+# Peak memory differences below this many MB are not compared
+MIN_COMPARED_MB = 1.0
+# The fields of the environment that must match the baseline's for the timings to compare
+COMPARED_ENVIRONMENT = ['platform', 'cpu_count']
+
+
+def make_dataset(directory, transactions_count, seed, workers):
+    """
+    Generate a synthetic dataset (one user per 20 transactions, one item per 200) as a parquet snapshot.
+
+    Args:
+        directory (str): The directory of the snapshot.
+        transactions_count (int): The number of transactions.
+        seed (int): The random seed.
+        workers (int): The generator processes.
+
+    Returns:
+        Path: The snapshot directory.
+    """
+    return generate_dataset(Path(directory) / f'sales_{transactions_count}', user_count=max(10, transactions_count // 20),
+                            item_count=max(50, transactions_count // 200), transaction_count=transactions_count,
+                            seed=seed, file_format='parquet', workers=workers, user_skew=USER_SKEW,
+                            item_skew=ITEM_SKEW)
+
+
+def filter_states(model):
+    """
+    Build the typical filter states of a model: no filter, a narrow date range, a whole month, a single
+    category, many clients and an age and gender selection.
+
+    Args:
+        model (SalesModel): The sales model.
+
+    Returns:
+        dict: The state of every name.
+    """
+    first_date, last_date = model.filter_index.order_date.bounds
+    middle = (first_date + (last_date - first_date) / 2).date()
+    month_start = middle.replace(day=1)
+    month_end = (pd.Timestamp(month_start) + pd.offsets.MonthEnd(1)).date()
+    clients = model.option_index['full_name']
+    categories = model.option_index['category']
+    return {
+        'all': FilterState(),
+        'narrow_dates': FilterState(start_date=middle, end_date=middle + datetime.timedelta(days=6)),
+        'whole_month': FilterState(start_date=month_start, end_date=month_end),
+        'single_category': FilterState(category=(categories.values[categories.by_count[0]],)),
+        'many_clients': FilterState.from_selection(
+            full_name=clients.values[clients.by_count[:MANY_CLIENTS]].tolist()),
+        'age_gender': FilterState(gender=('female',), age_range=(25, 40)),
+    }
+
+
+def filter_rows(model, state):
+    """
+    Filter the transactions of a state from the whole index, the recent results the index remembers are
+    forgotten first so every repeat measures the same work.
+    """
+    model.filter_index.recent_results.clear()
+    return filter_transactions(model, state)
+
+
+def measure(function, repeat):
+    """
+    Measure a stage: the best wall time of several calls, then the peak of the memory it allocates
+    (traced in a separate call, tracing slows the calls down). Only the Python and NumPy allocations are
+    traced, not the Arrow buffers of the memory-mapped snapshots. The result of a call is dropped before the
+    next one, only the result of the traced call is kept.
+
+    Args:
+        function: The stage, called without arguments.
+        repeat (int): The number of timed calls.
+
+    Returns:
+        tuple: The measure ({'seconds', 'peak_mb'}) and the result of the last call.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(best, 6), 'peak_mb': round(peak / 2 ** 20, 3)}, result
+
+
+def run_size(snapshot, repeat):
+    """
+    Run every stage of the dashboard on a dataset.
+
+    Args:
+        snapshot (Path): The snapshot directory of the dataset.
+        repeat (int): The number of timed calls of every stage.
+
+    Returns:
+        dict: The measure of every stage, the filter state stages named stage:state.
+    """
+    results = {}
+    results['read_sheets'], sheets = measure(lambda: read_sheets(snapshot, str(snapshot)), repeat)
+    users = sheets['users']
+    results['convert_birth_date_to_age_column'], _ = measure(
+        lambda: convert_birth_date_to_age_column(users.copy()), repeat)
+    results['build_sales_model'], model = measure(lambda: build_sales_model(sheets, snapshot.name), repeat)
+    results['merge_sheets_in_excel_file'], merged = measure(lambda: merge_sheets_in_excel_file(sheets), repeat)
+    # The wide frame of the merge is as large as the model and the sheets together at 10M rows
+    del merged
+    results['sidebar_config'], _ = measure(lambda: sidebar_config(model), repeat)
+
+    for name, state in filter_states(model).items():
+        results[f'filter:{name}'], rows = measure(lambda: filter_rows(model, state), repeat)
+        if not len(rows):
+            continue
+        results[f'aggregate:{name}'], aggregates = measure(lambda: summarize_sales(model, state, rows), repeat)
+        results[f'top_row_kpi:{name}'], _ = measure(lambda: top_row_kpi(aggregates), repeat)
+        results[f'create_charts:{name}'], _ = measure(lambda: create_charts(aggregates), repeat)
+    return results
+
+
+def compare(results, baseline, max_slowdown, max_memory_growth):
+    """
+    Compare results to a baseline, stage by stage for the sizes both measured.
+
+    Args:
+        results (dict): The measures of every size and stage.
+        baseline (dict): The baseline measures.
+        max_slowdown (float): A stage slower than the baseline by more than this factor regressed.
+        max_memory_growth (float): A stage whose peak memory grew by more than this factor regressed.
+
+    Returns:
+        list: The description of every regression.
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, measures in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            seconds, base_seconds = measures['seconds'], base['seconds']
+            if max(seconds, base_seconds) >= MIN_COMPARED_SECONDS and seconds > base_seconds * max_slowdown:
+                regressions.append(f'{int(size):>12,} {stage}: {seconds:.4f} s vs {base_seconds:.4f} s baseline '
+                                   f'({seconds / max(base_seconds, 1e-9):.1f}x)')
+            peak, base_peak = measures['peak_mb'], base['peak_mb']
+            if peak - base_peak >= MIN_COMPARED_MB and peak > base_peak * max_memory_growth:
+                regressions.append(f'{int(size):>12,} {stage}: {peak:.1f} MB peak vs {base_peak:.1f} MB baseline')
+    return regressions
+
+
+def environment_changes(current, baseline):
+    """
+    List the fields of COMPARED_ENVIRONMENT that differ between the environment of a run and the baseline's.
+    """
+    return [f'{field}: {current.get(field)} vs {baseline.get(field)} in the baseline'
+            for field in COMPARED_ENVIRONMENT if current.get(field) != baseline.get(field)]
+
+
+def environment():
+    """
+    Describe the machine and the library versions of a run, the timings only compare on the same setup.
+    """
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the wall time and peak memory of every dashboard stage.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000],
+                        help='the numbers of transactions to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='the timed calls per stage (the best is kept)')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed of the datasets')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='the dataset generator processes')
+    parser.add_argument('--output', default=str(BENCHMARK_DIR / 'results.json'), help='the results file to write')
+    parser.add_argument('--baseline', default=str(BASELINE_FILE), help='the baseline to compare the results to')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--max-slowdown', type=float, default=1.5,
+                        help='the largest accepted wall time ratio to the baseline')
+    parser.add_argument('--max-memory-growth', type=float, default=1.25,
+                        help='the largest accepted peak memory ratio to the baseline')
+    parser.add_argument('--ignore-environment', action='store_true',
+                        help='compare to a baseline recorded on another platform or number of CPUs')
+    args = parser.parse_args()
+    # The stages call Streamlit outside of a running app, which warns on every call: the config is parsed
+    # first (it sets the log level), then only the errors are logged
+    streamlit.config.get_option('logger.level')
+    streamlit.logger.set_log_level('error')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            snapshot = make_dataset(directory, size, args.seed, max(1, args.workers))
+            results[str(size)] = run_size(snapshot, max(1, args.repeat))
+            for stage, measures in results[str(size)].items():
+                print(f'{size:>12,} {stage:<36} {measures["seconds"]:>10.4f} s {measures["peak_mb"]:>10.1f} MB')
+
+    report = {'environment': environment(), 'results': results}
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f'Results written to: {Path(args.output).absolute()}')
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2))
+        print(f'Baseline written to: {Path(args.baseline).absolute()}')
+        return
+
+    if not Path(args.baseline).exists():
+        print('No baseline to compare to, write one with --save-baseline')
+        return
+    baseline = json.loads(Path(args.baseline).read_text())
+    changes = environment_changes(report['environment'], baseline['environment'])
+    if changes and not args.ignore_environment:
+        print('The baseline was recorded on another machine, its timings do not compare:')
+        print('\n'.join(changes))
+        print('Record a baseline on this machine with --save-baseline, or compare anyway with --ignore-environment')
+        sys.exit(2)
+    if changes:
+        print('Comparing to a baseline of another machine: ' + '; '.join(changes))
+    regressions = compare(results, baseline['results'], args.max_slowdown, args.max_memory_growth)
+    if regressions:
+        print('Regressions against the baseline:')
+        print('\n'.join(regressions))
+        sys.exit(1)
+    print('No regression against the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import estimate_nbytes
+from join_engine import join_star_schema
+
+#连接基准测试: 字符串键 pd.merge 与整数键按位置连接对比
+
+
+def make_sheets(transactions_count, seed=0):
+    """
+    Build synthetic users, transactions and items sheets with integer ids.
+
+    Args:
+        transactions_count (int): The number of transactions.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+    """
+    rng = np.random.default_rng(seed)
+    users_count = max(10, transactions_count // 20)
+    items_count = max(10, transactions_count // 200)
+    users = pd.DataFrame({
+        'user_id': np.arange(1, users_count + 1),
+        'full_name': [f'Client {i}' for i in range(users_count)],
+        'gender': rng.choice(['male', 'female'], users_count),
+    })
+    items = pd.DataFrame({
+        'item_id': np.arange(1, items_count + 1),
+        'item_name': [f'Item {i}' for i in range(items_count)],
+        'item_tags': rng.choice(['male, summer', 'female, winter'], items_count),
+        'category': rng.choice(['Tops', 'Bottoms', 'Dresses'], items_count),
+        'price': rng.uniform(5, 200, items_count).round(2),
+    })
+    transactions = pd.DataFrame({
+        'user_id': rng.integers(1, users_count + 1, transactions_count),
+        'item_id': rng.integers(1, items_count + 1, transactions_count),
+        'amount': rng.integers(1, 6, transactions_count),
+    })
+    return {'users': users, 'transactions': transactions, 'items': items}
+
+
+def string_merge(sheets):
+    """
+    The previous join: cast the ids to str, then merge the full sheets to the wide frame.
+
+    Args:
+        sheets (dict): The sheet name to data frame mapping.
+
+    Returns:
+        pd.DataFrame: The merged frame.
+    """
+    users = sheets['users'].assign(user_id=sheets['users']['user_id'].astype(str))
+    transactions = sheets['transactions'].assign(user_id=sheets['transactions']['user_id'].astype(str),
+                                                 item_id=sheets['transactions']['item_id'].astype(str))
+    items = sheets['items'].assign(item_id=sheets['items']['item_id'].astype(str))
+    merged_df = pd.merge(users, transactions, on='user_id', how='inner')
+    return pd.merge(merged_df, items, on='item_id', how='inner')
+
+
+def integer_join(sheets):
+    """
+    The integer-keyed join: the transactions fact table with the row positions of the dimensions.
+
+    Args:
+        sheets (dict): The sheet name to data frame mapping.
+
+    Returns:
+        pd.DataFrame: The fact table.
+    """
+    fact, _ = join_star_schema(sheets['transactions'], sheets['users'], sheets['items'], 'user_key', 'item_key')
+    return fact
+
+
+def time_call(function, sheets, repeat):
+    """
+    Time the best of several calls.
+
+    Args:
+        function: The join to time.
+        sheets (dict): The sheets to join.
+        repeat (int): The number of calls.
+
+    Returns:
+        tuple: The best time in seconds and the result of the last call.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(sheets)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the string-cast merge with the integer-keyed join.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='the numbers of transactions to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='the calls per measure (the best is kept)')
+    args = parser.parse_args()
+
+    print(f'{"transactions":>12} {"str merge s":>12} {"int join s":>11} {"speedup":>8} {"merged MB":>10} {"fact MB":>8}')
+    for size in args.sizes:
+        sheets = make_sheets(size)
+        merge_time, merged_df = time_call(string_merge, sheets, args.repeat)
+        join_time, fact = time_call(integer_join, sheets, args.repeat)
+        if len(merged_df) != len(fact):
+            raise AssertionError(f'row count mismatch: {len(merged_df)} merged vs {len(fact)} joined')
+        print(f'{size:>12,} {merge_time:>12.3f} {join_time:>11.3f} {merge_time / join_time:>7.1f}x '
+              f'{estimate_nbytes(merged_df) / 2 ** 20:>10.1f} {estimate_nbytes(fact) / 2 ** 20:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
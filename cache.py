@@ -0,0 +1,172 @@
+import dataclasses
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+#按内容哈希缓存 (LRU + 字节预算)
+
+
+def content_hash(file_bytes):
+    """
+    Hash the raw bytes of an uploaded file, used as the cache key of the file.
+
+    Args:
+        file_bytes (bytes): The content of the file.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    return hashlib.blake2b(file_bytes, digest_size=20).hexdigest()
+
+
+def value_fingerprint(*values):
+    """
+    Hash some values by content: data frames by their column names and row hashes, the other values
+    by their repr. Equal frames built at different times get the same fingerprint.
+
+    Args:
+        *values: The values to hash.
+
+    Returns:
+        str: The hex digest of the values.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for value in values:
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr(list(value.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def estimate_nbytes(value):
+    """
+    Estimate the memory held by a cached value (data frames, plotly figures, and dicts, sequences or
+    dataclasses of them).
+
+    Args:
+        value: The value to measure.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if hasattr(value, 'to_plotly_json'):
+        return estimate_nbytes(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(item) for item in value.values())
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return sum(estimate_nbytes(getattr(value, field.name)) for field in dataclasses.fields(value))
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class ByteBudgetLRUCache:
+    """
+    A thread safe LRU cache bounded by the estimated bytes of its values instead of the number of entries.
+    Counts hits, misses and evictions.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes (int): The byte budget. Least recently used entries are evicted above it.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get a cached value and mark it as recently used.
+
+        Args:
+            key: The cache key.
+            default: The value returned on a miss.
+
+        Returns:
+            The cached value or the default.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value, nbytes=None):
+        """
+        Store a value, evicting the least recently used entries until the budget is respected.
+        A value larger than the whole budget is not stored.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            nbytes (int): The size of the value, estimated when not given.
+
+        Returns:
+            bool: True if the value was stored.
+        """
+        nbytes = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return False
+            while self._entries and self.current_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            return True
+
+    def clear(self):
+        """
+        Drop every entry, the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """
+        Get the counters of the cache.
+
+        Returns:
+            dict: The entries, bytes, budget, hits, misses, evictions and hit rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
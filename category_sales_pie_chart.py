@@ -9,53 +9,55 @@ CHART_WIDTH = 500
 
 #类别销售饼图
 
-def create_pie_chart(data_frame):
+def create_pie_chart(aggregates):
     """
     Create a pie chart to visualize the total sales by category.
 
     Args:
-        data_frame (pd.DataFrame): The DataFrame containing the data.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
     Returns:
         plotly.graph_objects.Figure: The pie chart.
     """
-    is_one_category_selected = len(data_frame['category'].unique()) == 1
+    is_one_category_selected = aggregates.category_count == 1
 
-    # Get unique categories from the DataFrame
-    categories = data_frame['category'].unique()
+    # Get unique categories from the item totals
+    categories = aggregates.item_totals['category'].unique()
 
     # Create a select option for the category
     selected_category = categories[0] if is_one_category_selected else 'All Categories'
 
     # Get the filtered pie graph by the selected category
-    fig = filter_data_from_selected_category(selected_category, data_frame)
+    fig = filter_data_from_selected_category(selected_category, aggregates)
 
     # Return the chart
     return fig
 
 
-def filter_data_from_selected_category(selected_category, data_frame):
+def filter_data_from_selected_category(selected_category, aggregates):
     """
     Filter the data based on the selected category and create a pie chart.
 
     Args:
         selected_category (str): The selected category or 'All Categories' if none selected.
-        data_frame (pd.DataFrame): The DataFrame containing the data.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
     Returns:
         plotly.graph_objects.Figure: The pie chart.
     """
     if selected_category == 'All Categories':
-        # Group by category and calculate the sum of the total
-        category_totals = data_frame.groupby('category')['total'].sum().reset_index()
+        # The sum of the total per category
+        category_totals = aggregates.category_totals
 
         # Create a pie chart with Plotly Express
         return px.pie(category_totals, title='Distribution of sales per category', values='total', names='category',
                       hole=INNER_HOLE_SIZE, width=CHART_WIDTH)
 
     else:
-        # Filter the DataFrame based on the selected category
-        filtered_df = data_frame[data_frame['category'] == selected_category]
+        # Filter the item totals based on the selected category and sum them per item name
+        item_totals = aggregates.item_totals
+        filtered_df = item_totals[item_totals['category'] == selected_category]
+        filtered_df = filtered_df.groupby('item_name', observed=True)['total'].sum().reset_index()
         # Create a pie chart with Plotly Express
         return px.pie(filtered_df, title=f'Distribution of sales per item in {selected_category}', values='total',
                       names='item_name', hole=INNER_HOLE_SIZE, width=CHART_WIDTH)
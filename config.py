@@ -0,0 +1,43 @@
+import os
+
+
+def _env_int(name, default):
+    """
+    Read an integer setting from the environment.
+
+    Args:
+        name (str): The environment variable name.
+        default (int): The value to use when the variable is missing or invalid.
+
+    Returns:
+        int: The configured value.
+    """
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Byte budget of the ingestion cache (parsed sheets + merged frame of every cached upload)
+INGESTION_CACHE_BUDGET_BYTES: int = _env_int('SALES_INGESTION_CACHE_MB', 1024) * 1024 * 1024
+# Byte budget of the result cache (filtered rows and KPIs of the recent filter combinations, charts of the recent inputs)
+RESULT_CACHE_BUDGET_BYTES: int = _env_int('SALES_RESULT_CACHE_MB', 256) * 1024 * 1024
+# Workbooks smaller than this are parsed sheet after sheet, the process pool start-up would cost more
+PARALLEL_PARSE_MIN_BYTES: int = _env_int('SALES_PARALLEL_PARSE_MIN_MB', 4) * 1024 * 1024
+# The number of processes parsing the sheets of a workbook at the same time (one per required sheet at most)
+PARSE_WORKERS: int = max(1, min(3, _env_int('SALES_PARSE_WORKERS', os.cpu_count() or 1)))
+# The OLAP cube is kept only when it has at most this percentage of cells per transaction, 0 disables it
+OLAP_CUBE_MAX_CELL_PERCENT: int = _env_int('SALES_OLAP_CUBE_MAX_CELL_PERCENT', 25)
+# The number of matches offered by the client and item name searches of the sidebar
+OPTION_SEARCH_LIMIT: int = max(1, _env_int('SALES_OPTION_SEARCH_LIMIT', 50))
+# The number of rows per page of the transactions table (the other choices are offered in the page)
+TABLE_PAGE_SIZE: int = max(1, _env_int('SALES_TABLE_PAGE_SIZE', 100))
+# Debug mode shows the timed stages of every rerun in a sidebar panel, with a JSON trace and an opt-in profile
+DEBUG_MODE: bool = _env_int('SALES_DEBUG', 0) > 0
+# The sheets are loaded chunk by chunk into an embedded SQLite database instead of the in-memory model, the
+# filters, the aggregations and the table pages running as SQL queries on it
+SQL_BACKEND: bool = _env_int('SALES_SQL_BACKEND', 0) > 0
+# Byte budget of the page cache of every SQL backend connection
+SQL_CACHE_BUDGET_BYTES: int = _env_int('SALES_SQL_CACHE_MB', 64) * 1024 * 1024
+# The estimated memory the loads of every session may hold at once, above it the sheets and the fact table go to disk
+MEMORY_BUDGET_BYTES: int = max(0, _env_int('SALES_MEMORY_BUDGET_MB', 2048)) * 1024 * 1024
@@ -1,12 +1,67 @@
+import os
+import tempfile
+import time
 import streamlit as st
-import pandas as pd
-import datetime
-from sidebar import sidebar_config
+from dataclasses import dataclass
+from pathlib import Path
+from aggregation import SalesAggregates, aggregate_sales, summarize_sales, transaction_totals
+from cache import ByteBudgetLRUCache, content_hash, value_fingerprint
+from config import (DEBUG_MODE, INGESTION_CACHE_BUDGET_BYTES, MEMORY_BUDGET_BYTES, RESULT_CACHE_BUDGET_BYTES, SQL_BACKEND,
+                    TABLE_PAGE_SIZE)
+from filter_index import FilterState
+from ingestion import SalesFileError, read_delta, read_sheet_sizes, read_workbooks
+from memory_budget import (MemoryBudget, MemoryLedger, SpilledSheets, estimate_build_bytes, estimate_sheet_bytes,
+                           resident_bytes, resident_frame_bytes, spill_frame, spill_workbooks)
+from profiling import Trace, span, start_profiler, top_functions
+from sales_model import append_delta, build_partitioned_sales_model
+from schema import normalize_column_name, required_columns
+from sidebar import filter_transactions, sidebar_config
+from snapshot import convert_workbook_to_snapshot
+from sql_backend import SqlSalesStore
 from category_sales_pie_chart import create_pie_chart
 from scatter_graph import create_scatter_plot2
 from grouped_bar_chart import create_grouped_bar_chart
+from table_view import TOTAL_COLUMN, page_count, page_rows, search_rows, sort_rows
 from top_selling_items import create_horizontal_bar_chart
 
+# The sample file loaded by the "Load Sample Data" button
+DEFAULT_FILES = ["Excel_file_to_upload/sales_analytics_2024.xlsx"]
+# The sample files loaded together by the "Load Sample Years" button, one workbook per year
+SAMPLE_YEAR_FILES = ["Excel_file_to_upload/sales_analytics_2022.xlsx", "Excel_file_to_upload/sales_analytics_2024.xlsx"]
+# The suffix of the columnar snapshot of a sample workbook, loaded instead of the workbook
+SNAPSHOT_SUFFIX = ".snapshot.zip"
+# The directory of the snapshots of the sample workbooks, one subdirectory per workbook content hash
+SNAPSHOT_CACHE_DIR = Path(tempfile.gettempdir()) / 'sales_sample_snapshots'
+# The file types accepted by the uploader (Excel workbooks and columnar snapshot bundles)
+UPLOAD_TYPES = ["xlsx", "zip"]
+# Session key remembering the sample files requested (a button is only True for a single rerun)
+USE_SAMPLE_DATA_KEY = 'use_sample_data'
+# Widget key of the uploader of the delta files appended to the loaded data
+DELTA_UPLOAD_KEY = 'delta_files'
+# The display format of the order dates in the table (the column itself stays a datetime)
+ORDER_DATE_FORMAT = 'MM/DD/YYYY'
+# The builder of every chart and the aggregates it reads, a chart is only rebuilt when these change
+CHARTS = {
+    'pie': (create_pie_chart, ['category_count', 'item_totals', 'category_totals']),
+    'top_items': (create_horizontal_bar_chart, ['item_name_totals']),
+    'grouped_bar': (create_grouped_bar_chart, ['month_gender_totals']),
+    'scatter': (create_scatter_plot2, ['age_gender_totals']),
+}
+# The two rows of charts under the table
+CHART_ROWS = [['pie', 'top_items'], ['grouped_bar', 'scatter']]
+# The choices of rows per page of the table
+PAGE_SIZES = sorted({25, 50, 100, 250, 1000, TABLE_PAGE_SIZE})
+# The sort choice keeping the transactions by order date
+NO_SORT = '(order date)'
+# Session key of the rows the table pages through, a new row set starts on its first page
+TABLE_ROWS_KEY = 'table_rows_shown'
+# Session key of the trace of the stages of the current rerun, in debug mode
+TRACE_KEY = 'debug_trace'
+# Widget key of the debug panel checkbox profiling the next rerun
+PROFILE_NEXT_KEY = 'debug_profile_next'
+# Session key of the most expensive functions of the last profiled rerun
+PROFILE_RESULT_KEY = 'debug_profile'
+
 def init_dashboard(projection):
     """
     The start-up function wait for the user to upload the Excel file then start the dashboard
@@ -15,6 +70,9 @@ def init_dashboard(projection):
     Return:
          None
     """
+    # Time the stages of this rerun, in debug mode only
+    if DEBUG_MODE:
+        st.session_state[TRACE_KEY] = Trace()
     # Create the Tab configuration for the page
     st.set_page_config(page_title='Upload & Go Sales Analytics', page_icon=':bar_chart:', layout='wide')
     # Create the main header of the page
@@ -24,52 +82,65 @@ def init_dashboard(projection):
     holder = st.empty()
     
     # The upload file container with instructions
-    st.info("Please upload an Excel file containing sheets: 'users', 'transactions', and 'items'")
+    st.info("Please upload one or several Excel files (e.g. one per year, or their columnar snapshots) containing sheets: 'users', 'transactions', and 'items'")
     
     # File upload section
-    uploaded_file = st.file_uploader("Choose upload the sales analytics excel file", type="xlsx", accept_multiple_files=False)
+    uploaded_files = st.file_uploader("Choose upload the sales analytics excel files", type=UPLOAD_TYPES, accept_multiple_files=True)
     
     # Add a divider and default data option
     #st.markdown("---")
     use_default = st.button("📊 Load Sample Data", 
                            help="Load sample data from sales_analytics_2024.xlsx",
                            use_container_width=True)
+    use_years = st.button("📊 Load Sample Years",
+                          help="Load sales_analytics_2022.xlsx and sales_analytics_2024.xlsx as one dataset",
+                          use_container_width=True)
     
-    # Process the file (either uploaded or default)
-    if uploaded_file is not None or use_default:
+    if use_default or use_years:
+        st.session_state[USE_SAMPLE_DATA_KEY] = SAMPLE_YEAR_FILES if use_years else DEFAULT_FILES
+    sample_files = [] if uploaded_files else st.session_state.get(USE_SAMPLE_DATA_KEY, [])
+    use_sample = bool(sample_files)
+
+    # Process the files (either uploaded or default)
+    if uploaded_files or use_sample:
+        trace = current_trace()
+        profiler = profile_requested()
         try:
-            # Read the file (sheet_name=None -> read all the sheets in the file)
-            if use_default and uploaded_file is None:
-                default_file = "Excel_file_to_upload/sales_analytics_2024.xlsx"
+            # Parse and join the sheets, or reuse them if this content was already ingested
+            if not uploaded_files:
                 try:
-                    df = pd.read_excel(default_file, sheet_name=None)
+                    with span(trace, 'load_sales_model'):
+                        model = load_sales_model([sample_file(path) for path in sample_files], projection)
                     st.success("Successfully loaded default data file!")
                 except Exception as e:
                     st.error(f"Error loading default file: {str(e)}")
                     return
             else:
-                df = pd.read_excel(uploaded_file, sheet_name=None)
-            
-            # Verify required sheets exist
-            required_sheets = ['users', 'transactions', 'items']
-            if not all(sheet in df.keys() for sheet in required_sheets):
-                st.error("Error: The Excel file must contain sheets named: 'users', 'transactions', and 'items'")
-                return
-                
-            # Merge all the sheets to a data frame
-            merged_df = merge_sheets_in_excel_file(df)
-            if merged_df is not None:
-                # Start the dashboard configuration with the data frame
-                dashboard_config(merged_df, projection)
+                files = []
+                for uploaded_file in uploaded_files:
+                    file_bytes = uploaded_file.getvalue()
+                    files.append((file_bytes, uploaded_file.name, content_hash(file_bytes)))
+                with span(trace, 'load_sales_model'):
+                    model = load_sales_model(files, projection)
+            if model is not None:
+                # Append the delta files uploaded since the load, then start the dashboard configuration
+                with span(trace, 'append_deltas') as record:
+                    model = append_deltas(model, projection)
+                    record.measure(rows=len(model))
+                with span(trace, 'dashboard_config'):
+                    dashboard_config(model, projection)
             
         except Exception as e:
             st.error(f"Error processing the file: {str(e)}")
             return
+        finally:
+            debug_panel(profiler)
     else:
         # Show example data format when no file is uploaded
         st.markdown("""
         ### Expected Excel File Format:
-        Your Excel file should contain three sheets:
+        Your Excel file should contain three sheets (a columnar snapshot made with `python snapshot.py`
+        holds the same sheets and loads much faster):
         1. **users**: Contains user information with columns:
         - user_id
         - full_name
@@ -90,172 +161,779 @@ def init_dashboard(projection):
         - price
         """)
 
-def merge_sheets_in_excel_file(df):
+
+@dataclass
+class DashboardResult:
     """
-    Merge the sheets and perform a join on the user_id and item_id to the desired data frame
+    What the dashboard shows for a filter state, kept in the result cache.
+
+    Attributes:
+        rows (range | np.ndarray | SqlRows): The positions of the filtered transactions.
+        aggregates (SalesAggregates): The KPIs and chart totals, None when no transaction matches.
+    """
+    rows: object
+    aggregates: SalesAggregates = None
+
+
+@st.cache_resource
+def get_ingestion_cache():
+    """
+    Get the ingestion cache shared by every rerun and session of the server process.
+
+    Returns:
+        ByteBudgetLRUCache: The cache of the parsed sheets and merged frames keyed by the file content hash.
+    """
+    return ByteBudgetLRUCache(INGESTION_CACHE_BUDGET_BYTES)
+
+
+@st.cache_resource
+def get_memory_ledger():
+    """
+    Get the ledger of the loads running in the server process, sharing the memory budget between sessions.
+
+    Returns:
+        MemoryLedger: The ledger.
+    """
+    return MemoryLedger()
+
+
+@st.cache_resource
+def get_result_cache():
+    """
+    Get the result cache shared by every rerun and session of the server process.
+
+    Returns:
+        ByteBudgetLRUCache: The DashboardResult of the recent filter states, keyed by dataset and state, and
+            the figures of the recent chart inputs.
+    """
+    return ByteBudgetLRUCache(RESULT_CACHE_BUDGET_BYTES)
+
+
+def sample_file(path):
+    """
+    Get the file to load for a sample workbook, its columnar snapshot. The snapshot is built once in
+    SNAPSHOT_CACHE_DIR under the content hash of the workbook, and the workbook is loaded when it can't be built.
     Args:
-     df: an unfiltered data frame
+     path: the path of the sample workbook
     Return:
-         merged_df: a merged data frame
+         file: the source, the file name and the ingestion cache key of the file
+    """
+    workbook = Path(path)
+    digest = content_hash(workbook.read_bytes())
+    snapshot = SNAPSHOT_CACHE_DIR / digest / (workbook.stem + SNAPSHOT_SUFFIX)
+    if not snapshot.exists() and not build_snapshot(workbook, snapshot):
+        return path, workbook.name, digest
+    return str(snapshot), snapshot.name, digest
+
+
+def build_snapshot(workbook, snapshot):
+    """
+    Convert a workbook to its snapshot, written to a temporary file first so a concurrent session never
+    reads it half written.
+    Args:
+     workbook: the path of the workbook
+     snapshot: the path of the snapshot
+    Return:
+         bool: True if the snapshot was built
     """
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    handle, built = tempfile.mkstemp(prefix=snapshot.name, dir=snapshot.parent)
+    os.close(handle)
     try:
-        sheet_dict = {sheet_name: data_frame for sheet_name, data_frame in df.items()} #字典生成/推导式Dict Comprehension
-        
-        # Clean up column names (remove any whitespace and convert to lowercase)
-        for sheet_name in sheet_dict:
-            # Convert column names to strings and then apply transformations 列名处理方式，确保能处理各种格式的Excel文件
-            sheet_dict[sheet_name].columns = [str(col).strip().lower() for col in sheet_dict[sheet_name].columns] #列表推导式List Comprehension
-        
-        # Ensure data types are correct before merging  (合并前的数据类型转换和验证)
-        # Users sheet
-        if 'birth_date' in sheet_dict['users'].columns:
-            sheet_dict['users']['birth_date'] = pd.to_datetime(sheet_dict['users']['birth_date'])
-        sheet_dict['users']['user_id'] = sheet_dict['users']['user_id'].astype(str)
-        
-        # Transactions sheet
-        sheet_dict['transactions']['user_id'] = sheet_dict['transactions']['user_id'].astype(str)
-        sheet_dict['transactions']['item_id'] = sheet_dict['transactions']['item_id'].astype(str)
-        if 'order_date' in sheet_dict['transactions'].columns:
-            sheet_dict['transactions']['order_date'] = pd.to_datetime(sheet_dict['transactions']['order_date'])
-        sheet_dict['transactions']['amount'] = pd.to_numeric(sheet_dict['transactions']['amount'], errors='coerce')
-        
-        # Items sheet
-        sheet_dict['items']['item_id'] = sheet_dict['items']['item_id'].astype(str)
-        sheet_dict['items']['price'] = pd.to_numeric(sheet_dict['items']['price'], errors='coerce')
-        
-        # Perform the merges  执行合并
-        merged_df = pd.merge(sheet_dict['users'], sheet_dict['transactions'], on='user_id', how='inner')
-        merged_df = pd.merge(merged_df, sheet_dict['items'], on='item_id', how='inner')
-        
-        # Verify the merged dataframe has data
-        if merged_df.empty:
+        convert_workbook_to_snapshot(workbook, built)
+        os.replace(built, snapshot)
+        return True
+    except Exception:
+        # A workbook that can't be read: the workbook is loaded (and reported)
+        os.remove(built)
+        return False
+
+
+def load_sales_model(files, projection):
+    """
+    Read the sheets of the Excel files (or of their columnar snapshots) and build the sales model, every file
+    a partition of the model. The parsed sheets of every file and the model are kept in the ingestion cache.
+    Over the memory budget, estimated before parsing, the sheets are parsed to disk and the fact table is
+    memory-mapped.
+    Args:
+     files: the raw content (or the path on disk), the name and the ingestion cache key of every file
+     projection: the columns to project in the data frame
+    Return:
+         model: the star schema model of the sheets, None if a file is invalid
+    """
+    if SQL_BACKEND:
+        return load_sql_store(files, projection)
+    columns = tuple(sorted(required_columns(projection)))
+    key = (tuple(file_key for _, _, file_key in files), columns)
+    cache = get_ingestion_cache()
+    trace = current_trace()
+    entry = cache.get(key)
+    if entry is not None:
+        with span(trace, 'ingestion cache hit') as record:
+            record.measure(rows=len(entry['model']), frames=model_frames(entry['model']))
+        report_spill(entry)
+        return entry['model']
+
+    # Reuse the sheets of the files already parsed
+    sheets = {}
+    for _, _, file_key in files:
+        file_entry = cache.get((file_key, columns))
+        if file_entry is not None:
+            sheets[file_key] = file_entry['sheets'] if 'sheets' in file_entry else file_entry['spilled'].read()
+    missing = list({file_key: (source, file_name) for source, file_name, file_key in files
+                    if file_key not in sheets}.items())
+
+    with MemoryBudget(MEMORY_BUDGET_BYTES, get_memory_ledger()) as budget:
+        # Estimate the working set of the load from the sheet sizes, before parsing: the sheets, then the
+        # joined, sorted and indexed transactions
+        sizes = [read_sheet_sizes(source, file_name, set(columns)) for _, (source, file_name) in missing]
+        budget.account('sheets', nbytes=sum(resident_frame_bytes(df[name]) for df in sheets.values() for name in df))
+        budget.account('parsed sheets', nbytes=sum(estimate_sheet_bytes(size) for size in sizes))
+        transaction_count = (sum(len(df['transactions']) for df in sheets.values())
+                             + sum(size.get('transactions', (0, 0))[0] for size in sizes))
+        build_bytes = estimate_build_bytes(transaction_count)
+        # Over the budget, the sheets are parsed straight to disk and the model built from their mapped columns
+        spill = budget.exceeded(build_bytes)
+
+        # Read the sheets of the files not cached yet, the required sheets and columns of every file are
+        # verified from the headers before any parsing
+        try:
+            stage = 'spill_workbooks' if spill else 'read_workbooks'
+            with span(trace, f'{stage} ({len(missing)} of {len(files)} files)') as record:
+                if spill:
+                    for (file_key, _), spilled in zip(missing, spill_workbooks([file for _, file in missing],
+                                                                               set(columns))):
+                        cache.put((file_key, columns), {'spilled': spilled})
+                        sheets[file_key] = spilled.read()
+                else:
+                    for (file_key, _), df in zip(missing, read_workbooks([file for _, file in missing],
+                                                                         set(columns))):
+                        sheets[file_key] = df
+                record.measure(rows=sum(len(sheets[file_key]['transactions']) for file_key, _ in missing),
+                               frames=[sheets[file_key] for file_key, _ in missing])
+        except SalesFileError as e:
+            st.error(str(e))
+            return None
+        budget.account('sheets', nbytes=sum(resident_frame_bytes(df[name]) for df in sheets.values() for name in df))
+        budget.release('parsed sheets')
+        # An estimate short of the parsed sheets still memory-maps the fact table
+        spill_sheets = spill
+        spill = spill or budget.exceeded(build_bytes)
+
+        # Join the sheets to the star schema model
+        with span(trace, 'create_sales_model') as record:
+            model = create_sales_model([(file_name, sheets[file_key]) for _, file_name, file_key in files],
+                                       spill_frame if spill else None)
+            if model is not None:
+                record.measure(rows=len(model), frames=model_frames(model))
+
+        # Keep the sheets parsed in memory for a later load adding a file, spilled to disk over the budget,
+        # and release them from this load
+        if not spill_sheets:
+            with span(trace, 'spill sheets' if spill else 'cache sheets'):
+                for file_key, _ in missing:
+                    file_entry = ({'spilled': SpilledSheets(sheets[file_key].items())} if spill
+                                  else {'sheets': sheets[file_key]})
+                    cache.put((file_key, columns), file_entry)
+        sheets.clear()
+        budget.release('sheets')
+
+        if model is not None:
+            model.dataset_key = content_hash(repr(key).encode())
+            entry = {'model': model}
+            if spill:
+                spilled = ('the sheets were parsed straight to disk' if spill_sheets
+                           else 'the parsed sheets were spilled to disk')
+                entry['spill_report'] = spill_message(
+                    budget, build_bytes, f'the transactions are memory-mapped from disk and {spilled}',
+                    resident_bytes(model))
+            report_spill(entry)
+            cache.put(key, entry)
+    return model
+
+
+def load_sql_store(files, projection):
+    """
+    Load the sheets of the files straight into the SQLite database of the SQL backend, chunk by chunk, without
+    building the in-memory model. The database is kept in the ingestion cache (its file is deleted when it
+    leaves the cache).
+    Args:
+     files: the raw content (or the path on disk), the name and the ingestion cache key of every file
+     projection: the columns to project in the data frame
+    Return:
+         store: the database of the files, None if a file is invalid
+    """
+    columns = tuple(sorted(required_columns(projection)))
+    key = ('sql', tuple(file_key for _, _, file_key in files), columns)
+    cache = get_ingestion_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        return entry['store']
+    try:
+        with span(current_trace(), 'SqlSalesStore') as record:
+            store = SqlSalesStore([(source, file_name) for source, file_name, _ in files], set(columns))
+            record.measure(rows=len(store))
+    except SalesFileError as e:
+        st.error(str(e))
+        return None
+    if not len(store):
+        st.error("Error: No matching data found between sheets. Please check if the join keys (user_id, item_id) match.")
+        return None
+    store.dataset_key = content_hash(repr(key).encode())
+    cache.put(key, {'store': store})
+    return store
+
+
+def spill_message(budget, build_bytes, spilled, resident):
+    """
+    Describe a load over the memory budget, and what the spilled model still holds in memory.
+    Args:
+     budget: the memory budget of the load, its frames accounted
+     build_bytes: the estimated bytes of building the model
+     spilled: what was moved to disk
+     resident: the bytes the model holds in memory, by resident_bytes
+    Return:
+         message: the report of the spill
+    """
+    needed = budget.peak_bytes + build_bytes
+    # The loads of the other sessions running at the same time share the budget
+    shared = (f" ({budget.shared_bytes / 2 ** 20:,.0f} MB of it held by the loads of other sessions)"
+              if budget.shared_bytes else '')
+    kept = [f"{resident['indexes'] / 2 ** 20:,.0f} MB of filter and option indexes and OLAP cube",
+            f"{resident['dimensions'] / 2 ** 20:,.0f} MB of users and items tables"]
+    if resident['transactions']:
+        kept.append(f"{resident['transactions'] / 2 ** 20:,.0f} MB of transaction columns")
+    # The spill doesn't move the indexes and the dimension tables: they may be over the budget on their own
+    over = ', over the budget too' if MemoryBudget(budget.max_bytes).exceeded(sum(resident.values())) else ''
+    return (f"The data needs about {needed / 2 ** 20:,.0f} MB of memory, over the budget of "
+            f"{budget.max_bytes / 2 ** 20:,.0f} MB{shared}: {spilled}. Still in memory: {', '.join(kept)}{over}.")
+
+
+def report_spill(entry):
+    """
+    Report a model spilled to disk by its load, on every rerun showing it.
+    Args:
+     entry: the ingestion cache entry of the model
+    Return:
+         None
+    """
+    if 'spill_report' in entry:
+        st.info(entry['spill_report'])
+
+
+def append_deltas(model, projection):
+    """
+    Offer to append delta files (new transactions, with the new users and items they reference) to the
+    loaded model, without reloading the files already loaded.
+    Args:
+     model: the sales model of the loaded files
+     projection: the columns to project in the data frame
+    Return:
+         model: the sales model with the deltas, the loaded model if there is none
+    """
+    # The deltas are appended to the in-memory model, the database of the SQL backend is read-only
+    if SQL_BACKEND:
+        return model
+    with st.expander("Append new transactions"):
+        delta_files = st.file_uploader("Choose delta files: a 'transactions' sheet, and optional 'users' and 'items' sheets holding the new rows",
+                                       type=UPLOAD_TYPES, accept_multiple_files=True, key=DELTA_UPLOAD_KEY)
+    if not delta_files:
+        return model
+
+    started = time.perf_counter()
+    loaded_count = len(model)
+    for delta_file in delta_files:
+        try:
+            model = load_delta(model, delta_file.getvalue(), delta_file.name, projection)
+        except SalesFileError as e:
+            st.error(f"{delta_file.name}: {e}")
+            return model
+    st.success(f"Appended {len(model) - loaded_count:,} transactions from {len(delta_files)} delta "
+               f"file(s) in {time.perf_counter() - started:.2f} s")
+    return model
+
+
+def load_delta(model, file_bytes, file_name, projection):
+    """
+    Append a delta file to a model. The model with the delta is kept in the ingestion cache, keyed by the
+    dataset of the model and the content of the delta, so a rerun with the same deltas appends nothing.
+    Args:
+     model: the sales model to append to
+     file_bytes: the content of the delta file
+     file_name: the name of the delta file
+     projection: the columns to project in the data frame
+    Return:
+         model: the sales model with the delta
+    Raises:
+     SalesFileError: if the delta file has no transactions sheet or misses a key column
+    """
+    key = (model.dataset_key, content_hash(file_bytes))
+    cache = get_ingestion_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        report_spill(entry)
+        return entry['model']
+    sheets = read_delta(file_bytes, file_name, required_columns(projection))
+
+    # The extended fact table is memory-mapped from disk when the model and the delta exceed the budget
+    with MemoryBudget(MEMORY_BUDGET_BYTES, get_memory_ledger()) as budget:
+        budget.account('model', model_frames(model))
+        budget.account('indexes', resident_bytes(model)['indexes'])
+        budget.account('delta', sheets)
+        build_bytes = estimate_build_bytes(len(sheets['transactions']))
+        spill = budget.exceeded(build_bytes)
+        model = append_delta(model, sheets, file_name, spill_frame if spill else None)
+    model.dataset_key = content_hash(repr(key).encode())
+    entry = {'model': model}
+    if spill:
+        entry['spill_report'] = spill_message(budget, build_bytes, 'the transactions are memory-mapped from disk',
+                                              resident_bytes(model))
+    report_spill(entry)
+    cache.put(key, entry)
+    return model
+
+
+def create_sales_model(workbooks, spill=None):
+    """
+    Join the sheets on the user_id and item_id to the star schema model: the transactions fact table
+    with the row positions of the users and items dimension tables.
+    Args:
+     workbooks: the file name and the sheet name to data frame mapping of every file
+     spill: moves the fact table out of memory before it is indexed, None keeps it in memory
+    Return:
+         model: the sales model, None if the sheets can't be joined
+    """
+    try:
+        model = build_partitioned_sales_model(workbooks, spill)
+
+        # Verify the joined transactions have data
+        if model.empty:
             st.error("Error: No matching data found between sheets. Please check if the join keys (user_id, item_id) match.")
             return None
-            
-        return merged_df
-        
+
+        return model
+
     except Exception as e:
         st.error(f"Error merging sheets: {str(e)}")
         return None
 
 
-def dashboard_config(main_data_frame, projection):
+def merge_sheets_in_excel_file(df):
+    """
+    Merge the sheets and perform a join on the user_id and item_id to the desired data frame
+    Args:
+     df: an unfiltered data frame
+    Return:
+         merged_df: a merged data frame
+    """
+    model = create_sales_model([('', df)])
+    if model is None:
+        return None
+    return model.wide_view()
+
+
+def dashboard_config(model, projection):
     """
     Configure the sales dashboard. The main body of the page
 
     Args:
-        main_data_frame (pd.DataFrame): The DataFrame containing the transactions and user information.
+        model (SalesModel | SqlSalesStore): The transactions fact table with the users and items dimension
+            tables (or their database).
         projection (list): The list of string representing the selected columns to project in the DataFrame.
 
     Returns:
         None
     """
-    if main_data_frame is None:
+    if model is None:
         st.error("No data to display. Please check your Excel file format and try again.")
         return
 
+    # Report the rows the joins could not match one to one
+    for message in model.join_report.messages():
+        st.warning(message)
+
     # Convert column names to lowercase for case-insensitive matching  转换确保列名
-    main_data_frame.columns = [str(col).strip().lower() for col in main_data_frame.columns]
-    projection = [str(col).strip().lower() for col in projection]
+    projection = [normalize_column_name(col) for col in projection]
+
+    trace = current_trace()
+    # Get the state of the sidebar's filters
+    with span(trace, 'sidebar_config'):
+        filter_state = sidebar_config(model)
+
+    # Get the rows, kpis and charts of the filters, computed once per dataset and filter combination
+    with span(trace, 'get_dashboard_result') as record:
+        result = get_dashboard_result(model, filter_state)
+        record.measure(rows=len(result.rows))
+    filtered_rows = result.rows
+
+    # Report the partitions (files and years) read by the date range, the size and build time of the
+    # pre-aggregated cube and the use of the result cache
+    if len(model.partitions) > 1:
+        in_range = model.partitions_in_range(filter_state.start_date, filter_state.end_date)
+        labels = [f'{source} {year}' if year >= 0 else f'{source} (undated)'
+                  for source, year in zip(in_range['source'], in_range['year'])]
+        st.sidebar.caption(f"Partitions read: {len(in_range)} of {len(model.partitions)} ({', '.join(labels)})")
+    if SQL_BACKEND:
+        st.sidebar.caption(model.describe())
+    elif model.cube is not None:
+        st.sidebar.caption(model.cube.describe())
+    cache_stats = get_result_cache().stats()
+    st.sidebar.caption(f"Result cache: {cache_stats['entries']:,} results and charts, "
+                       f"{cache_stats['bytes'] / 2 ** 20:.1f} MB, {cache_stats['hit_rate']:.0%} hit rate")
+
+    if len(filtered_rows) == 0:
+        st.warning("No data matches the current filters. Try adjusting the filter criteria.")
+        return
 
-    # Convert the birth_date column to age column for easier manipulations.
-    main_data_frame = convert_birth_date_to_age_column(main_data_frame)
+    # The top row kpi(avg, total and amount of transactions)
+    with span(trace, 'top_row_kpi'):
+        top_row_kpi(result.aggregates)
 
-    # Pass the data through the sidebar's filters and get back the filtered data frame
-    filtered_data_frame = sidebar_config(main_data_frame[projection])
+    # The table of the filtered transactions, rerun alone by its own widgets
+    table_section(model, filter_state, filtered_rows, projection)
 
-    if filtered_data_frame.empty:
-        st.warning("No data matches the current filters. Try adjusting the filter criteria.")
-        return
+    # Create a Divider under the main table
+    st.markdown('---')
 
-    # Convert the order date to format: dd/mm/yyyy
-    if 'order_date' in filtered_data_frame.columns:
-        filtered_data_frame['order_date'] = filtered_data_frame['order_date'].dt.strftime('%m/%d/%Y')
+    # The pie chart and the horizontal bar chart, then the grouped bar chart and the scatter plot,
+    # every chart rerun alone by its own widgets
+    for chart_row in CHART_ROWS:
+        for col, name in zip(st.columns(len(chart_row)), chart_row):
+            with col:
+                chart_section(name, result.aggregates)
 
-    # The top row kpi(avg, total and amount of transactions), plus add the 'total' column to the data frame
-    top_row_kpi(filtered_data_frame)
 
-    # Display the table data frame
-    st.dataframe(filtered_data_frame, use_container_width=True, hide_index=True)
+@st.fragment
+def table_section(model, filter_state, rows, projection):
+    """
+    Display a page of the table of the filtered transactions, searched and sorted on the server. As a
+    fragment, it is only rerun by a change of the filters or of its own widgets.
 
-    # Create the charts from the filtered data_frame
-    pie_chart, horizontal_bar, grouped_bar, scatter_plot = create_charts(filtered_data_frame)
+    Args:
+        model (SalesModel | SqlSalesStore): The sales model, or the database of the SQL backend.
+        filter_state (FilterState): The sidebar filters of the rows.
+        rows (range | np.ndarray | SqlRows): The positions of the filtered transactions.
+        projection (list): The columns of the table.
 
-    # Create a Divider under the main table
-    st.markdown('---')
+    Returns:
+        None
+    """
+    with span(current_trace(), 'table_section'):
+        show_table(model, filter_state, rows, projection)
 
-    # Create the first row containing the pie chart and the horizontal bar chart
-    left_col, right_col = st.columns(2)
-    with left_col:
-        st.plotly_chart(pie_chart)
-    with right_col:
-        st.plotly_chart(horizontal_bar)
 
-    # Create the second row containing the grouped bar chart and the scatter plot
-    left_col, right_col = st.columns(2)
-    with left_col:
-        st.plotly_chart(grouped_bar)
-    with right_col:
-        st.plotly_chart(scatter_plot)
+def show_table(model, filter_state, rows, projection):
+    """
+    Display the widgets, the page and the row count of the table of the filtered transactions.
 
+    Args:
+        model (SalesModel | SqlSalesStore): The sales model, or the database of the SQL backend.
+        filter_state (FilterState): The sidebar filters of the rows.
+        rows (range | np.ndarray | SqlRows): The positions of the filtered transactions.
+        projection (list): The columns of the table.
 
-def convert_birth_date_to_age_column(main_data_frame):
-    # Convert birth_date column to datetime
-    main_data_frame['birth_date'] = pd.to_datetime(main_data_frame['birth_date'])
+    Returns:
+        None
+    """
+    trace = current_trace()
+    columns = projection + [TOTAL_COLUMN]
+
+    # The search and the sort of the table
+    search_col, text_col, sort_col, order_col = st.columns(4)
+    with search_col:
+        search_column = st.selectbox('Search in:', columns, key='table_search_column')
+    with text_col:
+        search_text = st.text_input('Search:', key='table_search_text').strip()
+    with sort_col:
+        sort_column = st.selectbox('Sort by:', [NO_SORT] + columns, key='table_sort_column')
+    with order_col:
+        descending = st.toggle('Descending', key='table_sort_descending')
+    with span(trace, 'get_table_rows') as record:
+        table_rows = get_table_rows(model, filter_state, rows, search_column, search_text, sort_column, descending)
+        record.measure(rows=len(table_rows))
+
+    # The page of the table, the row count is known without building any row
+    size_col, page_col, count_col = st.columns(3)
+    with size_col:
+        page_size = st.selectbox('Rows per page:', PAGE_SIZES, index=PAGE_SIZES.index(TABLE_PAGE_SIZE),
+                                 key='table_page_size')
+    pages = page_count(len(table_rows), page_size)
+    shown = (model.dataset_key, filter_state, search_column, search_text, sort_column, descending, page_size)
+    if st.session_state.get(TABLE_ROWS_KEY) != shown:
+        st.session_state[TABLE_ROWS_KEY] = shown
+        st.session_state['table_page'] = 1
+    with page_col:
+        page = int(st.number_input('Page:', min_value=1, max_value=pages, step=1, key='table_page'))
+    visible_rows = page_rows(table_rows, page, page_size)
+    first_row = (page - 1) * page_size
+    with count_col:
+        st.caption(f'Rows {first_row + min(1, len(visible_rows)):,}–{first_row + len(visible_rows):,} '
+                   f'of {len(table_rows):,} (page {page:,} of {pages:,})')
+
+    # Build the wide data frame of the transactions of the page only
+    with span(trace, 'wide_view') as record:
+        if SQL_BACKEND:
+            page_data_frame = model.wide_view(visible_rows, columns)
+        else:
+            page_data_frame = model.wide_view(visible_rows, projection)
+
+            # Add the 'total' column (amount * price) to the data frame
+            page_data_frame[TOTAL_COLUMN] = transaction_totals(model, visible_rows)
+        record.measure(rows=len(page_data_frame), frames=page_data_frame)
+
+    # Display the table data frame, the order date formatted as mm/dd/yyyy by the table only
+    with span(trace, 'st.dataframe'):
+        st.dataframe(page_data_frame, use_container_width=True, hide_index=True,
+                     column_config={'order_date': st.column_config.DatetimeColumn(format=ORDER_DATE_FORMAT)})
+
+
+def get_table_rows(model, filter_state, rows, search_column, search_text, sort_column, descending):
+    """
+    Get the filtered transactions matching the search of the table, in the order of the table. A searched
+    or sorted order is kept in the result cache, so turning the pages doesn't search or sort again.
+
+    Args:
+        model (SalesModel | SqlSalesStore): The sales model, or the database of the SQL backend.
+        filter_state (FilterState): The sidebar filters of the rows.
+        rows (range | np.ndarray | SqlRows): The positions of the filtered transactions.
+        search_column (str): The column searched.
+        search_text (str): The text searched, empty for no search.
+        sort_column (str): The column sorted by, NO_SORT to keep the order by date.
+        descending (bool): Sort from the largest value.
+
+    Returns:
+        range | np.ndarray | SqlRows: The positions of the transactions of the table.
+    """
+    if not search_text and sort_column == NO_SORT:
+        return rows
+    key = ('table', model.dataset_key, filter_state, search_column, search_text, sort_column, descending)
+    cache = get_result_cache()
+    table_rows = cache.get(key)
+    if table_rows is None and SQL_BACKEND:
+        # The search and the sort are conditions and an order of the page queries
+        table_rows = rows.searched(search_column, search_text)
+        if sort_column != NO_SORT:
+            table_rows = table_rows.sorted(sort_column, descending)
+    elif table_rows is None:
+        table_rows = search_rows(model, rows, search_column, search_text)
+        if sort_column != NO_SORT:
+            table_rows = sort_rows(model, table_rows, sort_column, descending)
+        cache.put(key, table_rows)
+    return table_rows
+
+
+@st.fragment
+def chart_section(name, aggregates):
+    """
+    Display a chart of the aggregates, as a fragment isolated from the reruns of the other sections.
 
-    # Calculate age based on birthdate
-    current_year = datetime.datetime.now().year
-    main_data_frame['age'] = current_year - main_data_frame['birth_date'].dt.year
+    Args:
+        name (str): The name of the chart in CHARTS.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
-    return main_data_frame
+    Returns:
+        None
+    """
+    trace = current_trace()
+    with span(trace, f'chart_section {name}'):
+        with span(trace, 'get_chart'):
+            figure = get_chart(name, aggregates)
+        with span(trace, 'st.plotly_chart'):
+            st.plotly_chart(figure, key=f'chart_{name}')
 
 
-def create_charts(data_frame: pd.DataFrame):
+def get_chart(name, aggregates):
     """
-    Creates various charts based on the filtered data frame.
+    Get a chart, built only when the aggregates it reads changed. An unchanged chart is the same cached
+    figure, so the browser reuses the copy it already has.
+
     Args:
-     data_frame (pd.DataFrame): The DataFrame containing the filtered data.
+        name (str): The name of the chart in CHARTS.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
+
+    Returns:
+        plotly.graph_objects.Figure: The chart.
+    """
+    create, fields = CHARTS[name]
+    inputs = [getattr(aggregates, field) for field in fields]
+    key = ('chart', name, value_fingerprint(*inputs))
+    cache = get_result_cache()
+    figure = cache.get(key)
+    if figure is None:
+        figure = create(aggregates)
+        cache.put(key, figure)
+    return figure
+
+
+def current_trace():
+    """
+    Get the trace of the stages of the running rerun.
+
+    Returns:
+        Trace: The trace, None outside debug mode.
+    """
+    return st.session_state.get(TRACE_KEY) if DEBUG_MODE else None
+
+
+def model_frames(model):
+    """
+    Get the tables of a model, the frames whose memory a stage reports.
+    """
+    return [model.transactions, model.users, model.items]
+
+
+def profile_requested():
+    """
+    Start profiling this rerun if the debug panel asked for it. A single rerun is profiled: the checkbox is
+    cleared before the panel draws it again.
+
+    Returns:
+        cProfile.Profile: The running profiler, None if this rerun is not profiled.
+    """
+    if not DEBUG_MODE or not st.session_state.get(PROFILE_NEXT_KEY, False):
+        return None
+    st.session_state[PROFILE_NEXT_KEY] = False
+    return start_profiler()
+
+
+def debug_panel(profiler):
+    """
+    Show the stages of the rerun in the sidebar, in debug mode only: their time, rows and memory, the trace
+    as a JSON download and the most expensive functions of the last profiled rerun.
+
+    Args:
+        profiler (cProfile.Profile): The profiler of this rerun, stopped and reported here, None if not profiled.
+
+    Returns:
+        None
+    """
+    if not DEBUG_MODE:
+        return
+    if profiler is not None:
+        profiler.disable()
+        st.session_state[PROFILE_RESULT_KEY] = top_functions(profiler)
+    trace = current_trace()
+    with st.sidebar.expander(f'⏱ Debug: rerun in {trace.total_seconds() * 1000:.0f} ms'):
+        st.dataframe(trace.frame(), use_container_width=True, hide_index=True)
+        st.download_button('Download the JSON trace', trace.to_json(), file_name='dashboard_trace.json',
+                           mime='application/json', on_click='ignore')
+        st.checkbox('Profile the next rerun', key=PROFILE_NEXT_KEY,
+                    help='Run the next rerun under cProfile and list its most expensive functions')
+        profile = st.session_state.get(PROFILE_RESULT_KEY)
+        if profile is not None:
+            st.caption('Most expensive functions of the profiled rerun (cumulative time):')
+            st.dataframe(profile, use_container_width=True, hide_index=True)
+
+
+def get_dashboard_result(model, filter_state):
+    """
+    Get the filtered rows and the aggregates of a filter state, kept in the result cache under the dataset
+    and the normalized state.
+
+    Args:
+        model (SalesModel | SqlSalesStore): The sales model, or the database of the SQL backend.
+        filter_state (FilterState): The sidebar filters.
+
+    Returns:
+        DashboardResult: The result.
+    """
+    key = (model.dataset_key, filter_state)
+    cache = get_result_cache()
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    trace = current_trace()
+    try:
+        if SQL_BACKEND:
+            # Push the filters and the grouping down to the database, the rows are only queried page by
+            # page by the table (their number is known from the aggregates)
+            with span(trace, 'SqlSalesStore.aggregates') as record:
+                aggregates = model.aggregates(filter_state)
+                record.measure(frames=aggregates)
+            rows = model.rows(filter_state, aggregates.transaction_count)
+            if not len(rows):
+                aggregates = None
+        else:
+            with span(trace, 'filter_transactions') as record:
+                rows = filter_transactions(model, filter_state)
+                record.measure(rows=len(rows))
+            with span(trace, 'summarize_sales') as record:
+                aggregates = summarize_sales(model, filter_state, rows) if len(rows) else None
+                record.measure(frames=aggregates)
+    except Exception as e:
+        # Show every transaction, this result is not cached
+        st.error(f"Error in filtering: {str(e)}")
+        if SQL_BACKEND:
+            return DashboardResult(rows=model.rows(FilterState()), aggregates=model.aggregates(FilterState()))
+        rows = range(len(model))
+        return DashboardResult(rows=rows, aggregates=aggregate_sales(model, rows))
+
+    result = DashboardResult(rows=rows, aggregates=aggregates)
+    cache.put(key, result)
+    return result
+
+
+def create_charts(aggregates):
+    """
+    Creates various charts based on the aggregates of the filtered transactions.
+    Args:
+     aggregates (SalesAggregates): The totals computed once by summarize_sales.
     Returns:
         tuple: A tuple containing the pie chart, horizontal bar chart, grouped bar chart, and scatter plot.
     """
-    pie_chart = create_pie_chart(data_frame)
-    horizontal_bar = create_horizontal_bar_chart(data_frame)
-    grouped_bar = create_grouped_bar_chart(data_frame)
-    scatter_plot = create_scatter_plot2(data_frame)
+    pie_chart = create_pie_chart(aggregates)
+    horizontal_bar = create_horizontal_bar_chart(aggregates)
+    grouped_bar = create_grouped_bar_chart(aggregates)
+    scatter_plot = create_scatter_plot2(aggregates)
     return pie_chart, horizontal_bar, grouped_bar, scatter_plot
 
 
-def top_row_kpi(data_frame):
+def kpi_values(aggregates):
     """
-    Display key performance indicators (KPIs) in the top row. And add the total column to the
-    data frame representing the total amount of the transaction.
+    Compute the key performance indicators (KPIs) of the top row.
 
     Args:
-        data_frame (pd.DataFrame): The DataFrame containing the sales data.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
     Returns:
-        None
+        dict: The total sales, the average sale (0 without any priced sale), the units sold, the number of
+            transactions, and whether a single item is selected (the top row then shows the units sold
+            instead of the transactions).
     """
-    # Calculate the total amount for each transaction by multiplying 'amount' and 'price' columns
-    data_frame['total'] = data_frame['amount'] * data_frame['price']
+    # The total sum, average sale, total sales amount, and number of transactions
+    avg_sale = round(aggregates.average_sale, 2)
+    return {
+        'total_sales': int(aggregates.total_sales),
+        'avg_sale': avg_sale if avg_sale > 0 else 0,
+        'units_sold': int(aggregates.units_sold),
+        'transactions': aggregates.transaction_count,
+        # Check if only a single item is selected
+        'single_item': aggregates.item_name_count <= 1,
+    }
+
+
+def top_row_kpi(aggregates):
+    """
+    Display key performance indicators (KPIs) in the top row.
 
-    # Check if only a single item is selected
-    is_single_item_selected = len(data_frame.groupby('item_name').count()) <= 1
+    Args:
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
-    # Calculate the total sum, average sale, total sales amount, and number of transactions
-    total_sum = int(data_frame['total'].sum())
-    avg_sale = round(data_frame['total'].mean(), 2)
-    avg_sale = avg_sale if avg_sale > 0 else 0
-    total_sales_amount = int(data_frame['amount'].sum())
-    transactions_amount = len(data_frame)
+    Returns:
+        None
+    """
+    kpis = kpi_values(aggregates)
+    total_sum = kpis['total_sales']
+    avg_sale = kpis['avg_sale']
 
     # Set the title and value based on whether a single item is selected or not
-    if not is_single_item_selected:
+    if not kpis['single_item']:
         title = 'Total Transactions:'
-        value = transactions_amount
+        value = kpis['transactions']
     else:
         title = 'Total Units Sold:'
-        value = total_sales_amount
+        value = kpis['units_sold']
 
     # Display the KPIs in three columns
     col1, col2, col3 = st.columns(3)
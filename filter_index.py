@@ -0,0 +1,706 @@
+import copy
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+#侧边栏过滤索引: 交易按日期排序, 日期范围二分查找为连续行区间; 区间内合成每个取值的位图和年龄掩码;
+#只收紧条件的新状态在之前的结果上继续过滤
+
+# The attributes filtered by selecting some of their values, with the sidebar field of each
+VALUE_FILTERS = {
+    'full_name': 'full_name',
+    'item_name': 'item_name',
+    'category': 'category',
+    'printing': 'printing',
+    'gender': 'gender',
+    'season': 'season',
+}
+# The row positions are stored as int32 below this many rows
+INT32_MAX_ROWS = 2 ** 31 - 1
+# Attributes with at most this many distinct values get a dense bitmap per value, the others a
+# sparse one (the sorted positions of the rows holding the value)
+DENSE_BITMAP_MAX_VALUES = 64
+# The number of recent filter results kept to be refined by the next states
+RECENT_RESULTS = 4
+# A recent result is refined only when it holds at most this share of the rows of the date window the
+# state would scan otherwise (looking up the keys of a row costs more than a bit of a packed bitmap)
+REFINE_MAX_WINDOW_SHARE = 0.25
+
+
+@dataclass(frozen=True)
+class FilterState:
+    """
+    The normalized, hashable state of the sidebar filters. An empty selection keeps every row.
+
+    Attributes:
+        full_name (tuple): The selected client names.
+        item_name (tuple): The selected item names.
+        category (tuple): The selected categories.
+        printing (tuple): The selected printing options.
+        gender (tuple): The selected genders.
+        season (tuple): The selected seasons.
+        age_range (tuple): The min and max age.
+        start_date (datetime.date): The first order date.
+        end_date (datetime.date): The last order date.
+    """
+    full_name: tuple = ()
+    item_name: tuple = ()
+    category: tuple = ()
+    printing: tuple = ()
+    gender: tuple = ()
+    season: tuple = ()
+    age_range: tuple = (0, 120)
+    start_date: datetime.date = None
+    end_date: datetime.date = None
+
+    @classmethod
+    def from_selection(cls, full_name=(), item_name=(), category=(), printing=(), gender=(), season=(),
+                       age_range=(0, 120), start_date=None, end_date=None):
+        """
+        Normalize the values of the sidebar widgets: the selections are sorted and deduplicated, so the
+        same filters always give the same state whatever the order they were picked in.
+
+        Returns:
+            FilterState: The state.
+        """
+        def normalize(values):
+            return tuple(sorted(set(values), key=str))
+
+        return cls(full_name=normalize(full_name), item_name=normalize(item_name), category=normalize(category),
+                   printing=normalize(printing), gender=normalize(gender), season=normalize(season),
+                   age_range=(int(age_range[0]), int(age_range[1])),
+                   start_date=None if start_date is None else pd.Timestamp(start_date).date(),
+                   end_date=None if end_date is None else pd.Timestamp(end_date).date())
+
+    def narrows(self, previous):
+        """
+        Check whether this state only tightens the constraints of a previous one: each selection is a subset
+        of the previous one (any selection narrows an empty one), the age range and the dates are within the
+        previous ones.
+
+        Args:
+            previous (FilterState): The previous state.
+
+        Returns:
+            bool: True if the rows of this state are a subset of the rows of the previous state.
+        """
+        for field_name in VALUE_FILTERS.values():
+            values, previous_values = getattr(self, field_name), getattr(previous, field_name)
+            if previous_values and not (values and set(values) <= set(previous_values)):
+                return False
+        if self.age_range[0] < previous.age_range[0] or self.age_range[1] > previous.age_range[1]:
+            return False
+        if previous.start_date is not None and (self.start_date is None or self.start_date < previous.start_date):
+            return False
+        if previous.end_date is not None and (self.end_date is None or self.end_date > previous.end_date):
+            return False
+        return True
+
+
+def compact_positions(positions, row_count):
+    """
+    Store row positions in the narrowest integer type able to hold them.
+    """
+    return positions.astype(np.int32) if row_count <= INT32_MAX_ROWS else positions
+
+
+def to_datetime64(date):
+    """
+    Convert a filter date to a bound of the order dates (midnight of the day), None stays open.
+    """
+    return None if date is None else pd.Timestamp(date).to_datetime64()
+
+
+class BitmapStorage:
+    """
+    The dense bitmaps of an attribute in an array with spare bytes at the end of every bitmap, the bitmaps of
+    an index a read only view of the first bytes. Only the index of the last row count writes to the spare
+    bytes, a new value or an append to an older index copies the bitmaps to a new storage.
+    """
+
+    def __init__(self, bitmaps, byte_count, capacity):
+        """
+        Args:
+            bitmaps (np.ndarray): The packed bitmaps to store, one row per value (more than the stored ones).
+            byte_count (int): The bytes of the bitmaps to store.
+            capacity (int): The bytes of every bitmap of the array.
+        """
+        self.array = np.zeros((len(bitmaps), capacity), dtype=np.uint8)
+        self.array[:, :byte_count] = bitmaps[:, :byte_count]
+        self.byte_count = byte_count
+        self.lock = threading.Lock()
+
+    def view(self):
+        bitmaps = self.array[:, :self.byte_count]
+        bitmaps.flags.writeable = False
+        return bitmaps
+
+
+def sparse_segment(codes, first_row, category_count, row_count):
+    """
+    Group the positions of some rows by value: the positions of every value ascending (the stable sort), so
+    a row range is a binary search.
+
+    Args:
+        codes (np.ndarray): The value code of every row, -1 for a missing value.
+        first_row (int): The position of the first row.
+        category_count (int): The number of values.
+        row_count (int): The rows of the index.
+
+    Returns:
+        tuple: The positions grouped by value and the end of the group of the missing values (group 0) and of
+            every value in them.
+    """
+    positions = compact_positions(first_row + np.argsort(codes, kind='stable'), row_count)
+    return positions, np.cumsum(np.bincount(codes + 1, minlength=category_count + 1))
+
+
+def merge_segments(segment, next_segment, row_count):
+    """
+    Merge the sparse segments of consecutive rows, the positions of the next one after those of the first
+    one in every group.
+    """
+    positions, offsets = segment
+    next_positions, next_offsets = next_segment
+    offsets = np.append(offsets, np.full(len(next_offsets) - len(offsets), offsets[-1]))
+    next_counts = np.diff(next_offsets, prepend=0)
+    merged = np.insert(positions.astype(np.int64), np.repeat(offsets, next_counts), next_positions)
+    return compact_positions(merged, row_count), offsets + next_offsets
+
+
+class ValueBitmaps:
+    """
+    The rows holding each distinct value of an attribute. Dense bitmaps (one packed bit per row) for the
+    attributes with few values, sparse ones (the row positions grouped by value) for the others. The sparse
+    bitmaps are segments of consecutive rows, a segment merged with the one before when it grows to half
+    its size.
+    """
+
+    def __init__(self, categories, codes):
+        """
+        Args:
+            categories (pd.Index): The distinct values of the attribute.
+            codes (np.ndarray): The value code of every row, -1 for a missing value.
+        """
+        self.categories = categories
+        self.row_count = len(codes)
+        self.has_missing = bool((codes < 0).any())
+        self.dense = len(categories) <= DENSE_BITMAP_MAX_VALUES
+        self.storage = None
+        if self.dense:
+            self.bitmaps = np.stack([np.packbits(codes == code) for code in range(len(categories))]) \
+                if len(categories) else np.zeros((0, (self.row_count + 7) // 8), dtype=np.uint8)
+        else:
+            self.segments = [sparse_segment(codes, 0, len(categories), self.row_count)]
+
+    @property
+    def nbytes(self):
+        if self.dense:
+            return self.bitmaps.nbytes
+        return sum(positions.nbytes + offsets.nbytes for positions, offsets in self.segments)
+
+    def extended(self, categories, new_codes):
+        """
+        Index rows appended after the indexed ones. The categories may have new values after the known
+        ones, the codes of the known values are unchanged.
+
+        Args:
+            categories (pd.Index): The distinct values of the attribute, the known ones first.
+            new_codes (np.ndarray): The value code of every appended row, -1 for a missing value.
+
+        Returns:
+            ValueBitmaps: The bitmaps of every row, these ones are unchanged.
+        """
+        bitmaps = copy.copy(self)
+        bitmaps.categories = categories
+        bitmaps.row_count = self.row_count + len(new_codes)
+        bitmaps.has_missing = self.has_missing or bool((new_codes < 0).any())
+        if self.dense:
+            # The bits of the rows of the last partial byte, then of the appended rows, per value
+            full_bytes, tail_rows = divmod(self.row_count, 8)
+            tail = np.zeros((len(categories), tail_rows), dtype=bool)
+            tail[:len(self.categories)] = np.unpackbits(self.bitmaps[:, full_bytes:], axis=1, count=tail_rows)
+            new_bits = new_codes[np.newaxis, :] == np.arange(len(categories))[:, np.newaxis]
+            packed = np.packbits(np.concatenate([tail, new_bits], axis=1), axis=1)
+            bitmaps.storage, bitmaps.bitmaps = self.stored_bitmaps(full_bytes, packed)
+        else:
+            segments = [*self.segments, sparse_segment(new_codes, self.row_count, len(categories),
+                                                       bitmaps.row_count)]
+            while len(segments) > 1 and 2 * len(segments[-1][0]) >= len(segments[-2][0]):
+                segments[-2:] = [merge_segments(*segments[-2:], bitmaps.row_count)]
+            bitmaps.segments = segments
+        return bitmaps
+
+    def stored_bitmaps(self, full_bytes, packed):
+        """
+        Write the bytes of appended rows after the full bytes of the dense bitmaps: in the spare bytes of
+        their storage when these bitmaps are the last ones written to it, otherwise to a new storage twice
+        their size.
+
+        Args:
+            full_bytes (int): The bytes of the indexed rows kept as they are.
+            packed (np.ndarray): The bytes from the last partial byte to the last appended row, per value.
+
+        Returns:
+            tuple: The storage and the bitmaps of every row.
+        """
+        byte_count = full_bytes + packed.shape[1]
+        storage = self.storage
+        if storage is not None and len(packed) == len(storage.array):
+            with storage.lock:
+                if storage.byte_count == self.bitmaps.shape[1] and byte_count <= storage.array.shape[1]:
+                    storage.array[:, full_bytes:byte_count] = packed
+                    storage.byte_count = byte_count
+                    return storage, storage.view()
+        bitmaps = np.zeros((len(packed), full_bytes), dtype=np.uint8)
+        bitmaps[:len(self.bitmaps)] = self.bitmaps[:, :full_bytes]
+        storage = BitmapStorage(bitmaps, full_bytes, 2 * byte_count)
+        storage.array[:, full_bytes:byte_count] = packed
+        storage.byte_count = byte_count
+        return storage, storage.view()
+
+    def selected_codes(self, values):
+        codes = self.categories.get_indexer(list(values))
+        return np.unique(codes[codes >= 0])
+
+    def selects_everything(self, values):
+        """
+        Check whether a selection keeps every row, so the attribute can be skipped.
+        """
+        return not self.has_missing and len(self.selected_codes(values)) == len(self.categories)
+
+    def packed_mask(self, values, window):
+        """
+        OR the dense bitmaps of the selected values over the bytes covering a row window.
+
+        Args:
+            values (tuple): The selected values.
+            window (slice): The rows to cover.
+
+        Returns:
+            np.ndarray: The packed bits of the rows holding one of the values, from the byte of window.start.
+        """
+        first_byte, end_byte = window.start // 8, (window.stop + 7) // 8
+        codes = self.selected_codes(values)
+        if len(codes) == 0:
+            return np.zeros(end_byte - first_byte, dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bitmaps[codes, first_byte:end_byte], axis=0)
+
+    def mask(self, values, window):
+        """
+        Get the rows of a window holding one of the values. The work grows with the bytes of the window for
+        the dense bitmaps, with the rows of the selected values inside the window for the sparse ones.
+
+        Args:
+            values (tuple): The selected values.
+            window (slice): The rows to cover.
+
+        Returns:
+            np.ndarray: The boolean mask of the rows of the window.
+        """
+        if self.dense:
+            return unpack_window(self.packed_mask(values, window), window)
+        mask = np.zeros(window.stop - window.start, dtype=bool)
+        for segment_positions, offsets in self.segments:
+            for code in self.selected_codes(values):
+                # offsets[code] is the end of the missing values and of the codes below this one, a value
+                # added after the segment has no row in it
+                if code + 1 >= len(offsets):
+                    continue
+                positions = segment_positions[offsets[code]:offsets[code + 1]]
+                first, end = np.searchsorted(positions, [window.start, window.stop])
+                mask[positions[first:end] - window.start] = True
+        return mask
+
+
+def unpack_window(packed, window):
+    """
+    Unpack the bits of a window from the bytes covering it (the first byte holds the row 8 * (start // 8)).
+    """
+    offset = window.start % 8
+    return np.unpackbits(packed, count=offset + window.stop - window.start)[offset:].astype(bool)
+
+
+class SortedPositions:
+    """
+    The row positions sorted by the value of a column, to find the rows of a value range by binary search.
+    """
+
+    def __init__(self, values):
+        """
+        Args:
+            values (np.ndarray): The value of every row (missing values never match a range).
+        """
+        missing = pd.isna(values)
+        valid = np.flatnonzero(~missing)
+        order = valid[np.argsort(values[valid], kind='stable')]
+        self.row_count = len(values)
+        self.positions = compact_positions(order, self.row_count)
+        self.sorted_values = values[order]
+        self.missing_positions = compact_positions(np.flatnonzero(missing), self.row_count)
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.sorted_values.nbytes + self.missing_positions.nbytes
+
+    def bounds(self, low, high):
+        """
+        Find the slice of the sorted positions holding the rows with low <= value <= high,
+        a None bound leaves that side open.
+        """
+        start = 0 if low is None else int(np.searchsorted(self.sorted_values, low, side='left'))
+        stop = len(self.sorted_values) if high is None else int(np.searchsorted(self.sorted_values, high, side='right'))
+        return start, max(start, stop)
+
+    def selects_everything(self, low, high):
+        """
+        Check whether a range keeps every row, so the column can be skipped.
+        """
+        return len(self.missing_positions) == 0 and self.bounds(low, high) == (0, self.row_count)
+
+    def mask(self, low, high):
+        """
+        Get the rows with low <= value <= high. The smaller of the matching and the other rows is written.
+
+        Returns:
+            np.ndarray: The boolean mask of the rows.
+        """
+        start, stop = self.bounds(low, high)
+        if stop - start <= self.row_count // 2:
+            mask = np.zeros(self.row_count, dtype=bool)
+            mask[self.positions[start:stop]] = True
+            return mask
+        mask = np.ones(self.row_count, dtype=bool)
+        mask[self.positions[:start]] = False
+        mask[self.positions[stop:]] = False
+        mask[self.missing_positions] = False
+        return mask
+
+
+class TimeIndex:
+    """
+    The order dates of the transactions, sorted once when the model is built (the undated rows last), so
+    a date range is a contiguous slice of the rows found by binary search.
+    """
+
+    def __init__(self, dates):
+        """
+        Args:
+            dates (np.ndarray): The datetime64 order date of every row, ascending, NaT last.
+
+        Raises:
+            ValueError: If the dates are not sorted.
+        """
+        self.row_count = len(dates)
+        self.dated_count = self.row_count - int(np.count_nonzero(np.isnat(dates)))
+        self.dates = dates[:self.dated_count]
+        if np.isnat(self.dates).any() or (self.dates[1:] < self.dates[:-1]).any():
+            raise ValueError('The transactions must be sorted by order date, the undated ones last')
+        # The bounds of the date pickers, found once
+        self.bounds = (pd.Timestamp(self.dates[0]), pd.Timestamp(self.dates[-1])) if self.dated_count else (None, None)
+
+    def appends_in_order(self, new_dates):
+        """
+        Check whether rows appended after the indexed ones keep the order by date: the indexed rows are all
+        dated and the new rows are sorted, not before the last date, the undated ones last.
+        """
+        dated = new_dates[~np.isnat(new_dates)]
+        if len(dated) and self.dated_count < self.row_count:
+            return False
+        if len(dated) and self.dated_count and dated[0] < self.dates[-1]:
+            return False
+        return bool(np.isnat(new_dates[len(dated):]).all() and (dated[1:] >= dated[:-1]).all())
+
+    def extended(self, dates):
+        """
+        Index rows appended after the indexed ones, their order checked by appends_in_order. The dates are
+        a view of the dates of every row, like the dates of the built index: the indexed ones aren't copied.
+
+        Args:
+            dates (np.ndarray): The datetime64 order date of every row, the indexed then the appended ones.
+
+        Returns:
+            TimeIndex: The index of every row, this one is unchanged.
+        """
+        index = copy.copy(self)
+        new_dates = dates[self.row_count:]
+        new_dated_count = len(new_dates) - int(np.count_nonzero(np.isnat(new_dates)))
+        index.row_count = len(dates)
+        index.dated_count = self.dated_count + new_dated_count
+        index.dates = dates[:index.dated_count]
+        index.bounds = (pd.Timestamp(index.dates[0]), pd.Timestamp(index.dates[-1])) if index.dated_count \
+            else (None, None)
+        return index
+
+    def restrict(self, rows, start_date, end_date):
+        """
+        Keep the rows of ascending positions ordered between two dates.
+
+        Args:
+            rows (range | np.ndarray): The ascending positions of some rows.
+            start_date (datetime.date | None): The first date, None leaves the start open.
+            end_date (datetime.date | None): The last date, None leaves the end open.
+
+        Returns:
+            range | np.ndarray: The positions of the rows inside the date range.
+        """
+        window = self.window(start_date, end_date)
+        if isinstance(rows, range):
+            start = max(rows.start, window.start)
+            return range(start, max(start, min(rows.stop, window.stop)))
+        first, end = np.searchsorted(rows, [window.start, window.stop])
+        return rows[first:end]
+
+    def window(self, start_date, end_date):
+        """
+        Find the rows ordered between two dates (from midnight of start_date to midnight of end_date,
+        the way the dates were compared before). Without any date every row is kept, the undated ones too.
+
+        Args:
+            start_date (datetime.date | None): The first date, None leaves the start open.
+            end_date (datetime.date | None): The last date, None leaves the end open.
+
+        Returns:
+            slice: The contiguous rows of the range.
+        """
+        if start_date is None and end_date is None:
+            return slice(0, self.row_count)
+        start = 0 if start_date is None else int(np.searchsorted(self.dates, to_datetime64(start_date), side='left'))
+        stop = self.dated_count if end_date is None \
+            else int(np.searchsorted(self.dates, to_datetime64(end_date), side='right'))
+        return slice(start, max(start, stop))
+
+
+class FilterIndex:
+    """
+    The filter index of a sales model, built once per dataset: the transactions sorted by order date, a
+    bitmap per distinct value of the filtered attributes and the users sorted by age. The last results are
+    remembered, a state tightening one of them only refines its rows.
+    """
+
+    def __init__(self, model):
+        """
+        Args:
+            model (SalesModel): The model to index, its transactions sorted by order date.
+        """
+        self.row_count = len(model)
+        self.bitmaps = {}
+        for col in VALUE_FILTERS:
+            values = model.column(col)
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+            self.bitmaps[col] = ValueBitmaps(values.cat.categories, values.cat.codes.to_numpy())
+        self.order_date = TimeIndex(model.transactions['order_date'].to_numpy())
+        self.index_dimensions(model)
+
+    def index_dimensions(self, model):
+        """
+        Index the users and items of a model: the users sorted by age and the value codes of the filtered
+        attributes on their own table. The recent results are reset.
+
+        Args:
+            model (SalesModel): The indexed model.
+
+        Returns:
+            None
+        """
+        self.user_keys = model.user_keys()
+        self.age = SortedPositions(model.users['age'].to_numpy(dtype='float32', na_value=np.nan))
+        self.keys = {'users': self.user_keys, 'items': model.item_keys()}
+        self.table_codes = {}
+        for col in VALUE_FILTERS:
+            table_name = model.column_table(col)
+            values = getattr(model, table_name)[col]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+            self.table_codes[col] = (table_name, values.cat.categories, values.cat.codes.to_numpy())
+        self.recent_results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def extended(self, model, first_row):
+        """
+        Index the transactions appended to a model from first_row, the new rows keeping the order by date
+        (see TimeIndex.appends_in_order).
+
+        Args:
+            model (SalesModel): The model with the appended transactions, users and items.
+            first_row (int): The position of the first appended transaction.
+
+        Returns:
+            FilterIndex: The index of the model, this one is unchanged for the readers of the previous model.
+        """
+        index = copy.copy(self)
+        index.row_count = len(model)
+        index.bitmaps = {}
+        new_rows = range(first_row, len(model))
+        for col in VALUE_FILTERS:
+            values = model.column(col, new_rows)
+            bitmaps = self.bitmaps[col]
+            categories = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else None
+            if categories is not None and bitmaps.categories.equals(categories[:len(bitmaps.categories)]) \
+                    and (not bitmaps.dense or len(categories) <= DENSE_BITMAP_MAX_VALUES):
+                index.bitmaps[col] = bitmaps.extended(categories, values.cat.codes.to_numpy())
+                continue
+            # New values reordering the known ones, or too many values for dense bitmaps: index it again
+            values = model.column(col)
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+            index.bitmaps[col] = ValueBitmaps(values.cat.categories, values.cat.codes.to_numpy())
+        index.order_date = self.order_date.extended(model.transactions['order_date'].to_numpy())
+        index.index_dimensions(model)
+        return index
+
+    @property
+    def nbytes(self):
+        # The dates and the keys are views of the fact table, counted with it
+        with self.lock:
+            results = list(self.recent_results.values())
+        return (sum(bitmaps.nbytes for bitmaps in self.bitmaps.values()) + self.age.nbytes
+                + sum(codes.nbytes + categories.memory_usage(deep=True)
+                      for _, categories, codes in self.table_codes.values())
+                + sum(getattr(rows, 'nbytes', 0) for rows in results))
+
+    def window_mask(self, state, window):
+        """
+        Combine the filters of a state, except the dates, to one mask of a window of rows. The dense bitmaps
+        are combined packed, 8 rows per byte, then every other filter is ANDed once.
+
+        Args:
+            state (FilterState): The filters.
+            window (slice): The rows of the date range.
+
+        Returns:
+            np.ndarray | None: The boolean mask of the matching rows of the window, None if they all match.
+        """
+        packed = None
+        masks = []
+        for col, field_name in VALUE_FILTERS.items():
+            values = getattr(state, field_name)
+            bitmaps = self.bitmaps[col]
+            if not values or bitmaps.selects_everything(values):
+                continue
+            if bitmaps.dense:
+                selected = bitmaps.packed_mask(values, window)
+                packed = selected if packed is None else packed & selected
+            else:
+                masks.append(bitmaps.mask(values, window))
+        if packed is not None:
+            masks.append(unpack_window(packed, window))
+        if not self.age.selects_everything(*state.age_range):
+            masks.append(self.age.mask(*state.age_range)[self.user_keys[window]])
+
+        if not masks:
+            return None
+        mask = masks[0]
+        for value_mask in masks[1:]:
+            mask &= value_mask
+        return mask
+
+    def rows(self, state):
+        """
+        Get the positions of the transactions matching a state. A state tightening a recent one refines its
+        rows, any other state is resolved from the whole index.
+
+        Args:
+            state (FilterState): The filters.
+
+        Returns:
+            range | np.ndarray: The positions of the matching transactions, ascending.
+        """
+        previous = self.narrowed_result(state)
+        if previous is not None and previous[0] == state:
+            rows = previous[1]
+        elif previous is not None and len(previous[1]) <= REFINE_MAX_WINDOW_SHARE * self.window_size(state):
+            rows = self.refine(previous[0], previous[1], state)
+        else:
+            rows = self.scan(state)
+        self.remember(state, rows)
+        return rows
+
+    def window_size(self, state):
+        window = self.order_date.window(state.start_date, state.end_date)
+        return window.stop - window.start
+
+    def scan(self, state):
+        """
+        Resolve a state from the whole index. The date range is found by binary search, so when only the
+        dates filter the rows the result is a range, a zero-copy view of the fact table.
+
+        Args:
+            state (FilterState): The filters.
+
+        Returns:
+            range | np.ndarray: The positions of the matching transactions, ascending.
+        """
+        window = self.order_date.window(state.start_date, state.end_date)
+        mask = self.window_mask(state, window)
+        if mask is None:
+            return range(window.start, window.stop)
+        return window.start + np.flatnonzero(mask)
+
+    def refine(self, previous_state, previous_rows, state):
+        """
+        Filter the rows of a previous state by the constraints a narrower state changed: the dates by binary
+        search, a selection or the age range by looking up the row keys in a mask of the users or items.
+
+        Args:
+            previous_state (FilterState): The previous state.
+            previous_rows (range | np.ndarray): The positions of the transactions matching it.
+            state (FilterState): A state narrowing the previous one.
+
+        Returns:
+            range | np.ndarray: The positions of the matching transactions, ascending.
+        """
+        rows = previous_rows
+        if (state.start_date, state.end_date) != (previous_state.start_date, previous_state.end_date):
+            rows = self.order_date.restrict(rows, state.start_date, state.end_date)
+
+        # A range is looked up as a slice, without materializing the positions
+        index = slice(rows.start, rows.stop) if isinstance(rows, range) else rows
+        mask = None
+        for col, field_name in VALUE_FILTERS.items():
+            values = getattr(state, field_name)
+            if values == getattr(previous_state, field_name):
+                continue
+            table_name, categories, codes = self.table_codes[col]
+            # The last slot stays False, the missing values (-1) are looked up there
+            selected = np.zeros(len(categories) + 1, dtype=bool)
+            value_codes = categories.get_indexer(list(values))
+            selected[value_codes[value_codes >= 0]] = True
+            row_codes = codes[self.keys[table_name][index]] if table_name in self.keys else codes[index]
+            mask = selected[row_codes] if mask is None else mask & selected[row_codes]
+        if state.age_range != previous_state.age_range and not self.age.selects_everything(*state.age_range):
+            age_mask = self.age.mask(*state.age_range)[self.user_keys[index]]
+            mask = age_mask if mask is None else mask & age_mask
+
+        if mask is None:
+            return rows
+        if isinstance(rows, range):
+            return rows.start + np.flatnonzero(mask)
+        return rows[mask]
+
+    def narrowed_result(self, state):
+        """
+        Find the recent result with the fewest rows among those of the states this state narrows.
+
+        Returns:
+            tuple | None: The state and the rows, None if the state narrows no recent state.
+        """
+        with self.lock:
+            candidates = [(previous_state, rows) for previous_state, rows in self.recent_results.items()
+                          if state.narrows(previous_state)]
+        return min(candidates, key=lambda result: len(result[1]), default=None)
+
+    def remember(self, state, rows):
+        """
+        Keep the result of a state, the oldest results are forgotten above RECENT_RESULTS.
+        """
+        with self.lock:
+            self.recent_results[state] = rows
+            self.recent_results.move_to_end(state)
+            while len(self.recent_results) > RECENT_RESULTS:
+                self.recent_results.popitem(last=False)
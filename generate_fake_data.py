@@ -1,91 +1,379 @@
+import argparse
+import datetime
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import random
+import pyarrow as pa
+import pyarrow.parquet as pq
 from faker import Faker
-from datetime import date
-from pathlib import Path
 
-# init
-fake = Faker()
-start_date = date(2024, 1, 1)
-end_date = date(2024, 12, 31)
-
-# read original data
-original_file = r'Excel_file_to_upload/sales_analytics_2022.xlsx'
-df_users = pd.read_excel(original_file, sheet_name="users")
-df_transactions = pd.read_excel(original_file, sheet_name="transactions")
-df_items = pd.read_excel(original_file, sheet_name="items")
-
-# print columns for reference
-print("ITEMS colums: ", df_items.columns.tolist())
-print("USERS colums: ", df_users.columns.tolist())
-print("TRANSACTIONS colums: ", df_transactions.columns.tolist())
-
-# generate users
-def generate_users(n):
-    users = []
-    for i in range(1, n + 1):
-        first_name = fake.first_name()
-        last_name = fake.last_name()
-        full_name = f"{first_name} {last_name}"
-        gender = random.choice(["male", "female"])
-        birth_date = fake.date_of_birth(minimum_age=7, maximum_age=120)
-        users.append([i, first_name, last_name, full_name, gender, birth_date])
-    return pd.DataFrame(users, columns=df_users.columns)
-
-# generate products
-def generate_items(n):
-    items = []
-    # 修正季节格式以匹配过滤器
-    seasons = ['spring/summer', 'fall/winter']
-    colors = ['Red', 'Blue', 'Green', 'Black', 'White', 'Yellow']
-    printings = ['Floral', 'Solid', 'Striped', 'Polka Dot', 'Geometric']
-    fabrics = ['Cotton', 'Linen', 'Silk', 'Wool', 'Polyester']
-    categories = ['Tops', 'Bottoms', 'Dresses', 'Outerwear', 'Accessories']
-
-    for i in range(1, n + 1):
-        item_id = i
-        # 确保item_tags包含性别标签
-        gender = random.choice(['male', 'female'])
-        additional_tags = ', '.join(fake.words(nb=random.randint(1, 2)))
-        item_tags = f"{gender}, {additional_tags}" if additional_tags else gender
-        
-        season = random.choice(seasons)  # 使用正确的季节格式
-        category = random.choice(categories)
-        price = round(random.uniform(5.0, 200.0), 2)
-        color = random.choice(colors)
-        printing = random.choice(printings)
-        fabric = random.choice(fabrics)
-        item_name = f"{fabric} {printing} {category}"
-        image_url = fake.image_url(width=300, height=400)
-        
-        items.append([
-            item_id, item_tags, season, category, price, color,
-            printing, fabric, item_name, image_url
-        ])
-    
-    return pd.DataFrame(items, columns=df_items.columns)
-
-# generate transactions
-def generate_transactions(n, user_ids, item_ids):
-    transactions = []
-    for _ in range(n):
-        user_id = random.choice(user_ids)
-        item_id = random.choice(item_ids)
-        amount = random.randint(1, 5)  # 减小数量范围使其更现实
-        order_date = fake.date_between(start_date=start_date, end_date=end_date)
-        transactions.append([user_id, item_id, amount, order_date])
-    return pd.DataFrame(transactions, columns=df_transactions.columns)
-
-# 
-new_users = generate_users(500)  # 生成500个用户
-new_items = generate_items(300)  # 生成300个商品
-new_transactions = generate_transactions(3200, new_users["user_id"].tolist(), new_items["item_id"].tolist())  # 生成3200笔交易
-
-# save Excel file
-output_file = r'Excel_file_to_upload/sales_analytics_2024.xlsx'
-with pd.ExcelWriter(output_file, engine="xlsxwriter") as writer:
-    new_users.to_excel(writer, sheet_name="users", index=False)
-    new_transactions.to_excel(writer, sheet_name="transactions", index=False)
-    new_items.to_excel(writer, sheet_name="items", index=False)
-
-print(f"✅ Fake data generated at: {Path(output_file).absolute()}") 
\ No newline at end of file
+#向量化的模拟数据生成器: NumPy按块生成用户/商品/交易, 可设随机种子和规模, 多进程生成, 边生成边写入xlsx或列式文件;
+#商品和客户的热度可按Zipf分布倾斜
+
+# The columns of every sheet, the same as the sample workbooks
+USER_COLUMNS = ['user_id', 'first name', 'last name', 'full_name', 'gender', 'birth_date']
+ITEM_COLUMNS = ['item_id', 'item_tags', 'season', 'category', 'price', 'color', 'printing', 'fabric', 'item_name',
+                'image_url']
+TRANSACTION_COLUMNS = ['user_id', 'item_id', 'amount', 'order_date']
+# The values of the item attributes (the seasons match the sidebar filter)
+GENDERS = np.array(['male', 'female'])
+SEASONS = np.array(['spring/summer', 'fall/winter'])
+COLORS = np.array(['Red', 'Blue', 'Green', 'Black', 'White', 'Yellow'])
+PRINTINGS = np.array(['Floral', 'Solid', 'Striped', 'Polka Dot', 'Geometric'])
+FABRICS = np.array(['Cotton', 'Linen', 'Silk', 'Wool', 'Polyester'])
+CATEGORIES = np.array(['Tops', 'Bottoms', 'Dresses', 'Outerwear', 'Accessories'])
+# The number of distinct first names, last names and tag words drawn from Faker once, the rows pick from them
+NAME_POOL_SIZE = 2000
+WORD_POOL_SIZE = 500
+# The ages of the users
+MIN_AGE, MAX_AGE = 7, 120
+# The amounts of a transaction
+MIN_AMOUNT, MAX_AMOUNT = 1, 5
+# The most rows of an Excel sheet, its header row included
+EXCEL_MAX_ROWS = 1_048_576
+# The output formats: one workbook, or a snapshot directory with one file per sheet the dashboard reads
+OUTPUT_FORMATS = ['xlsx', 'arrow', 'parquet']
+
+# The popularity and name pools of the worker processes, set once per process by init_worker
+_worker_state = {}
+
+
+def name_pools(seed):
+    """
+    Draw the pools of first names, last names and tag words from Faker, the only per value Faker calls.
+
+    Args:
+        seed (int): The random seed.
+
+    Returns:
+        dict: The first_names, last_names and words arrays.
+    """
+    fake = Faker()
+    fake.seed_instance(seed)
+    return {
+        'first_names': np.array([fake.first_name() for _ in range(NAME_POOL_SIZE)]),
+        'last_names': np.array([fake.last_name() for _ in range(NAME_POOL_SIZE)]),
+        'words': np.array(fake.words(nb=WORD_POOL_SIZE)),
+    }
+
+
+def popularity_cdf(count, exponent, rng):
+    """
+    Build the cumulative popularity of ids 1..count. With a positive exponent the popularity is Zipf-like
+    (the k-th most popular id is drawn 1 / k ** exponent times as often as the first), the ranks shuffled
+    over the ids so the hot keys are spread; 0 draws every id as often.
+
+    Args:
+        count (int): The number of ids.
+        exponent (float): The Zipf exponent, 0 for uniform.
+        rng (np.random.Generator): The generator shuffling the ranks.
+
+    Returns:
+        np.ndarray | None: The cumulative probabilities of the ids, None for uniform.
+    """
+    if exponent <= 0:
+        return None
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    weights = weights[rng.permutation(count)]
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def draw_ids(rng, count, cdf, size):
+    """
+    Draw size ids in 1..count, following the popularity cdf (uniform when None).
+    """
+    if cdf is None:
+        return rng.integers(1, count + 1, size)
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), count - 1) + 1
+
+
+def random_dates(rng, start_date, end_date, size):
+    """
+    Draw size dates uniformly between two dates, both included.
+    """
+    start = np.datetime64(start_date, 'D')
+    days = (np.datetime64(end_date, 'D') - start).astype(np.int64) + 1
+    return (start + rng.integers(0, days, size)).astype('datetime64[us]')
+
+
+def generate_users(first_id, size, rng, pools, today):
+    """
+    Generate a chunk of users.
+
+    Args:
+        first_id (int): The user_id of the first user.
+        size (int): The number of users.
+        rng (np.random.Generator): The generator of the chunk.
+        pools (dict): The name pools.
+        today (datetime.date): The day the ages are counted from.
+
+    Returns:
+        pd.DataFrame: The users.
+    """
+    first_names = pools['first_names'][rng.integers(0, len(pools['first_names']), size)]
+    last_names = pools['last_names'][rng.integers(0, len(pools['last_names']), size)]
+    oldest = datetime.date(today.year - MAX_AGE - 1, today.month, 1)
+    youngest = datetime.date(today.year - MIN_AGE, today.month, 1)
+    return pd.DataFrame({
+        'user_id': np.arange(first_id, first_id + size, dtype=np.int64),
+        'first name': first_names,
+        'last name': last_names,
+        'full_name': np.char.add(np.char.add(first_names, ' '), last_names),
+        'gender': GENDERS[rng.integers(0, len(GENDERS), size)],
+        'birth_date': random_dates(rng, oldest, youngest, size),
+    }, columns=USER_COLUMNS)
+
+
+def generate_items(size, rng, pools):
+    """
+    Generate the items, every item tagged with its gender and one or two words.
+
+    Args:
+        size (int): The number of items.
+        rng (np.random.Generator): The generator.
+        pools (dict): The name pools.
+
+    Returns:
+        pd.DataFrame: The items.
+    """
+    item_ids = np.arange(1, size + 1, dtype=np.int64)
+    words = pools['words']
+    tags = np.char.add(np.char.add(GENDERS[rng.integers(0, len(GENDERS), size)], ', '),
+                       words[rng.integers(0, len(words), size)])
+    second_words = np.char.add(', ', words[rng.integers(0, len(words), size)])
+    tags = np.where(rng.random(size) < 0.5, np.char.add(tags, second_words), tags)
+    categories = CATEGORIES[rng.integers(0, len(CATEGORIES), size)]
+    printings = PRINTINGS[rng.integers(0, len(PRINTINGS), size)]
+    fabrics = FABRICS[rng.integers(0, len(FABRICS), size)]
+    return pd.DataFrame({
+        'item_id': item_ids,
+        'item_tags': tags,
+        'season': SEASONS[rng.integers(0, len(SEASONS), size)],
+        'category': categories,
+        'price': rng.uniform(5.0, 200.0, size).round(2),
+        'color': COLORS[rng.integers(0, len(COLORS), size)],
+        'printing': printings,
+        'fabric': fabrics,
+        'item_name': np.char.add(np.char.add(np.char.add(np.char.add(fabrics, ' '), printings), ' '), categories),
+        'image_url': np.char.add('https://picsum.photos/seed/', item_ids.astype(str)),
+    }, columns=ITEM_COLUMNS)
+
+
+def generate_transactions(size, rng, user_count, item_count, user_cdf, item_cdf, start_date, end_date):
+    """
+    Generate a chunk of transactions.
+
+    Args:
+        size (int): The number of transactions.
+        rng (np.random.Generator): The generator of the chunk.
+        user_count (int): The number of users.
+        item_count (int): The number of items.
+        user_cdf (np.ndarray | None): The popularity of the users, None for uniform.
+        item_cdf (np.ndarray | None): The popularity of the items, None for uniform.
+        start_date (datetime.date): The first order date.
+        end_date (datetime.date): The last order date.
+
+    Returns:
+        pd.DataFrame: The transactions.
+    """
+    return pd.DataFrame({
+        'user_id': draw_ids(rng, user_count, user_cdf, size),
+        'item_id': draw_ids(rng, item_count, item_cdf, size),
+        'amount': rng.integers(MIN_AMOUNT, MAX_AMOUNT + 1, size),
+        'order_date': random_dates(rng, start_date, end_date, size),
+    }, columns=TRANSACTION_COLUMNS)
+
+
+def init_worker(state):
+    """
+    Keep the popularity and the name pools in the worker process, sent once instead of with every chunk.
+    """
+    _worker_state.update(state)
+
+
+def generate_chunk(task):
+    """
+    Generate a chunk of users or transactions in a worker process. Every chunk has its own seed, so the
+    data only depends on the seed and the chunk size, not on the number of workers.
+
+    Args:
+        task (tuple): The sheet name, the first row, the number of rows and the seed sequence of the chunk.
+
+    Returns:
+        pd.DataFrame: The rows of the chunk.
+    """
+    sheet_name, first_row, size, seed = task
+    rng = np.random.default_rng(seed)
+    state = _worker_state
+    if sheet_name == 'users':
+        return generate_users(first_row + 1, size, rng, state['pools'], state['today'])
+    return generate_transactions(size, rng, state['user_count'], state['item_count'], state['user_cdf'],
+                                 state['item_cdf'], state['start_date'], state['end_date'])
+
+
+class ExcelSheetWriter:
+    """
+    Write the sheets to a workbook row after row in constant memory mode: every row is flushed to disk as
+    soon as the next one starts.
+    """
+
+    def __init__(self, output):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(str(output), {'constant_memory': True,
+                                                          'default_date_format': 'yyyy-mm-dd'})
+        self.worksheets = {}
+
+    def write(self, sheet_name, data_frame):
+        if sheet_name not in self.worksheets:
+            worksheet = self.workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, list(data_frame.columns))
+            self.worksheets[sheet_name] = [worksheet, 1]
+        worksheet, first_row = self.worksheets[sheet_name]
+        if first_row + len(data_frame) > EXCEL_MAX_ROWS:
+            raise ValueError(f"The '{sheet_name}' sheet would exceed the {EXCEL_MAX_ROWS - 1:,} rows of an Excel "
+                             f"sheet, use --format arrow or parquet")
+        # Python values (dates as datetime.date), the types xlsxwriter writes natively
+        columns = [values.to_numpy().astype('datetime64[D]').tolist() if values.dtype.kind == 'M'
+                   else values.to_numpy().tolist() for _, values in data_frame.items()]
+        for offset, row in enumerate(zip(*columns)):
+            worksheet.write_row(first_row + offset, 0, row)
+        self.worksheets[sheet_name][1] = first_row + len(data_frame)
+
+    def close(self):
+        self.workbook.close()
+
+
+class ColumnarSheetWriter:
+    """
+    Write the sheets to a snapshot directory, one Arrow or Parquet file per sheet appended chunk after chunk
+    (an Arrow record batch or a Parquet row group per chunk).
+    """
+
+    def __init__(self, output, file_format):
+        self.output = Path(output)
+        self.output.mkdir(parents=True, exist_ok=True)
+        self.file_format = file_format
+        self.writers = {}
+
+    def write(self, sheet_name, data_frame):
+        table = pa.Table.from_pandas(data_frame, preserve_index=False)
+        if sheet_name not in self.writers:
+            path = self.output / f'{sheet_name}.{self.file_format}'
+            self.writers[sheet_name] = pq.ParquetWriter(path, table.schema) if self.file_format == 'parquet' \
+                else pa.ipc.new_file(str(path), table.schema)
+        self.writers[sheet_name].write_table(table)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def chunk_tasks(sheet_name, row_count, chunk_rows, seed_sequence):
+    """
+    Split the rows of a sheet into chunks, each with its own seed.
+
+    Returns:
+        list: The (sheet name, first row, number of rows, seed) of every chunk.
+    """
+    starts = range(0, row_count, chunk_rows)
+    seeds = seed_sequence.spawn(len(starts))
+    return [(sheet_name, start, min(chunk_rows, row_count - start), seed) for start, seed in zip(starts, seeds)]
+
+
+def generate_dataset(output, user_count=500, item_count=300, transaction_count=3200, seed=0,
+                     start_date=datetime.date(2024, 1, 1), end_date=datetime.date(2024, 12, 31),
+                     file_format='xlsx', chunk_rows=1_000_000, workers=1, user_skew=0.0, item_skew=0.0):
+    """
+    Generate a users/transactions/items dataset and write it chunk after chunk, never holding more than a
+    few chunks of users or transactions in memory. The chunks are generated by worker processes and
+    written in order, so a seed always gives the same data whatever the number of workers.
+
+    Args:
+        output (str | Path): The workbook, or the snapshot directory of the columnar formats.
+        user_count (int): The number of users.
+        item_count (int): The number of items.
+        transaction_count (int): The number of transactions.
+        seed (int): The random seed.
+        start_date (datetime.date): The first order date.
+        end_date (datetime.date): The last order date.
+        file_format (str): 'xlsx', 'arrow' or 'parquet'.
+        chunk_rows (int): The number of rows generated and written at once.
+        workers (int): The number of worker processes, 1 generates in this process.
+        user_skew (float): The Zipf exponent of the popularity of the users, 0 for uniform.
+        item_skew (float): The Zipf exponent of the popularity of the items, 0 for uniform.
+
+    Returns:
+        Path: The path of the output.
+    """
+    user_seeds, item_seeds, transaction_seeds, popularity_seeds = np.random.SeedSequence(seed).spawn(4)
+    popularity_rng = np.random.default_rng(popularity_seeds)
+    state = {
+        'pools': name_pools(seed),
+        'today': datetime.date.today(),
+        'user_count': user_count,
+        'item_count': item_count,
+        'user_cdf': popularity_cdf(user_count, user_skew, popularity_rng),
+        'item_cdf': popularity_cdf(item_count, item_skew, popularity_rng),
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+    tasks = chunk_tasks('users', user_count, chunk_rows, user_seeds) \
+        + chunk_tasks('transactions', transaction_count, chunk_rows, transaction_seeds)
+
+    writer = ExcelSheetWriter(output) if file_format == 'xlsx' else ColumnarSheetWriter(output, file_format)
+    try:
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(state,)) as pool:
+                # The chunks are written in order, at most one per worker generated ahead of the writer
+                pending = deque()
+                for task in tasks:
+                    pending.append((task[0], pool.submit(generate_chunk, task)))
+                    if len(pending) > workers:
+                        sheet_name, future = pending.popleft()
+                        writer.write(sheet_name, future.result())
+                for sheet_name, future in pending:
+                    writer.write(sheet_name, future.result())
+        else:
+            init_worker(state)
+            for task in tasks:
+                writer.write(task[0], generate_chunk(task))
+        writer.write('items', generate_items(item_count, np.random.default_rng(item_seeds), state['pools']))
+    finally:
+        writer.close()
+    return Path(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic sales analytics dataset.')
+    parser.add_argument('--output', default='sales_analytics_generated.xlsx',
+                        help='the workbook to write, or the snapshot directory with --format arrow or parquet '
+                             '(the default leaves the sample workbooks of the dashboard untouched)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='xlsx', help='the output format')
+    parser.add_argument('--users', type=int, default=500, help='the number of users')
+    parser.add_argument('--items', type=int, default=300, help='the number of items')
+    parser.add_argument('--transactions', type=int, default=3200, help='the number of transactions')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat, default=datetime.date(2024, 1, 1),
+                        help='the first order date (YYYY-MM-DD)')
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=datetime.date(2024, 12, 31),
+                        help='the last order date (YYYY-MM-DD)')
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help='the rows generated and written at once')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='the number of worker processes')
+    parser.add_argument('--user-skew', type=float, default=0.0,
+                        help='the Zipf exponent of the popularity of the users (e.g. 1.1), 0 for uniform')
+    parser.add_argument('--item-skew', type=float, default=0.0,
+                        help='the Zipf exponent of the popularity of the items (e.g. 1.1), 0 for uniform')
+    args = parser.parse_args()
+    output = generate_dataset(args.output, args.users, args.items, args.transactions, args.seed, args.start_date,
+                              args.end_date, args.format, max(1, args.chunk_rows), max(1, args.workers),
+                              args.user_skew, args.item_skew)
+    print(f"✅ Fake data generated at: {output.absolute()}")
+
+
+if __name__ == '__main__':
+    main()
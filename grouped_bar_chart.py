@@ -1,32 +1,27 @@
 import datetime as dt
-import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 
 #分组柱状图
-def create_grouped_bar_chart(data_frame):
+def create_grouped_bar_chart(aggregates):
     """
     Create a grouped bar chart to visualize the monthly spend by gender.
 
     Args:
-        data_frame (pd.DataFrame): The DataFrame containing the data.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
     Returns:
         plotly.graph_objects.Figure: The grouped bar chart.
     """
-    # Convert order_date to datetime for manipulation
-    data_frame['order_date'] = pd.to_datetime(data_frame['order_date'], format='mixed')
-
-    # Extract the month from the order_date column
-    data_frame['month'] = data_frame['order_date'].dt.month
-
-    # Group by month and gender, and calculate the total amount
-    grouped_df = data_frame.groupby(['month', 'gender'])['total'].sum().reset_index()
+    # The total amount per month (of every year) and gender
+    grouped_df = aggregates.month_gender_totals
 
     # Create the grouped bar chart using Plotly Express
     fig = px.bar(grouped_df, x='month', y='total', color='gender',
                  labels={'month': 'Month', 'total': 'Total Spend'},
                  title='Monthly Spend By Gender', barmode='group', width=550)
+    # One tick per month, the months of different years are separate bars
+    fig.update_xaxes(dtick='M1', tickformat='%b %Y')
 
     # Return the chart
     return fig
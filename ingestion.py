@@ -0,0 +1,455 @@
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+
+from config import PARALLEL_PARSE_MIN_BYTES, PARSE_WORKERS
+from schema import REQUIRED_SHEETS, find_delta_header_error, find_header_error, normalize_column_name, select_columns
+from snapshot import (is_snapshot, iter_snapshot_chunks, read_snapshot, read_snapshot_headers,
+                      read_snapshot_row_counts)
+
+#读取上传的文件 (Excel工作簿或列式快照), 只读取需要的列, 多进程并行解析工作表或多个工作簿
+
+# The number of rows buffered as python values before they are converted to typed column arrays
+STREAM_CHUNK_ROWS = 50_000
+# The fewest bytes a cell takes in a compressed .xlsx file, bounding the rows of a sheet without dimension
+XLSX_CELL_BYTES = 6
+
+# The process pool parsing the sheets, created on first use and shared by every upload
+_parse_pool = None
+
+
+class SalesFileError(ValueError):
+    """
+    Raised when the uploaded file does not have the sheets or the columns the dashboard needs.
+    """
+
+
+def read_sheets(source, file_name, columns=None):
+    """
+    Read the required sheets of an Excel workbook or of a columnar snapshot. The header of every sheet
+    is validated first, so an invalid file is rejected before any data is parsed.
+
+    Args:
+        source (bytes | str | Path): The content of the uploaded file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+
+    Raises:
+        SalesFileError: If a required sheet or column is missing.
+    """
+    validate_file(source, file_name)
+    if is_snapshot(file_name):
+        return read_snapshot(source, columns)
+    return read_excel_parallel(source, columns)
+
+
+def read_workbooks(files, columns=None):
+    """
+    Read the required sheets of several files, e.g. one workbook per year, one worker process per workbook.
+    The headers of every file are validated first.
+
+    Args:
+        files (list): The (source, file_name) of every file, the source being its content or its path.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        list: The sheet name to data frame mapping of every file, in the order of the files.
+
+    Raises:
+        SalesFileError: If a required sheet or column is missing from a file, the message names the file.
+    """
+    if len(files) == 1:
+        return [read_sheets(*files[0], columns)]
+    for source, file_name in files:
+        try:
+            validate_file(source, file_name)
+        except SalesFileError as e:
+            raise SalesFileError(f'{file_name}: {e}') from e
+
+    global _parse_pool
+    workbooks = [index for index, (_, file_name) in enumerate(files) if not is_snapshot(file_name)]
+    parallel = (PARSE_WORKERS > 1 and len(workbooks) > 1
+                and sum(source_size(files[index][0]) for index in workbooks) >= PARALLEL_PARSE_MIN_BYTES)
+    futures = {}
+    if parallel:
+        try:
+            pool = get_parse_pool()
+            futures = {index: pool.submit(read_file_sheets, *files[index], columns) for index in workbooks}
+        except BrokenProcessPool:
+            _parse_pool = None
+    results = []
+    for index, (source, file_name) in enumerate(files):
+        try:
+            results.append(futures[index].result() if index in futures else read_file_sheets(source, file_name, columns))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory), drop the pool and parse the workbook in this process
+            _parse_pool = None
+            futures = {}
+            results.append(read_file_sheets(source, file_name, columns))
+    return results
+
+
+def read_delta(source, file_name, columns=None):
+    """
+    Read a delta file appended to a loaded dataset: its transactions sheet, and its users and items sheets
+    holding the new rows when it has them. The headers are validated first.
+
+    Args:
+        source (bytes | str | Path): The content of the file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+
+    Raises:
+        SalesFileError: If the transactions sheet or a key column is missing.
+    """
+    error = find_delta_header_error(read_file_headers(source, file_name))
+    if error is not None:
+        raise SalesFileError(error)
+    return read_file_sheets(source, file_name, columns)
+
+
+def validate_file(source, file_name):
+    """
+    Read the headers of an Excel workbook or of a columnar snapshot and reject it if they miss a
+    required sheet or column.
+
+    Args:
+        source (bytes | str | Path): The content of the file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+
+    Returns:
+        None
+
+    Raises:
+        SalesFileError: If a required sheet or column is missing.
+    """
+    validate_headers(read_file_headers(source, file_name))
+
+
+def read_file_headers(source, file_name):
+    """
+    Read the column names of every required sheet of an Excel workbook or of a columnar snapshot.
+
+    Args:
+        source (bytes | str | Path): The content of the file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+
+    Returns:
+        dict: The sheet name to column names mapping.
+    """
+    return read_snapshot_headers(source) if is_snapshot(file_name) else read_excel_headers(source)
+
+
+def read_sheet_sizes(source, file_name, columns=None):
+    """
+    Read the number of rows and of read columns of every required sheet without parsing the rows: from the
+    sheet dimensions of a workbook, or the metadata of a snapshot.
+
+    Args:
+        source (bytes | str | Path): The content of the file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to (rows, columns) mapping.
+    """
+    headers = read_file_headers(source, file_name)
+    counts = read_snapshot_row_counts(source) if is_snapshot(file_name) else read_excel_row_counts(source)
+    sizes = {}
+    for sheet_name, names in headers.items():
+        width = len(select_columns(names, columns))
+        rows = counts.get(sheet_name)
+        if rows is None:
+            # A sheet without dimension: as many rows as the whole file could hold
+            rows = source_size(source) // (XLSX_CELL_BYTES * max(1, len(names)))
+        sizes[sheet_name] = (rows, width)
+    return sizes
+
+
+def read_file_sheets(source, file_name, columns=None):
+    """
+    Read the required sheets of a validated file in the calling process, run in the worker processes
+    reading several workbooks.
+
+    Args:
+        source (bytes | str | Path): The content of the file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+    """
+    if is_snapshot(file_name):
+        return read_snapshot(source, columns)
+    return read_excel_projected(source, columns)
+
+
+def validate_headers(headers):
+    """
+    Reject a file whose headers miss a required sheet or column.
+
+    Args:
+        headers (dict): The sheet name to column names mapping.
+
+    Returns:
+        None
+
+    Raises:
+        SalesFileError: With the message to show to the user.
+    """
+    error = find_header_error(headers)
+    if error is not None:
+        raise SalesFileError(error)
+
+
+def open_workbook(source):
+    """
+    Open a workbook in openpyxl read-only mode.
+
+    Args:
+        source (bytes | str | Path): The content of the workbook or its path.
+
+    Returns:
+        openpyxl.Workbook: The read-only workbook, to be closed by the caller.
+    """
+    return openpyxl.load_workbook(io.BytesIO(source) if isinstance(source, bytes) else source,
+                                  read_only=True, data_only=True)
+
+
+def read_excel_headers(source):
+    """
+    Read only the first row of each required sheet of a workbook.
+
+    Args:
+        source (bytes | str | Path): The content of the workbook or its path.
+
+    Returns:
+        dict: The sheet name to column names mapping.
+    """
+    workbook = open_workbook(source)
+    try:
+        headers = {}
+        for worksheet in workbook.worksheets:
+            if worksheet.title in REQUIRED_SHEETS:
+                header = next(worksheet.iter_rows(max_row=1, values_only=True), None) or ()
+                headers[worksheet.title] = [name for name in header if name is not None]
+        return headers
+    finally:
+        workbook.close()
+
+
+def read_excel_row_counts(source):
+    """
+    Read the number of rows of each required sheet of a workbook from its dimension, the header excluded.
+
+    Args:
+        source (bytes | str | Path): The content of the workbook or its path.
+
+    Returns:
+        dict: The sheet name to row count mapping, None for a sheet without dimension.
+    """
+    workbook = open_workbook(source)
+    try:
+        return {worksheet.title: None if worksheet.max_row is None else max(0, worksheet.max_row - 1)
+                for worksheet in workbook.worksheets if worksheet.title in REQUIRED_SHEETS}
+    finally:
+        workbook.close()
+
+
+def get_parse_pool():
+    """
+    Get the process pool parsing the sheets. The processes are spawned rather than forked, the
+    Streamlit server process is multi-threaded.
+
+    Returns:
+        ProcessPoolExecutor: The shared pool.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _parse_pool
+
+
+def source_size(source):
+    """
+    Get the size of a file given as content or as a path.
+
+    Args:
+        source (bytes | str | Path): The content of the file or its path.
+
+    Returns:
+        int: The size in bytes.
+    """
+    return len(source) if isinstance(source, bytes) else Path(source).stat().st_size
+
+
+def read_excel_parallel(source, columns=None):
+    """
+    Parse the required sheets of a workbook at the same time, one process per sheet, so the load time
+    approaches the one of the largest sheet. Small workbooks (or a single worker) are parsed in this process.
+
+    Args:
+        source (bytes | str | Path): The content of the workbook or its path.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+    """
+    global _parse_pool
+    if PARSE_WORKERS <= 1 or source_size(source) < PARALLEL_PARSE_MIN_BYTES:
+        return read_excel_projected(source, columns)
+    try:
+        pool = get_parse_pool()
+        futures = {sheet_name: pool.submit(read_excel_sheet, source, sheet_name, columns)
+                   for sheet_name in REQUIRED_SHEETS}
+        return {sheet_name: future.result() for sheet_name, future in futures.items()}
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory), drop the pool and parse in this process
+        _parse_pool = None
+        return read_excel_projected(source, columns)
+
+
+def read_excel_sheet(source, sheet_name, columns=None):
+    """
+    Parse a single sheet of a workbook, run in the worker processes.
+
+    Args:
+        source (bytes | str | Path): The content of the workbook or its path.
+        sheet_name (str): The sheet to parse.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        pd.DataFrame: The projected sheet.
+    """
+    workbook = open_workbook(source)
+    try:
+        return read_worksheet_projected(workbook[sheet_name], columns)
+    finally:
+        workbook.close()
+
+
+def read_excel_projected(source, columns=None):
+    """
+    Stream the required sheets of an Excel workbook in openpyxl read-only mode, keeping only the
+    projected columns. Other sheets are skipped, so a file missing a required sheet is missing it in
+    the result too.
+
+    Args:
+        source (bytes | str | Path): The content of the workbook or its path.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+    """
+    workbook = open_workbook(source)
+    try:
+        return {worksheet.title: read_worksheet_projected(worksheet, columns)
+                for worksheet in workbook.worksheets if worksheet.title in REQUIRED_SHEETS}
+    finally:
+        workbook.close()
+
+
+def read_worksheet_projected(worksheet, columns=None):
+    """
+    Stream the rows of a worksheet into typed column arrays. Only the selected cells of a bounded
+    chunk of rows are held as python values at any time.
+
+    Args:
+        worksheet: The openpyxl read-only worksheet. Its first row is the header.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        pd.DataFrame: The projected sheet, with the normalized column names.
+    """
+    chunks = list(iter_worksheet_chunks(worksheet, columns))
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def iter_worksheet_chunks(worksheet, columns=None):
+    """
+    Stream the rows of a worksheet as frames of at most STREAM_CHUNK_ROWS rows.
+
+    Args:
+        worksheet: The openpyxl read-only worksheet. Its first row is the header.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Yields:
+        pd.DataFrame: The projected rows of a chunk, with the normalized column names. A sheet without
+            rows yields a single empty frame.
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None) or ()
+    selected_names = set(select_columns([name for name in header if name is not None], columns))
+    selected = [(index, normalize_column_name(name)) for index, name in enumerate(header) if name in selected_names]
+
+    buffers = {name: [] for _, name in selected}
+    buffered_rows = 0
+    flushed = False
+    for row in rows:
+        # Skip the empty rows (openpyxl reports the formatted but empty rows at the end of a sheet)
+        if all(value is None for value in row):
+            continue
+        for index, name in selected:
+            buffers[name].append(row[index] if index < len(row) else None)
+        buffered_rows += 1
+        if buffered_rows == STREAM_CHUNK_ROWS:
+            yield flush_column_buffers(buffers)
+            buffered_rows, flushed = 0, True
+    if buffered_rows or not flushed:
+        yield flush_column_buffers(buffers)
+
+
+def flush_column_buffers(buffers):
+    """
+    Convert the buffered python values of each column to a typed column and empty the buffers.
+
+    Args:
+        buffers (dict): The column name to list of python values mapping.
+
+    Returns:
+        pd.DataFrame: The typed columns of the buffered rows.
+    """
+    chunk = pd.DataFrame({name: pd.Series(values, dtype=None if values else object)
+                          for name, values in buffers.items()})
+    for name in buffers:
+        buffers[name] = []
+    return chunk
+
+
+def iter_sheet_chunks(source, file_name, columns=None):
+    """
+    Stream the required sheets of an Excel workbook or of a columnar snapshot as frames of a bounded number
+    of rows, so a whole sheet is never held in memory.
+
+    Args:
+        source (bytes | str | Path): The content of the file, or its path on disk.
+        file_name (str): The name of the file, its suffix selects the reader.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Yields:
+        tuple: The sheet name and the frame of a chunk of its rows.
+    """
+    if is_snapshot(file_name):
+        yield from iter_snapshot_chunks(source, STREAM_CHUNK_ROWS, columns)
+        return
+    workbook = open_workbook(source)
+    try:
+        for worksheet in workbook.worksheets:
+            if worksheet.title in REQUIRED_SHEETS:
+                for chunk in iter_worksheet_chunks(worksheet, columns):
+                    yield worksheet.title, chunk
+    finally:
+        workbook.close()
@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+#整数键连接引擎: 键编码为紧凑整数, 按位置查找维度行 (代替字符串哈希合并)
+
+# Integer keys spanning at most this many codes per key are used directly as codes (key - min)
+DIRECT_CODES_MAX_SPREAD = 4
+
+
+@dataclass
+class JoinReport:
+    """
+    The counts of the rows the joins of the sheets could not match one to one.
+
+    Attributes:
+        duplicate_user_ids (int): The extra users rows sharing a user_id with another row.
+        duplicate_item_ids (int): The extra items rows sharing an item_id with another row.
+        orphan_user_transactions (int): The transactions whose user_id matches no user, dropped by the join.
+        orphan_item_transactions (int): The transactions whose item_id matches no item, dropped by the join.
+    """
+    duplicate_user_ids: int = 0
+    duplicate_item_ids: int = 0
+    orphan_user_transactions: int = 0
+    orphan_item_transactions: int = 0
+
+    def messages(self):
+        """
+        Describe the unmatched rows to the user.
+
+        Returns:
+            list: One message per non zero count.
+        """
+        messages = []
+        if self.duplicate_user_ids:
+            messages.append(f'{self.duplicate_user_ids:,} users rows repeat an existing user_id, '
+                            f'their transactions are counted once per repeated row.')
+        if self.duplicate_item_ids:
+            messages.append(f'{self.duplicate_item_ids:,} items rows repeat an existing item_id, '
+                            f'their transactions are counted once per repeated row.')
+        if self.orphan_user_transactions:
+            messages.append(f'{self.orphan_user_transactions:,} transactions reference an unknown user_id and were skipped.')
+        if self.orphan_item_transactions:
+            messages.append(f'{self.orphan_item_transactions:,} transactions reference an unknown item_id and were skipped.')
+        return messages
+
+
+def numeric_key_values(keys):
+    """
+    Get the key values as int64 when they are all whole numbers, so numeric keys are joined by value
+    without being cast to strings.
+
+    Args:
+        keys (pd.Series): The key column.
+
+    Returns:
+        tuple: The int64 values (or None if the keys are not whole numbers) and the mask of the missing keys.
+    """
+    if pd.api.types.is_bool_dtype(keys) or not pd.api.types.is_numeric_dtype(keys):
+        return None, None
+    missing = keys.isna().to_numpy()
+    values = keys.to_numpy(dtype='float64', na_value=0) if missing.any() else keys.to_numpy()
+    if pd.api.types.is_float_dtype(values) and not (np.isfinite(values).all() and np.array_equal(values, np.floor(values))):
+        return None, None
+    return values.astype(np.int64, copy=False), missing
+
+
+def key_codes(dimension_keys, fact_keys):
+    """
+    Normalize the keys of both sides of a join to compact integer codes. Whole number keys are coded by
+    value (directly when their range is compact, factorized otherwise), any other key is coded by its
+    string representation, the same way the sheets were merged on str cast keys.
+
+    Args:
+        dimension_keys (pd.Series): The keys of the dimension table.
+        fact_keys (pd.Series): The keys of the fact table.
+
+    Returns:
+        tuple: The dimension and the fact codes (int64 arrays, -1 for a missing key).
+    """
+    dimension_values, dimension_missing = numeric_key_values(dimension_keys)
+    fact_values, fact_missing = numeric_key_values(fact_keys)
+    if dimension_values is not None and fact_values is not None:
+        both = np.concatenate([dimension_values[~dimension_missing], fact_values[~fact_missing]])
+        low = both.min() if len(both) else 0
+        spread = (both.max() - low + 1) if len(both) else 0
+        if spread <= DIRECT_CODES_MAX_SPREAD * max(len(both), 1):
+            codes = np.concatenate([dimension_values, fact_values]) - low
+        else:
+            codes = pd.factorize(np.concatenate([dimension_values, fact_values]))[0].astype(np.int64)
+        codes[np.concatenate([dimension_missing, fact_missing])] = -1
+    else:
+        codes = pd.factorize(pd.concat([dimension_keys.astype(str), fact_keys.astype(str)], ignore_index=True))[0]
+        codes = codes.astype(np.int64)
+    return codes[:len(dimension_keys)], codes[len(dimension_keys):]
+
+
+def positional_join(dimension_codes, fact_codes):
+    """
+    Inner join the fact rows to the dimension rows by their key codes, the same rows an inner pd.merge
+    returns: a fact row matching several dimension rows is repeated once per match, in the dimension order.
+
+    Args:
+        dimension_codes (np.ndarray): The key codes of the dimension rows.
+        fact_codes (np.ndarray): The key codes of the fact rows.
+
+    Returns:
+        tuple: The matched fact row positions, the matching dimension row positions and the number of
+            fact rows without a match.
+    """
+    table_size = int(max(dimension_codes.max(initial=-1), fact_codes.max(initial=-1))) + 2
+    # The missing keys (-1) are looked up in the last slot of the tables, which never matches
+    dimension_slots = np.where(dimension_codes < 0, table_size - 1, dimension_codes)
+    fact_slots = np.where(fact_codes < 0, table_size - 1, fact_codes)
+    code_counts = np.bincount(dimension_slots, minlength=table_size)
+    code_counts[-1] = 0
+    counts = code_counts[fact_slots]
+    orphans = int(np.count_nonzero(counts == 0))
+
+    if code_counts.max(initial=0) <= 1:
+        # Every key is unique: the position of a code is a single lookup
+        code_positions = np.full(table_size, -1, dtype=np.int64)
+        code_positions[dimension_slots] = np.arange(len(dimension_codes))
+        code_positions[-1] = -1
+        positions = code_positions[fact_slots]
+        fact_rows = np.flatnonzero(positions >= 0)
+        return fact_rows, positions[fact_rows], orphans
+
+    # Duplicate keys: the dimension rows sorted by code, each code owns a contiguous run of them
+    order = np.argsort(dimension_slots, kind='stable')
+    code_starts = np.cumsum(code_counts) - code_counts
+    starts = code_starts[fact_slots]
+    fact_rows = np.repeat(np.arange(len(fact_codes)), counts)
+    offsets = np.arange(len(fact_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return fact_rows, order[np.repeat(starts, counts) + offsets], orphans
+
+
+def count_duplicate_keys(codes):
+    """
+    Count the rows repeating the key of a previous row.
+
+    Args:
+        codes (np.ndarray): The key codes.
+
+    Returns:
+        int: The number of repeated rows.
+    """
+    valid = codes[codes >= 0]
+    return int(len(valid) - len(np.unique(valid)))
+
+
+def join_star_schema(transactions, users, items, user_key, item_key):
+    """
+    Link every transaction to the row positions of its user and item.
+
+    Args:
+        transactions (pd.DataFrame): The transactions sheet, with the user_id and item_id columns.
+        users (pd.DataFrame): The users sheet, with a default index.
+        items (pd.DataFrame): The items sheet, with a default index.
+        user_key (str): The name of the column receiving the users row positions.
+        item_key (str): The name of the column receiving the items row positions.
+
+    Returns:
+        tuple: The fact table (the transactions without the ids, with the positions) and the JoinReport.
+    """
+    user_codes, transaction_user_codes = key_codes(users['user_id'], transactions['user_id'])
+    item_codes, transaction_item_codes = key_codes(items['item_id'], transactions['item_id'])
+
+    user_rows, user_positions, user_orphans = positional_join(user_codes, transaction_user_codes)
+    item_rows, item_positions, item_orphans = positional_join(item_codes, transaction_item_codes[user_rows])
+    fact_rows = user_rows[item_rows]
+
+    fact = transactions.drop(columns=['user_id', 'item_id']).take(fact_rows).reset_index(drop=True)
+    fact[user_key] = user_positions[item_rows]
+    fact[item_key] = item_positions
+    report = JoinReport(duplicate_user_ids=count_duplicate_keys(user_codes),
+                        duplicate_item_ids=count_duplicate_keys(item_codes),
+                        orphan_user_transactions=user_orphans,
+                        orphan_item_transactions=item_orphans)
+    return fact, report
+
+
+def latest_codes(codes):
+    """
+    Keep the key code of the last row of every key only, the earlier rows repeating it get -1. Later
+    workbooks are stacked after the earlier ones, so their rows describe the key.
+
+    Args:
+        codes (np.ndarray): The key codes of the dimension rows.
+
+    Returns:
+        np.ndarray: The codes, unique apart from -1.
+    """
+    _, last_in_reversed = np.unique(codes[::-1], return_index=True)
+    last_rows = len(codes) - 1 - last_in_reversed
+    latest = np.full(len(codes), -1, dtype=np.int64)
+    latest[last_rows] = codes[last_rows]
+    latest[codes < 0] = -1
+    return latest
+
+
+def join_delta(transactions, users, items, user_key, item_key):
+    """
+    Link the transactions of a delta to the row positions of their user and item among the dimension
+    tables of a model (its new rows included). A key repeated by several workbooks of the model is
+    linked to its last row.
+
+    Args:
+        transactions (pd.DataFrame): The transactions of the delta, with the user_id and item_id columns.
+        users (pd.DataFrame): The users table of the model, with a default index.
+        items (pd.DataFrame): The items table of the model, with a default index.
+        user_key (str): The name of the column receiving the users row positions.
+        item_key (str): The name of the column receiving the items row positions.
+
+    Returns:
+        tuple: The fact rows of the delta and the numbers of transactions with an unknown user and item.
+    """
+    user_codes, transaction_user_codes = key_codes(users['user_id'], transactions['user_id'])
+    item_codes, transaction_item_codes = key_codes(items['item_id'], transactions['item_id'])
+
+    user_rows, user_positions, user_orphans = positional_join(latest_codes(user_codes), transaction_user_codes)
+    item_rows, item_positions, item_orphans = positional_join(latest_codes(item_codes),
+                                                              transaction_item_codes[user_rows])
+    fact_rows = user_rows[item_rows]
+
+    fact = transactions.drop(columns=['user_id', 'item_id']).take(fact_rows).reset_index(drop=True)
+    fact[user_key] = user_positions[item_rows]
+    fact[item_key] = item_positions
+    return fact, user_orphans, item_orphans
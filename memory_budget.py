@@ -0,0 +1,323 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from cache import estimate_nbytes
+from ingestion import SalesFileError, iter_sheet_chunks, validate_file
+
+#内存预算: 解析前估计加载的字节数, 由服务器进程内所有并发加载共享; 超出预算时把工作表直接流式解析到磁盘, 以内存映射读取并构建模型
+
+# The peak bytes per transaction of building a model, besides its sheets: the joined fact table, its sorted
+# copy with the time buckets, and the filter and option indexes (about 115 bytes measured at 1M transactions)
+BUILD_ROW_BYTES = 120
+# The bytes of a parsed cell at most: 8 for the numbers and dates, about 17 measured for the text attributes
+SHEET_CELL_BYTES = 16
+# The prefix of the files and directories spilled to the temporary directory
+SPILL_PREFIX = 'sales_spill_'
+
+
+def remove_file(path):
+    """
+    Delete a spilled file, already deleted or not.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class MemoryLedger:
+    """
+    The bytes held by the loads running at the same time in the server process, every session's load
+    counted against the same budget.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loads = {}
+
+    def update(self, load, nbytes):
+        """
+        Record the bytes a load holds, 0 once it is done.
+        """
+        with self.lock:
+            if nbytes:
+                self.loads[id(load)] = nbytes
+            else:
+                self.loads.pop(id(load), None)
+
+    def other_bytes(self, load):
+        """
+        Get the bytes held by the other loads.
+        """
+        with self.lock:
+            return sum(nbytes for key, nbytes in self.loads.items() if key != id(load))
+
+
+class MemoryBudget:
+    """
+    The estimated bytes of the frames a load holds at the same time, and of the other loads of the ledger,
+    against the memory budget. A budget of 0 is never exceeded.
+    """
+
+    def __init__(self, max_bytes, ledger=None):
+        """
+        Args:
+            max_bytes (int): The memory budget, 0 for no budget.
+            ledger (MemoryLedger | None): The loads sharing the budget, None for a budget of this load only.
+        """
+        self.max_bytes = max_bytes
+        self.ledger = ledger
+        self.frames = {}
+        self.peak_bytes = 0
+        self.shared_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.frames.clear()
+        self.update_ledger()
+
+    @property
+    def working_bytes(self):
+        return sum(self.frames.values())
+
+    def update_ledger(self):
+        if self.ledger is not None:
+            self.ledger.update(self, self.working_bytes)
+
+    def account(self, name, value=None, nbytes=None):
+        """
+        Count the frames of a stage as held until they are released.
+
+        Args:
+            name (str): The name of the frames.
+            value: The frames (or any value estimate_nbytes measures).
+            nbytes (int): Their size, estimated when not given.
+
+        Returns:
+            int: The size of the frames.
+        """
+        self.frames[name] = estimate_nbytes(value) if nbytes is None else int(nbytes)
+        self.peak_bytes = max(self.peak_bytes, self.working_bytes)
+        self.update_ledger()
+        return self.frames[name]
+
+    def release(self, name):
+        """
+        Stop counting frames no longer held.
+        """
+        self.frames.pop(name, None)
+        self.update_ledger()
+
+    def exceeded(self, extra_bytes=0):
+        """
+        Check if the held frames and some bytes about to be allocated are over the budget.
+
+        Args:
+            extra_bytes (int): The estimated bytes of the next stage.
+
+        Returns:
+            bool: True over the budget.
+        """
+        if self.ledger is not None:
+            self.shared_bytes = self.ledger.other_bytes(self)
+        return self.max_bytes > 0 and self.shared_bytes + self.working_bytes + extra_bytes > self.max_bytes
+
+
+def estimate_sheet_bytes(sizes):
+    """
+    Estimate the bytes of parsed sheets from their sizes, before parsing them.
+
+    Args:
+        sizes (dict): The sheet name to (rows, columns) mapping of a file, by read_sheet_sizes.
+
+    Returns:
+        int: The estimated bytes.
+    """
+    return sum(rows * columns * SHEET_CELL_BYTES for rows, columns in sizes.values())
+
+
+def estimate_build_bytes(transaction_count):
+    """
+    Estimate the peak bytes of building the model of some transactions, besides their sheets.
+    """
+    return transaction_count * BUILD_ROW_BYTES
+
+
+def is_memory_mapped(values):
+    """
+    Check an array reads a memory-mapped file, itself or through the arrays it is a view of.
+    """
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+def resident_bytes(model):
+    """
+    Measure the memory a model holds, the memory-mapped columns of its fact table left out.
+
+    Args:
+        model (SalesModel): The model.
+
+    Returns:
+        dict: The bytes of its 'transactions' columns held in memory, of its 'dimensions' tables and of its
+            'indexes'.
+    """
+    transactions = resident_frame_bytes(model.transactions)
+    indexes = sum(index.nbytes for index in (model.filter_index, model.option_index, model.cube)
+                  if index is not None)
+    return {'transactions': transactions, 'dimensions': estimate_nbytes([model.users, model.items]),
+            'indexes': indexes}
+
+
+def resident_frame_bytes(frame):
+    """
+    Measure the memory a frame holds, its memory-mapped columns left out.
+    """
+    return sum(estimate_nbytes(frame[col]) for col in frame.columns if not is_memory_mapped(frame[col].to_numpy()))
+
+
+class SpilledSheets:
+    """
+    Parsed sheets written to disk chunk by chunk: the numeric and datetime columns to raw files read back
+    memory-mapped, the other columns pickled. The directory is deleted with the object.
+    """
+
+    def __init__(self, chunks, directory=None):
+        """
+        Args:
+            chunks (Iterable): The (sheet name, data frame) of every chunk of rows, the sheets in any order.
+            directory (str | None): The parent directory of the files, None for the temporary directory.
+        """
+        self.path = tempfile.mkdtemp(prefix=SPILL_PREFIX, dir=directory)
+        self.finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+        # The segments of every column of every sheet, in the order of the chunks
+        self.sheets = {}
+        for sheet_name, chunk in chunks:
+            self.write(sheet_name, chunk)
+
+    def write(self, sheet_name, chunk):
+        """
+        Append a chunk of rows to the files of its sheet.
+        """
+        columns = self.sheets.setdefault(sheet_name, {})
+        for col in chunk.columns:
+            segments = columns.setdefault(col, [])
+            values = chunk[col]
+            file_name = f'{list(self.sheets).index(sheet_name)}_{list(columns).index(col)}'
+            if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufmM':
+                path = os.path.join(self.path, f'{file_name}_{values.dtype.str.replace("<", "")}')
+                with open(path, 'ab') as writer:
+                    offset = writer.tell()
+                    np.ascontiguousarray(values.to_numpy()).tofile(writer)
+                segments.append(('raw', path, values.dtype, offset, len(values)))
+            else:
+                path = os.path.join(self.path, f'{file_name}_{len(segments)}.pkl')
+                values.to_pickle(path)
+                segments.append(('pickle', path, values.dtype, 0, len(values)))
+
+    def read(self):
+        """
+        Read the sheets back, a column of a single numeric or datetime type memory-mapped.
+
+        Returns:
+            dict: The sheet name to data frame mapping.
+        """
+        return {sheet_name: pd.DataFrame({col: read_segments(col, segments) for col, segments in columns.items()},
+                                         copy=False)
+                for sheet_name, columns in self.sheets.items()}
+
+
+def read_segments(name, segments):
+    """
+    Read the segments of a spilled column as a series.
+    """
+    kind, path, dtype, _, _ = segments[0]
+    if all(segment[0] == 'raw' and segment[1] == path for segment in segments):
+        length = sum(segment[4] for segment in segments)
+        # A plain array viewing the mapped file, so pandas never carries the memmap class into its results
+        values = np.memmap(path, dtype=dtype, mode='r', shape=(length,)).view(np.ndarray) if length else \
+            np.empty(0, dtype=dtype)
+        return pd.Series(values, name=name, copy=False)
+    parts = []
+    for kind, path, dtype, offset, length in segments:
+        if kind == 'raw':
+            parts.append(pd.Series(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,))
+                                   if length else np.empty(0, dtype=dtype), name=name))
+        else:
+            parts.append(pd.read_pickle(path))
+    return pd.concat(parts, ignore_index=True)
+
+
+def spill_workbooks(files, columns=None):
+    """
+    Parse the required sheets of several files straight to disk, chunk by chunk. The headers of every file are
+    validated first.
+
+    Args:
+        files (list): The (source, file_name) of every file, the source being its content or its path.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        list: The SpilledSheets of every file, in the order of the files.
+
+    Raises:
+        SalesFileError: If a required sheet or column is missing from a file.
+    """
+    for source, file_name in files:
+        try:
+            validate_file(source, file_name)
+        except SalesFileError as e:
+            raise SalesFileError(f'{file_name}: {e}' if len(files) > 1 else str(e)) from e
+    return [SpilledSheets(iter_sheet_chunks(source, file_name, columns)) for source, file_name in files]
+
+
+def spill_array(values, directory=None):
+    """
+    Write an array to a .npy file and map it back read only, the file deleted with the mapped array.
+
+    Args:
+        values (np.ndarray): The array.
+        directory (str | None): The directory of the file, None for the temporary directory.
+
+    Returns:
+        np.memmap: The memory-mapped array.
+    """
+    handle, path = tempfile.mkstemp(prefix=SPILL_PREFIX, suffix='.npy', dir=directory)
+    os.close(handle)
+    writer = np.lib.format.open_memmap(path, mode='w+', dtype=values.dtype, shape=values.shape)
+    writer[:] = values
+    writer.flush()
+    del writer
+    mapped = np.load(path, mmap_mode='r')
+    weakref.finalize(mapped, remove_file, path)
+    return mapped
+
+
+def spill_frame(frame, directory=None):
+    """
+    Move the numeric and datetime columns of a frame to memory-mapped files, the other columns kept in memory.
+
+    Args:
+        frame (pd.DataFrame): The frame, e.g. the fact table of a model.
+        directory (str | None): The directory of the files, None for the temporary directory.
+
+    Returns:
+        pd.DataFrame: The frame backed by the files.
+    """
+    columns = {}
+    for col in frame.columns:
+        values = frame[col]
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufmM':
+            values = pd.Series(spill_array(values.to_numpy(), directory), name=col, copy=False)
+        columns[col] = values
+    return pd.DataFrame(columns, copy=False)
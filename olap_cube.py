@@ -0,0 +1,195 @@
+import copy
+import time
+
+import numpy as np
+
+from config import OLAP_CUBE_MAX_CELL_PERCENT
+from filter_index import VALUE_FILTERS
+
+#OLAP立方体: 交易按 月 × 用户画像(年龄, 性别) × 商品 预聚合; 不按客户过滤且日期为整月的状态直接由立方体回答
+
+# The user attributes forming the profile dimension of the cube
+PROFILE_COLUMNS = ['age', 'gender']
+# An inactive cube is checked again once the transactions grew by this factor since its check
+RECHECK_GROWTH = 1.5
+
+
+class OlapCube:
+    """
+    The transactions rolled up at ingest over month x user profile (age and gender) x item, the item
+    implying its season, category and printing. Every cell holds the number of transactions, the number
+    of them with a total, the sum of their totals (amount * price) and the sum of their amounts.
+    """
+
+    def __init__(self, model, months, max_cell_percent=OLAP_CUBE_MAX_CELL_PERCENT):
+        """
+        Args:
+            model (SalesModel): The model to roll up, with its filter index.
+            months (np.ndarray): The month bucket of every transaction (-1 when undated), ascending.
+            max_cell_percent (int): The cube is dropped when it has more cells per 100 transactions, its
+                cells would not be much fewer than the transactions.
+        """
+        started = time.perf_counter()
+        self.max_cell_percent = max_cell_percent
+        self.set_dimensions(model, months)
+        amounts = model.transactions['amount'].to_numpy().astype('float64')
+        totals = amounts * model.items['price'].to_numpy(dtype='float64', na_value=np.nan)[model.item_keys()]
+        self.roll_up(months, self.user_profiles[model.user_keys()], model.item_keys(),
+                     (None, ~np.isnan(totals), np.nan_to_num(totals, nan=0.0), np.nan_to_num(amounts, nan=0.0)))
+        self.build_seconds = time.perf_counter() - started
+
+    def set_dimensions(self, model, months):
+        """
+        Take the time index, months and items of a model and find the profile of every user: the distinct
+        (age, gender) pairs of the users, the profile p is the p-th pair.
+        """
+        self.time_index = model.filter_index.order_date
+        self.months = months
+        self.items = model.items
+        self.transaction_count = len(model)
+        self.user_profiles = model.users.groupby(PROFILE_COLUMNS, dropna=False, observed=True).ngroup().to_numpy()
+        first_users = np.unique(self.user_profiles, return_index=True)[1]
+        self.profiles = model.users[PROFILE_COLUMNS].iloc[first_users].reset_index(drop=True)
+
+    def roll_up(self, months, profiles, items, measures):
+        """
+        Sum measures into the cells of their month, profile and item. The cube is active when the cells are
+        few enough for the transactions.
+
+        Args:
+            months (np.ndarray): The month bucket of every row, -1 when undated.
+            profiles (np.ndarray): The profile of every row.
+            items (np.ndarray): The item key of every row.
+            measures (tuple): The number of transactions (None for one per row), of priced transactions, the
+                sum of the totals and the sum of the amounts of every row.
+
+        Returns:
+            None
+        """
+        # One integer key per cell: the month slot (0 when undated), the profile and the item
+        first_month = int(months[months >= 0].min()) if (months >= 0).any() else 0
+        month_slots = np.where(months >= 0, months.astype(np.int64) - first_month + 1, 0)
+        profile_count, item_count = len(self.profiles), len(self.items)
+        keys = (month_slots * profile_count + profiles) * item_count + items
+        cell_keys, cells = np.unique(keys, return_inverse=True)
+        self.cell_count = len(cell_keys)
+        self.active = self.cell_count * 100 <= self.max_cell_percent * self.transaction_count
+
+        if self.active:
+            slots = cell_keys // (profile_count * item_count)
+            self.cell_month = np.where(slots > 0, slots - 1 + first_month, -1).astype(np.int32)
+            self.cell_profile = ((cell_keys // item_count) % profile_count).astype(np.int32)
+            self.cell_item = (cell_keys % item_count).astype(np.int32)
+            transactions, priced, totals, amounts = measures
+            self.cell_transactions = np.bincount(cells, weights=transactions, minlength=self.cell_count) \
+                .astype(np.int64)
+            self.cell_priced = np.bincount(cells, weights=priced, minlength=self.cell_count)
+            self.cell_total = np.bincount(cells, weights=totals, minlength=self.cell_count)
+            self.cell_amount = np.bincount(cells, weights=amounts, minlength=self.cell_count)
+
+    def extended(self, model, months, first_row):
+        """
+        Roll up the transactions appended to a model from first_row with the cells of the previous ones. An
+        inactive cube is checked again only once the transactions grew by RECHECK_GROWTH since its check.
+
+        Args:
+            model (SalesModel): The model with the appended transactions, users and items.
+            months (np.ndarray): The month bucket of every transaction of the model.
+            first_row (int): The position of the first appended transaction.
+
+        Returns:
+            OlapCube: The cube of the model, this one is unchanged.
+        """
+        if not self.active:
+            if len(model) < self.transaction_count * RECHECK_GROWTH:
+                # Still inactive, its counts those of the check
+                cube = copy.copy(self)
+                cube.time_index, cube.months, cube.items = model.filter_index.order_date, months, model.items
+                return cube
+            return OlapCube(model, months, self.max_cell_percent)
+        started = time.perf_counter()
+        cube = copy.copy(self)
+        cube.set_dimensions(model, months)
+        # The profiles are numbered again with the new users: every previous profile has a previous user
+        renumbered = np.zeros(len(self.profiles), dtype=np.int64)
+        renumbered[self.user_profiles] = cube.user_profiles[:len(self.user_profiles)]
+
+        new_rows = slice(first_row, len(model))
+        item_keys = model.item_keys()[new_rows]
+        amounts = model.transactions['amount'].to_numpy()[new_rows].astype('float64')
+        totals = amounts * model.items['price'].to_numpy(dtype='float64', na_value=np.nan)[item_keys]
+        row_count = len(item_keys)
+        cube.roll_up(np.concatenate([self.cell_month, months[new_rows]]),
+                     np.concatenate([renumbered[self.cell_profile], cube.user_profiles[model.user_keys()[new_rows]]]),
+                     np.concatenate([self.cell_item, item_keys]),
+                     (np.concatenate([self.cell_transactions, np.ones(row_count)]),
+                      np.concatenate([self.cell_priced, ~np.isnan(totals)]),
+                      np.concatenate([self.cell_total, np.nan_to_num(totals, nan=0.0)]),
+                      np.concatenate([self.cell_amount, np.nan_to_num(amounts, nan=0.0)])))
+        cube.build_seconds = time.perf_counter() - started
+        return cube
+
+    @property
+    def nbytes(self):
+        if not self.active:
+            return 0
+        return sum(values.nbytes for values in (self.cell_month, self.cell_profile, self.cell_item,
+                                                self.cell_transactions, self.cell_priced, self.cell_total,
+                                                self.cell_amount))
+
+    def describe(self):
+        """
+        Report the size and the build time of the cube.
+
+        Returns:
+            str: The report.
+        """
+        if not self.active:
+            return (f'OLAP cube not used: {self.cell_count:,} cells for {self.transaction_count:,} transactions '
+                    f'(checked in {self.build_seconds:.2f} s)')
+        return (f'OLAP cube: {self.cell_count:,} cells for {self.transaction_count:,} transactions, '
+                f'{self.nbytes / 2 ** 20:.1f} MB, built in {self.build_seconds:.2f} s')
+
+    def covers_whole_months(self, window):
+        """
+        Check a window of the transactions (sorted by date) starts and ends on a change of month.
+        """
+        if window.start > 0 and self.months[window.start - 1] == self.months[window.start]:
+            return False
+        return window.stop == len(self.months) or self.months[window.stop] != self.months[window.stop - 1]
+
+    def cell_mask(self, state):
+        """
+        Find the cells holding the transactions matching a filter state.
+
+        Args:
+            state (FilterState): The filters.
+
+        Returns:
+            np.ndarray | None: The boolean mask of the cells, None if the cube can't answer the state
+                (a filter on the client names, a date range ending inside a month or no matching date).
+        """
+        if not self.active:
+            return None
+        item_mask = np.ones(len(self.items), dtype=bool)
+        profile_mask = np.ones(len(self.profiles), dtype=bool)
+        for col, field_name in VALUE_FILTERS.items():
+            values = getattr(state, field_name)
+            if not values:
+                continue
+            if col in self.items.columns:
+                item_mask &= self.items[col].isin(values).to_numpy()
+            elif col in PROFILE_COLUMNS:
+                profile_mask &= self.profiles[col].isin(values).to_numpy()
+            else:
+                return None
+        ages = self.profiles['age'].to_numpy(dtype='float64', na_value=np.nan)
+        profile_mask &= (ages >= state.age_range[0]) & (ages <= state.age_range[1])
+
+        mask = item_mask[self.cell_item] & profile_mask[self.cell_profile]
+        if state.start_date is not None or state.end_date is not None:
+            window = self.time_index.window(state.start_date, state.end_date)
+            if window.start == window.stop or not self.covers_whole_months(window):
+                return None
+            mask &= (self.cell_month >= self.months[window.start]) & (self.cell_month <= self.months[window.stop - 1])
+        return mask
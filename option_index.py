@@ -0,0 +1,174 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+#侧边栏选项索引: 每个数据集建一次, 按字母排序的取值和交易数, 前缀二分查找 + 子串搜索返回最佳的前N个匹配
+
+# The attributes selected by the sidebar multiselects
+OPTION_COLUMNS = ['full_name', 'item_name', 'printing', 'category']
+# Sorts after every character, so the values starting with a prefix are below prefix + PREFIX_END
+PREFIX_END = '\U0010ffff'
+
+
+class ColumnOptions:
+    """
+    The distinct values of an attribute referenced by the transactions, sorted alphabetically (ignoring the
+    case), with the number of transactions of every value.
+    """
+
+    def __init__(self, values, counts):
+        """
+        Args:
+            values (np.ndarray): The distinct values.
+            counts (np.ndarray): The number of transactions of every value.
+        """
+        labels = np.asarray([str(value) for value in values], dtype=str)
+        folded = np.char.lower(labels)
+        order = np.argsort(folded, kind='stable')
+        self.values = np.asarray(values, dtype=object)[order]
+        self.counts = np.asarray(counts, dtype=np.int64)[order]
+        self.labels = labels[order]
+        self.folded = folded[order]
+        # The positions of the values from the most sold, the options offered before any search
+        self.by_count = np.argsort(-self.counts, kind='stable')
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.values, self.counts, self.labels, self.folded, self.by_count))
+
+    def merged(self, values, counts):
+        """
+        Add the transactions of appended rows to the counts.
+
+        Args:
+            values (np.ndarray): The distinct values of the appended rows.
+            counts (np.ndarray): The number of appended transactions of every value.
+
+        Returns:
+            ColumnOptions: The options of every row, these ones are unchanged.
+        """
+        totals = pd.Series(np.concatenate([self.counts, counts]),
+                           index=np.concatenate([self.values, np.asarray(values, dtype=object)]))
+        totals = totals.groupby(level=0, sort=False).sum()
+        return ColumnOptions(totals.index.to_numpy(), totals.to_numpy())
+
+    def most_sold(self, positions, limit):
+        """
+        Get the positions of the values with the most transactions, alphabetical among equal counts.
+        """
+        return positions[np.argsort(-self.counts[positions], kind='stable')[:limit]]
+
+    def search(self, text, limit):
+        """
+        Find the values containing a text, ignoring the case. The values starting with the text come first,
+        found by binary search, and the others containing it are only scanned when there are fewer than
+        limit of them; among each, the values with the most transactions come first.
+
+        Args:
+            text (str): The text typed, an empty text matches every value.
+            limit (int): The maximum number of values to return.
+
+        Returns:
+            list: The matching values.
+        """
+        text = text.strip().lower()
+        if not text:
+            return self.values[self.by_count[:limit]].tolist()
+        low, high = np.searchsorted(self.folded, [text, text + PREFIX_END])
+        picked = self.most_sold(np.arange(low, high), limit)
+        if len(picked) < limit:
+            contained = np.flatnonzero(np.char.find(self.folded, text) >= 0)
+            contained = contained[(contained < low) | (contained >= high)]
+            picked = np.concatenate([picked, self.most_sold(contained, limit - len(picked))])
+        return self.values[picked].tolist()
+
+    def find(self, labels):
+        """
+        Get the values whose text is one of some labels (e.g. read from the URL), in the sorted order.
+
+        Args:
+            labels (Iterable): The texts of the values.
+
+        Returns:
+            list: The values found.
+        """
+        return self.values[np.isin(self.labels, list(labels))].tolist()
+
+
+class OptionIndex:
+    """
+    The options of every sidebar multiselect of a model, built once when the model is built.
+    """
+
+    def __init__(self, model):
+        """
+        Args:
+            model (SalesModel): The model to index.
+        """
+        self.columns = {col: self.column_options(model, col) for col in OPTION_COLUMNS
+                        if col in model.users.columns or col in model.items.columns
+                        or col in model.transactions.columns}
+
+    def extended(self, model, first_row):
+        """
+        Count the transactions appended to a model from first_row, the counts of the previous rows kept.
+
+        Args:
+            model (SalesModel): The model with the appended transactions.
+            first_row (int): The position of the first appended transaction.
+
+        Returns:
+            OptionIndex: The options of the model, this index is unchanged.
+        """
+        index = copy.copy(self)
+        new_rows = range(first_row, len(model))
+        index.columns = {}
+        for col, options in self.columns.items():
+            new_options = self.column_options(model, col, new_rows)
+            index.columns[col] = options.merged(new_options.values, new_options.counts)
+        return index
+
+    @property
+    def nbytes(self):
+        return sum(options.nbytes for options in self.columns.values())
+
+    def __getitem__(self, col):
+        return self.columns[col]
+
+    def __contains__(self, col):
+        return col in self.columns
+
+    @staticmethod
+    def column_options(model, col, rows=None):
+        """
+        Count the transactions of every value of an attribute, the values of no transaction left out.
+
+        Args:
+            model (SalesModel): The model.
+            col (str): The attribute.
+            rows (range | None): The counted transactions, None counts every one.
+
+        Returns:
+            ColumnOptions: The options of the attribute.
+        """
+        table_name = model.column_table(col)
+        table = getattr(model, table_name)
+        rows = slice(rows.start, rows.stop) if rows is not None else slice(None)
+        if table_name == 'transactions':
+            table = table.iloc[rows]
+            row_counts = np.ones(len(table), dtype=np.int64)
+        else:
+            keys = model.user_keys() if table_name == 'users' else model.item_keys()
+            row_counts = np.bincount(keys[rows], minlength=len(table))
+        values = table[col]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        codes = values.cat.codes.to_numpy()
+        valid = codes >= 0
+        counts = np.bincount(codes[valid], weights=row_counts[valid], minlength=len(values.cat.categories))
+        sold = counts > 0
+        return ColumnOptions(values.cat.categories.to_numpy()[sold], counts[sold].astype(np.int64))
@@ -0,0 +1,183 @@
+import cProfile
+import json
+import pstats
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import pandas as pd
+
+from cache import estimate_nbytes
+
+#阶段计时: 记录一次重跑中每个阶段的耗时、行数和数据帧内存, 导出为JSON追踪文件; 可选用cProfile剖析一次重跑
+
+# The number of functions reported by a profile, the most expensive by cumulative time
+PROFILE_TOP_FUNCTIONS = 25
+# The process and thread ids of the exported trace events, a trace holds a single rerun
+TRACE_PID, TRACE_TID = 1, 1
+
+
+@dataclass
+class Span:
+    """
+    A timed stage of a rerun.
+
+    Attributes:
+        name (str): The name of the stage.
+        depth (int): The number of stages it is nested in.
+        start (float): The seconds from the start of the trace to the start of the stage.
+        seconds (float): The duration of the stage, None while it runs.
+        rows (int): The rows of the data the stage produced or read, None if not measured.
+        nbytes (int): The memory of the frames the stage produced or read, None if not measured.
+    """
+    name: str
+    depth: int
+    start: float
+    seconds: float = None
+    rows: int = None
+    nbytes: int = None
+
+    def measure(self, rows=None, frames=None):
+        """
+        Record the size of the data of the stage.
+
+        Args:
+            rows (int): The number of rows.
+            frames: The frames (or any value estimate_nbytes measures) held by the stage.
+
+        Returns:
+            None
+        """
+        if rows is not None:
+            self.rows = int(rows)
+        if frames is not None:
+            self.nbytes = estimate_nbytes(frames)
+
+
+class NoSpan:
+    """
+    The span of a stage when no trace is recorded, measuring nothing (the frames are never walked).
+    """
+
+    def measure(self, rows=None, frames=None):
+        pass
+
+
+# The span yielded by span() without a trace
+NO_SPAN = NoSpan()
+
+
+class Trace:
+    """
+    The spans of the stages of one rerun, in their start order, nested like the stages.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time a stage, the stages started inside it are nested in it.
+
+        Args:
+            name (str): The name of the stage.
+
+        Yields:
+            Span: The span, to record the rows and the memory of the stage.
+        """
+        record = Span(name=name, depth=self.depth, start=time.perf_counter() - self.started)
+        self.spans.append(record)
+        self.depth += 1
+        try:
+            yield record
+        finally:
+            self.depth -= 1
+            record.seconds = time.perf_counter() - self.started - record.start
+
+    def total_seconds(self):
+        """
+        Get the time of the outermost stages.
+        """
+        return sum(span.seconds or 0.0 for span in self.spans if span.depth == 0)
+
+    def frame(self):
+        """
+        Get the spans as a table: the stage (indented by its nesting), its time in ms, its rows and its MB.
+
+        Returns:
+            pd.DataFrame: One row per span.
+        """
+        return pd.DataFrame({
+            'stage': [' ' * span.depth + span.name for span in self.spans],
+            'ms': [round(span.seconds * 1000, 1) if span.seconds is not None else None for span in self.spans],
+            'rows': pd.array([span.rows for span in self.spans], dtype='Int64'),
+            'MB': [round(span.nbytes / 2 ** 20, 2) if span.nbytes is not None else None for span in self.spans],
+        })
+
+    def to_json(self):
+        """
+        Export the spans in the Trace Event Format, the JSON read by chrome://tracing and Perfetto.
+
+        Returns:
+            str: The trace.
+        """
+        events = []
+        for span in self.spans:
+            args = {key: value for key, value in (('rows', span.rows), ('bytes', span.nbytes)) if value is not None}
+            events.append({'name': span.name, 'cat': 'dashboard', 'ph': 'X', 'pid': TRACE_PID, 'tid': TRACE_TID,
+                           'ts': round(span.start * 1e6, 1), 'dur': round((span.seconds or 0.0) * 1e6, 1),
+                           'args': args})
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, indent=1)
+
+
+@contextmanager
+def span(trace, name):
+    """
+    Time a stage in a trace, or do nothing without a trace.
+
+    Args:
+        trace (Trace): The trace of the rerun, None when not tracing.
+        name (str): The name of the stage.
+
+    Yields:
+        Span | NoSpan: The span, to record the rows and the memory of the stage.
+    """
+    if trace is None:
+        yield NO_SPAN
+        return
+    with trace.span(name) as record:
+        yield record
+
+
+def top_functions(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """
+    Get the most expensive functions of a profile.
+
+    Args:
+        profiler (cProfile.Profile): The stopped profiler.
+        limit (int): The number of functions.
+
+    Returns:
+        pd.DataFrame: The function, its calls, its own time and its cumulative time (with the functions it
+            calls) in ms, by descending cumulative time.
+    """
+    stats = pstats.Stats(profiler).stats
+    rows = [(pstats.func_std_string(function), calls, own * 1000, cumulative * 1000)
+            for function, (_, calls, own, cumulative, _) in stats.items()]
+    frame = pd.DataFrame(rows, columns=['function', 'calls', 'own ms', 'cumulative ms'])
+    return frame.sort_values('cumulative ms', ascending=False).head(limit).round(1).reset_index(drop=True)
+
+
+def start_profiler():
+    """
+    Start profiling the functions called from now on.
+
+    Returns:
+        cProfile.Profile: The running profiler.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
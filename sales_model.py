@@ -0,0 +1,660 @@
+import datetime
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from config import OLAP_CUBE_MAX_CELL_PERCENT
+from filter_index import FilterIndex
+from join_engine import JoinReport, join_delta, join_star_schema, key_codes
+from olap_cube import OlapCube
+from option_index import OptionIndex
+from schema import normalize_column_name
+
+#星型模型: 交易事实表 + 用户/商品维度表, 宽表只为需要显示的行构建
+
+# The fact table columns pointing to the row position of the dimensions
+USER_KEY = 'user_key'
+ITEM_KEY = 'item_key'
+# The fact table column pointing to the row of the partition (source file and year) of the transaction
+PARTITION_KEY = 'partition_key'
+# The text attributes stored dictionary-encoded (categorical: the distinct values once, small integer codes per row)
+CATEGORICAL_COLUMNS = ['full_name', 'gender', 'item_name', 'category', 'item_tags', 'season', 'printing']
+# The integer time buckets of the order date, added to the fact table at ingest: the day and the week (starting
+# on Monday) as proleptic Gregorian ordinals, the month as year * 12 + month - 1 and the year
+TIME_BUCKET_COLUMNS = {'day': 'order_day', 'week': 'order_week', 'month': 'order_month', 'year': 'order_year'}
+# The time bucket of an undated transaction
+MISSING_TIME_BUCKET = -1
+# The proleptic Gregorian ordinal of 1970-01-01, the day 0 of datetime64
+EPOCH_ORDINAL = 719163
+# The rows of a new fact storage, as a multiple of the rows it holds: the spare rows take the next deltas
+FACT_STORAGE_GROWTH = 2
+
+
+@dataclass
+class SalesModel:
+    """
+    The sales data as a star schema: the transactions fact table holds the measures and the row positions
+    of their users and items in the dimension tables.
+
+    Attributes:
+        transactions (pd.DataFrame): The fact table (user_key, item_key, amount, order_date, ...), sorted by order date.
+        users (pd.DataFrame): The users dimension (user_id, full_name, gender, age, ...).
+        items (pd.DataFrame): The items dimension (item_id, item_name, category, price, ...).
+        join_report (JoinReport): The duplicate keys and orphan transactions found by the join.
+        filter_index (FilterIndex): The time index, bitmaps and sorted positions resolving the sidebar filters.
+        cube (OlapCube): The transactions pre-aggregated for the charts, None when disabled.
+        option_index (OptionIndex): The sorted, searchable values of the sidebar multiselects.
+        partitions (pd.DataFrame): The source file, year, number of transactions and first and last order
+            date of every partition of the transactions.
+        dataset_key (str): The token of the loaded file and columns, set by the loader; it keys the
+            caches of the results computed from this data.
+        fact_storage (FactStorage): The arrays the fact table is a view of, once a delta was appended in
+            order; None when the fact table holds its own columns.
+    """
+    transactions: pd.DataFrame
+    users: pd.DataFrame
+    items: pd.DataFrame
+    join_report: JoinReport = field(default_factory=JoinReport)
+    filter_index: FilterIndex = field(default=None, repr=False)
+    cube: OlapCube = field(default=None, repr=False)
+    option_index: OptionIndex = field(default=None, repr=False)
+    partitions: pd.DataFrame = field(default=None, repr=False)
+    dataset_key: str = None
+    fact_storage: 'FactStorage' = field(default=None, repr=False)
+
+    def __len__(self):
+        return len(self.transactions)
+
+    @property
+    def empty(self):
+        return self.transactions.empty
+
+    def user_keys(self):
+        return self.transactions[USER_KEY].to_numpy()
+
+    def item_keys(self):
+        return self.transactions[ITEM_KEY].to_numpy()
+
+    def column_table(self, col):
+        """
+        Find the table holding a column.
+
+        Args:
+            col (str): The column name.
+
+        Returns:
+            str: 'transactions', 'users' or 'items'.
+
+        Raises:
+            KeyError: If no table has the column.
+        """
+        for table_name in ('transactions', 'users', 'items'):
+            if col in getattr(self, table_name).columns:
+                return table_name
+        raise KeyError(col)
+
+    def column(self, col, rows=None):
+        """
+        Get a column aligned to the fact rows, dimension attributes are looked up by position.
+
+        Args:
+            col (str): The column name.
+            rows (range | np.ndarray | None): The positions of the fact rows, None takes every row. The fact
+                columns of a range (e.g. a date window) are sliced without being copied.
+
+        Returns:
+            pd.Series: The column values of the rows.
+        """
+        table_name = self.column_table(col)
+        rows = row_indexer(rows)
+        if table_name == 'transactions':
+            values = self.transactions[col]
+            if rows is None:
+                return values.reset_index(drop=True)
+            values = values.iloc[rows] if isinstance(rows, slice) else values.take(rows)
+            return values.reset_index(drop=True)
+        keys = self.user_keys() if table_name == 'users' else self.item_keys()
+        if rows is not None:
+            keys = keys[rows]
+        return getattr(self, table_name)[col].take(keys).reset_index(drop=True)
+
+    def wide_view(self, rows=None, columns=None):
+        """
+        Build the wide (merged) frame of some fact rows.
+
+        Args:
+            rows (range | np.ndarray | None): The positions of the fact rows, None builds every row.
+            columns (list | None): The columns of the frame, None takes every column except the keys and
+                the time buckets.
+
+        Returns:
+            pd.DataFrame: The wide frame, one row per selected transaction.
+        """
+        if columns is None:
+            columns = [col for table in (self.users, self.transactions, self.items) for col in table.columns
+                       if col not in (USER_KEY, ITEM_KEY, PARTITION_KEY) and col not in TIME_BUCKET_COLUMNS.values()]
+            columns = list(dict.fromkeys(columns))
+        return pd.DataFrame({col: self.column(col, rows) for col in columns})
+
+    @property
+    def order_date_bounds(self):
+        """
+        The first and last order dates (None without any dated transaction), the bounds of the date pickers.
+        """
+        return self.filter_index.order_date.bounds
+
+    def partitions_in_range(self, start_date=None, end_date=None):
+        """
+        Find the partitions holding orders of a date range, the others are outside the window of rows
+        the range selects and are never read.
+
+        Args:
+            start_date (datetime.date | None): The first order date, None for no lower bound.
+            end_date (datetime.date | None): The last order date, None for no upper bound.
+
+        Returns:
+            pd.DataFrame: The partitions in the range.
+        """
+        return partitions_in_range(self.partitions, start_date, end_date)
+
+    def referenced_values(self, col):
+        """
+        Get the distinct values of a column among the rows referenced by the transactions,
+        e.g. the names of the clients who bought something.
+
+        Args:
+            col (str): The column name.
+
+        Returns:
+            np.ndarray: The distinct values.
+        """
+        table_name = self.column_table(col)
+        if table_name == 'transactions':
+            return self.transactions[col].unique()
+        keys = self.user_keys() if table_name == 'users' else self.item_keys()
+        table = getattr(self, table_name)
+        referenced = np.bincount(keys, minlength=len(table)) > 0
+        return table[col][referenced].unique()
+
+
+class FactStorage:
+    """
+    The columns of a fact table in arrays with spare rows at their end, the fact table of a model a read
+    only view of their first rows. Only the model of the last length appends in place, a delta appended to
+    an older model copies its rows to new arrays.
+    """
+
+    def __init__(self, transactions, capacity):
+        """
+        Args:
+            transactions (pd.DataFrame): The fact table to store.
+            capacity (int): The number of rows of the arrays, at least the rows of the fact table.
+        """
+        self.length = len(transactions)
+        self.capacity = capacity
+        self.columns = {}
+        for col in transactions.columns:
+            self.columns[col] = np.empty(capacity, dtype=transactions[col].dtype)
+            self.columns[col][:self.length] = transactions[col].to_numpy()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def can_store(transactions, delta):
+        """
+        Check the rows of a delta can be written after a fact table: the same columns, of the same NumPy
+        dtypes (an extension dtype or a delta changing a dtype is concatenated by pandas instead).
+        """
+        return (list(delta.columns) == list(transactions.columns)
+                and all(isinstance(dtype, np.dtype) and dtype.kind in 'biufmM' and delta[col].dtype == dtype
+                        for col, dtype in transactions.dtypes.items()))
+
+    def frame(self, length):
+        """
+        Get the fact table of the first rows, a view of the arrays.
+        """
+        columns = {}
+        for col, values in self.columns.items():
+            view = values[:length]
+            view.flags.writeable = False
+            columns[col] = view
+        return pd.DataFrame(columns, copy=False)
+
+    def write(self, delta):
+        """
+        Write the rows of a delta after the stored ones, the caller holding the lock and the spare rows
+        holding the delta.
+        """
+        end = self.length + len(delta)
+        for col, values in self.columns.items():
+            values[self.length:end] = delta[col].to_numpy()
+        self.length = end
+
+
+def append_fact_rows(model, delta):
+    """
+    Append the rows of a delta to the fact table of a model: written to the spare rows of its fact storage
+    when the model is the last one appended to it, otherwise copied with the delta to a new storage twice
+    their size.
+
+    Args:
+        model (SalesModel): The model, unchanged.
+        delta (pd.DataFrame): The rows to append, with the columns of the fact table.
+
+    Returns:
+        tuple: The fact table with the delta and its fact storage (None when the rows can't be stored and
+            were concatenated).
+    """
+    transactions = model.transactions
+    if not FactStorage.can_store(transactions, delta):
+        return pd.concat([transactions, delta], ignore_index=True), None
+    storage = model.fact_storage
+    if storage is not None:
+        with storage.lock:
+            if storage.length == len(transactions) and storage.length + len(delta) <= storage.capacity:
+                storage.write(delta)
+                return storage.frame(storage.length), storage
+    storage = FactStorage(transactions, FACT_STORAGE_GROWTH * (len(transactions) + len(delta)))
+    storage.write(delta)
+    return storage.frame(storage.length), storage
+
+
+def row_indexer(rows):
+    """
+    Convert a range of fact rows to the equivalent slice, and a lazy row selection (the rows queried on use
+    by the SQL backend) to an array. The other row selections are kept.
+    """
+    if isinstance(rows, range) and rows.step == 1:
+        return slice(rows.start, rows.stop)
+    if rows is None or isinstance(rows, (np.ndarray, range, list)):
+        return rows
+    return np.asarray(rows)
+
+
+def row_positions(rows):
+    """
+    Get the fact row positions of a row selection as an array, a range becoming the equivalent arange.
+    """
+    if isinstance(rows, range):
+        return np.arange(rows.start, rows.stop, rows.step)
+    return np.asarray(rows)
+
+
+def convert_birth_date_to_age_column(main_data_frame):
+    # Convert birth_date column to datetime
+    main_data_frame['birth_date'] = pd.to_datetime(main_data_frame['birth_date'])
+
+    # Calculate age based on birthdate
+    current_year = datetime.datetime.now().year
+    main_data_frame['age'] = current_year - main_data_frame['birth_date'].dt.year
+
+    return main_data_frame
+
+
+def encode_columns(data_frame):
+    """
+    Dictionary-encode the text attributes as categoricals and store the age as a narrow integer.
+
+    Args:
+        data_frame (pd.DataFrame): A dimension table.
+
+    Returns:
+        pd.DataFrame: The encoded table.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col in data_frame.columns:
+            data_frame[col] = data_frame[col].astype('category')
+    if 'age' in data_frame.columns:
+        # A missing birth date leaves a missing age, which only a float can hold
+        data_frame['age'] = data_frame['age'].astype('int16' if data_frame['age'].notna().all() else 'float32')
+    return data_frame
+
+
+def clean_sheets(df):
+    """
+    Clean the column names and the types of the sheets before they are joined.
+
+    Args:
+        df (dict): The sheet name to data frame mapping.
+
+    Returns:
+        dict: The cleaned sheets.
+    """
+    # Shallow copies: the sheets are held by the ingestion cache and read by the other sessions
+    return {sheet_name: clean_sheet(sheet_name, data_frame.copy(deep=False)) for sheet_name, data_frame in df.items()}
+
+
+def clean_sheet(sheet_name, data_frame):
+    """
+    Clean the column names and the types of a sheet (or of a chunk of its rows), in place.
+
+    Args:
+        sheet_name (str): 'users', 'transactions' or 'items'.
+        data_frame (pd.DataFrame): The rows of the sheet.
+
+    Returns:
+        pd.DataFrame: The cleaned rows.
+    """
+    # Convert column names to strings and then apply transformations 列名处理方式，确保能处理各种格式的Excel文件
+    data_frame.columns = [normalize_column_name(col) for col in data_frame.columns]
+
+    # Ensure data types are correct before merging  (合并前的数据类型转换和验证)
+    if sheet_name == 'users' and 'birth_date' in data_frame.columns:
+        data_frame['birth_date'] = pd.to_datetime(data_frame['birth_date'])
+    if sheet_name == 'transactions':
+        if 'order_date' in data_frame.columns:
+            data_frame['order_date'] = pd.to_datetime(data_frame['order_date'])
+        data_frame['amount'] = pd.to_numeric(data_frame['amount'], errors='coerce')
+    if sheet_name == 'items' and 'price' in data_frame.columns:
+        data_frame['price'] = pd.to_numeric(data_frame['price'], errors='coerce')
+    return data_frame
+
+
+def sort_by_order_date(transactions):
+    """
+    Sort the fact table by order date, the undated transactions last. The sort is stable, so the
+    transactions of a same date keep the order of the sheet.
+
+    Args:
+        transactions (pd.DataFrame): The fact table.
+
+    Returns:
+        pd.DataFrame: The sorted fact table, with a default index.
+    """
+    if transactions['order_date'].is_monotonic_increasing:
+        return transactions
+    return transactions.sort_values('order_date', kind='stable', na_position='last', ignore_index=True)
+
+
+def add_time_buckets(transactions):
+    """
+    Add the day, week, month and year of the order date to the fact table as integer columns, computed once
+    so grouping by a period never parses or converts the dates again.
+
+    Args:
+        transactions (pd.DataFrame): The fact table.
+
+    Returns:
+        pd.DataFrame: The fact table with the TIME_BUCKET_COLUMNS.
+    """
+    dates = transactions['order_date'].to_numpy()
+    missing = np.isnat(dates)
+    days = dates.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+    months = dates.astype('datetime64[M]').astype(np.int64) + 1970 * 12
+    buckets = {'day': days, 'week': (days - 1) // 7, 'month': months, 'year': months // 12}
+    for period, col in TIME_BUCKET_COLUMNS.items():
+        transactions[col] = np.where(missing, MISSING_TIME_BUCKET, buckets[period]).astype(np.int32)
+    return transactions
+
+
+def month_bucket_dates(buckets):
+    """
+    Convert month buckets (year * 12 + month - 1) to the date of the first day of the month.
+
+    Args:
+        buckets (np.ndarray): The month buckets.
+
+    Returns:
+        np.ndarray: The datetime64 first days of the months.
+    """
+    return (np.asarray(buckets, dtype=np.int64) - 1970 * 12).astype('datetime64[M]').astype('datetime64[ns]')
+
+
+def join_workbook(df):
+    """
+    Clean the sheets of a workbook and link its transactions to its users and items.
+
+    Args:
+        df (dict): The sheet name to data frame mapping (users, transactions and items).
+
+    Returns:
+        tuple: The fact table, the users and items tables (not encoded yet) and the JoinReport.
+    """
+    sheet_dict = clean_sheets(df)
+    users = sheet_dict['users'].reset_index(drop=True)
+    items = sheet_dict['items'].reset_index(drop=True)
+    if 'birth_date' in users.columns:
+        users = convert_birth_date_to_age_column(users)
+    transactions, join_report = join_star_schema(sheet_dict['transactions'], users, items, USER_KEY, ITEM_KEY)
+    return transactions, users, items, join_report
+
+
+def add_partitions(transactions, sources, source_names):
+    """
+    Assign every transaction to the partition of its source file and order year.
+
+    Args:
+        transactions (pd.DataFrame): The fact table, sorted by order date, with its time buckets.
+        sources (np.ndarray): The position of the source file of every transaction.
+        source_names (list): The name of every source file.
+
+    Returns:
+        tuple: The fact table with the PARTITION_KEY column and the partitions table.
+    """
+    years = transactions[TIME_BUCKET_COLUMNS['year']].to_numpy().astype(np.int64)
+    # One partition per year and source, ordered by year (the undated transactions last)
+    year_slots = np.where(years == MISSING_TIME_BUCKET, years.max(initial=0) + 1, years)
+    partition_keys, partition_codes = np.unique(year_slots * len(source_names) + sources, return_inverse=True)
+    transactions[PARTITION_KEY] = partition_codes.astype(np.int16)
+
+    dates = transactions['order_date']
+    first_rows = np.unique(partition_codes, return_index=True)[1]
+    partitions = pd.DataFrame({
+        'source': [source_names[source] for source in sources[first_rows]],
+        'year': years[first_rows],
+        'transactions': np.bincount(partition_codes, minlength=len(partition_keys)),
+        'first_date': dates.groupby(partition_codes).min().to_numpy(),
+        'last_date': dates.groupby(partition_codes).max().to_numpy(),
+    })
+    return transactions, partitions
+
+
+def partitions_in_range(partitions, start_date=None, end_date=None):
+    """
+    Select the partitions holding orders of a date range.
+
+    Args:
+        partitions (pd.DataFrame): The partitions, with their first_date and last_date.
+        start_date (datetime.date | None): The first order date, None for no lower bound.
+        end_date (datetime.date | None): The last order date, None for no upper bound.
+
+    Returns:
+        pd.DataFrame: The partitions in the range.
+    """
+    in_range = np.ones(len(partitions), dtype=bool)
+    if start_date is not None:
+        in_range &= (partitions['last_date'] >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        in_range &= (partitions['first_date'] < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy()
+    return partitions[in_range]
+
+
+def build_sales_model(df, source_name=''):
+    """
+    Build the star schema model of the sheets of a single workbook.
+
+    Args:
+        df (dict): The sheet name to data frame mapping (users, transactions and items).
+        source_name (str): The name of the workbook.
+
+    Returns:
+        SalesModel: The model.
+    """
+    return build_partitioned_sales_model([(source_name, df)])
+
+
+def build_partitioned_sales_model(workbooks, spill=None):
+    """
+    Build the star schema model of the sheets of one or several workbooks (e.g. one per year), each workbook
+    joined on its own keys and a partition of the model. The transactions are sorted by order date and get
+    the day, week, month and year buckets of their order.
+
+    Args:
+        workbooks (list): The (source name, sheet name to data frame mapping) of every workbook.
+        spill (callable | None): Moves the fact table out of memory (e.g. memory_budget.spill_frame) before
+            it is indexed, None keeps it in memory.
+
+    Returns:
+        SalesModel: The model.
+    """
+    joined = [join_workbook(df) for _, df in workbooks]
+    user_offsets = np.cumsum([0] + [len(users) for _, users, _, _ in joined])
+    item_offsets = np.cumsum([0] + [len(items) for _, _, items, _ in joined])
+    for index, (transactions, _, _, _) in enumerate(joined):
+        transactions[USER_KEY] += user_offsets[index]
+        transactions[ITEM_KEY] += item_offsets[index]
+    sources = np.repeat(np.arange(len(joined)), [len(transactions) for transactions, _, _, _ in joined])
+    users = encode_columns(stack_tables([users for _, users, _, _ in joined]))
+    items = encode_columns(stack_tables([items for _, _, items, _ in joined]))
+    transactions = stack_tables([transactions for transactions, _, _, _ in joined])
+    join_report = JoinReport(**{name: sum(getattr(report, name) for _, _, _, report in joined)
+                                for name in JoinReport.__dataclass_fields__})
+
+    # The joined tables of every workbook are released once stacked
+    del joined
+    return index_sales_model(transactions, sources, [name for name, _ in workbooks], users, items, join_report,
+                             spill)
+
+
+def index_sales_model(transactions, sources, source_names, users, items, join_report, spill=None):
+    """
+    Sort the joined transactions by order date, add their time buckets and partitions and build the
+    indexes of the model.
+
+    Args:
+        transactions (pd.DataFrame): The fact table, its keys pointing to the rows of users and items.
+        sources (np.ndarray): The position of the source file of every transaction.
+        source_names (list): The name of every source file.
+        users (pd.DataFrame): The encoded users table.
+        items (pd.DataFrame): The encoded items table.
+        join_report (JoinReport): The unmatched rows of the joins.
+        spill (callable | None): Moves the fact table out of memory before it is indexed, the indexes
+            then read the moved columns. None keeps it in memory.
+
+    Returns:
+        SalesModel: The model.
+    """
+    # Sort the transactions by date, keeping the source file of every transaction
+    transactions['_source'] = sources
+    transactions = add_time_buckets(sort_by_order_date(transactions))
+    sources = transactions.pop('_source').to_numpy()
+    transactions, partitions = add_partitions(transactions, sources, source_names)
+    if spill is not None:
+        transactions = spill(transactions)
+
+    model = SalesModel(transactions=transactions, users=users, items=items, join_report=join_report,
+                       partitions=partitions)
+    model.filter_index = FilterIndex(model)
+    model.option_index = OptionIndex(model)
+    if OLAP_CUBE_MAX_CELL_PERCENT > 0:
+        model.cube = OlapCube(model, transactions[TIME_BUCKET_COLUMNS['month']].to_numpy())
+    return model
+
+
+def stack_tables(tables):
+    """
+    Stack the tables of the workbooks, a single table is kept as is.
+    """
+    if len(tables) == 1:
+        return tables[0]
+    return pd.concat(tables, ignore_index=True)
+
+
+def append_dimension(table, delta, key_column):
+    """
+    Append the new rows of a delta sheet to an encoded dimension table. The rows whose key is already in
+    the table, repeated in the delta or missing are dropped, and the new categorical values are added after
+    the known ones.
+
+    Args:
+        table (pd.DataFrame): The users or items table of a model.
+        delta (pd.DataFrame | None): The cleaned users or items sheet of the delta, None if it has none.
+        key_column (str): user_id or item_id.
+
+    Returns:
+        tuple: The table with the new rows and the number of dropped delta rows.
+    """
+    if delta is None or delta.empty:
+        return table, 0
+    if 'birth_date' in delta.columns:
+        delta = convert_birth_date_to_age_column(delta)
+    table_codes, delta_codes = key_codes(table[key_column], delta[key_column])
+    first_rows = np.unique(delta_codes, return_index=True)[1]
+    new_rows = first_rows[(delta_codes[first_rows] >= 0) & ~np.isin(delta_codes[first_rows], table_codes)]
+    new_rows.sort()
+    delta = delta.take(new_rows).reindex(columns=table.columns).reset_index(drop=True)
+
+    for col in table.columns:
+        if isinstance(table[col].dtype, pd.CategoricalDtype):
+            known = table[col].cat.categories
+            values = pd.Index(delta[col].dropna().unique())
+            table = table.assign(**{col: table[col].cat.add_categories(values[~values.isin(known)])})
+            delta[col] = delta[col].astype(table[col].dtype)
+    appended = pd.concat([table, delta], ignore_index=True)
+    if 'age' in appended.columns:
+        appended['age'] = appended['age'].astype('float32')
+        appended = encode_columns(appended)
+    return appended, len(delta_codes) - len(new_rows)
+
+
+def append_delta(model, df, source_name='', spill=None):
+    """
+    Append the sheets of a delta file (new transactions, and the new users and items they reference) to a
+    model without reloading it. A delta ordered after the loaded transactions is written after the fact
+    table and only its rows are indexed, a delta going back in time is merged and the model indexed again.
+    The model is not modified.
+
+    Args:
+        model (SalesModel): The loaded model.
+        df (dict): The sheet name to data frame mapping of the delta (transactions, optionally users and items).
+        source_name (str): The name of the delta file, the source of its partitions.
+        spill (callable | None): Moves the extended fact table out of memory before it is indexed, None
+            keeps it in memory.
+
+    Returns:
+        SalesModel: The model with the delta, its dataset_key left for the loader to set.
+    """
+    sheet_dict = clean_sheets(df)
+    users, duplicate_users = append_dimension(model.users, sheet_dict.get('users'), 'user_id')
+    items, duplicate_items = append_dimension(model.items, sheet_dict.get('items'), 'item_id')
+    delta, user_orphans, item_orphans = join_delta(sheet_dict['transactions'], users, items, USER_KEY, ITEM_KEY)
+    join_report = JoinReport(
+        duplicate_user_ids=model.join_report.duplicate_user_ids + duplicate_users,
+        duplicate_item_ids=model.join_report.duplicate_item_ids + duplicate_items,
+        orphan_user_transactions=model.join_report.orphan_user_transactions + user_orphans,
+        orphan_item_transactions=model.join_report.orphan_item_transactions + item_orphans,
+    )
+    # The delta gets the fact columns of the model, the ones it lacks missing
+    fact_columns = [col for col in model.transactions.columns
+                    if col != PARTITION_KEY and col not in TIME_BUCKET_COLUMNS.values()]
+    delta = delta.reindex(columns=fact_columns)
+    delta = delta.astype({USER_KEY: model.transactions[USER_KEY].dtype, ITEM_KEY: model.transactions[ITEM_KEY].dtype})
+    delta = add_time_buckets(sort_by_order_date(delta))
+
+    if not model.filter_index.order_date.appends_in_order(delta['order_date'].to_numpy()):
+        # The delta goes back in time: merge it and index the model again
+        source_names = list(dict.fromkeys([*model.partitions['source'], source_name]))
+        sources = pd.Index(source_names).get_indexer(model.partitions['source'])[model.transactions[PARTITION_KEY]]
+        transactions = pd.concat([model.transactions.drop(columns=PARTITION_KEY), delta], ignore_index=True)
+        sources = np.concatenate([sources, np.full(len(delta), source_names.index(source_name))])
+        return index_sales_model(transactions, sources, source_names, users, items, join_report, spill)
+
+    first_row = len(model)
+    delta, delta_partitions = add_partitions(delta, np.zeros(len(delta), dtype=np.int64), [source_name])
+    delta[PARTITION_KEY] += len(model.partitions)
+    if spill is not None:
+        # A fact table over the memory budget is written to new memory-mapped files
+        transactions, fact_storage = spill(pd.concat([model.transactions, delta], ignore_index=True)), None
+    else:
+        transactions, fact_storage = append_fact_rows(model, delta)
+    partitions = pd.concat([model.partitions, delta_partitions], ignore_index=True)
+
+    appended = SalesModel(transactions=transactions, users=users, items=items, join_report=join_report,
+                          partitions=partitions, fact_storage=fact_storage)
+    appended.filter_index = model.filter_index.extended(appended, first_row)
+    appended.option_index = model.option_index.extended(appended, first_row)
+    if model.cube is not None:
+        appended.cube = model.cube.extended(appended, transactions[TIME_BUCKET_COLUMNS['month']].to_numpy(),
+                                            first_row)
+    return appended
@@ -5,9 +5,9 @@ import plotly.express as px
 GRAPH_WIDTH = 550
 
 #散点图
-def create_scatter_plot2(data_frame):
-    # Group by age and sum the total spend
-    grouped_df = data_frame.groupby(['age', 'gender'])['total'].sum().reset_index()
+def create_scatter_plot2(aggregates):
+    # The total spend per age and gender
+    grouped_df = aggregates.age_gender_totals
 
     # Define color mapping for male and female
     color_mapping = {'male': 'blue', 'female': 'red'}
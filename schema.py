@@ -0,0 +1,120 @@
+#数据结构定义 (工作表, 连接键, 列名)
+
+# The sheets every uploaded workbook must contain
+REQUIRED_SHEETS = ['users', 'transactions', 'items']
+# The keys the sheets are joined on
+JOIN_KEYS = ['user_id', 'item_id']
+# The columns each sheet must have to be merged (the other columns are optional)
+SHEET_KEY_COLUMNS = {
+    'users': ['user_id'],
+    'transactions': ['user_id', 'item_id', 'amount'],
+    'items': ['item_id', 'price'],
+}
+# The columns each sheet of a delta file must have: its transactions are appended by order date
+DELTA_KEY_COLUMNS = {**SHEET_KEY_COLUMNS, 'transactions': SHEET_KEY_COLUMNS['transactions'] + ['order_date']}
+# The error shown when a required sheet is missing
+MISSING_SHEETS_MESSAGE = "Error: The Excel file must contain sheets named: 'users', 'transactions', and 'items'"
+# The error shown when a delta file has no transactions sheet
+MISSING_DELTA_SHEET_MESSAGE = "Error: The delta file must contain a sheet named 'transactions' (and optionally 'users' and 'items' with the new rows)"
+# The projected columns computed from other columns of the sheets (age is computed from birth_date)
+DERIVED_COLUMNS = {'age': ['birth_date']}
+
+
+def normalize_column_name(col):
+    """
+    Normalize a column name (remove any whitespace and convert to lowercase).
+
+    Args:
+        col: The column name as found in the file.
+
+    Returns:
+        str: The normalized column name.
+    """
+    return str(col).strip().lower()
+
+
+def has_required_sheets(sheet_names):
+    """
+    Check the file contains all the required sheets.
+
+    Args:
+        sheet_names (Iterable[str]): The names of the sheets in the file.
+
+    Returns:
+        bool: True if every required sheet exists.
+    """
+    sheet_names = set(sheet_names)
+    return all(sheet in sheet_names for sheet in REQUIRED_SHEETS)
+
+
+def find_header_error(headers):
+    """
+    Check the header of every sheet before any data is parsed.
+
+    Args:
+        headers (dict): The sheet name to column names mapping.
+
+    Returns:
+        str | None: The error message to show, the same one the merge would fail with, or None if valid.
+    """
+    if not has_required_sheets(headers.keys()):
+        return MISSING_SHEETS_MESSAGE
+    for sheet_name, key_columns in SHEET_KEY_COLUMNS.items():
+        names = {normalize_column_name(name) for name in headers[sheet_name]}
+        for col in key_columns:
+            if col not in names:
+                return f"Error merging sheets: '{col}'"
+    return None
+
+
+def find_delta_header_error(headers):
+    """
+    Check the header of every sheet of a delta file before any data is parsed: the transactions sheet is
+    required, the users and items sheets only hold the new rows and are optional.
+
+    Args:
+        headers (dict): The sheet name to column names mapping.
+
+    Returns:
+        str | None: The error message to show, or None if valid.
+    """
+    if 'transactions' not in headers:
+        return MISSING_DELTA_SHEET_MESSAGE
+    for sheet_name, key_columns in DELTA_KEY_COLUMNS.items():
+        names = {normalize_column_name(name) for name in headers.get(sheet_name, key_columns)}
+        for col in key_columns:
+            if col not in names:
+                return f"Error appending the '{sheet_name}' sheet: '{col}' is missing"
+    return None
+
+
+def required_columns(projection):
+    """
+    Get the source columns needed to build the projection: the projected columns, the columns
+    the derived ones are computed from and the join keys.
+
+    Args:
+        projection (list): The columns projected in the dashboard.
+
+    Returns:
+        set: The normalized names of the columns to read from the sheets.
+    """
+    columns = set(JOIN_KEYS)
+    for col in projection:
+        col = normalize_column_name(col)
+        columns.update(DERIVED_COLUMNS.get(col, [col]))
+    return columns
+
+
+def select_columns(names, columns):
+    """
+    Select the names of the columns to read out of the names found in a sheet.
+
+    Args:
+        names (Iterable): The column names of the sheet.
+        columns (set | None): The normalized names to keep, None keeps every column.
+
+    Returns:
+        list: The original names of the kept columns, in the sheet order.
+    """
+    return [name for name in names if columns is None or normalize_column_name(name) in columns]
@@ -1,206 +1,285 @@
-import streamlit as st
-import pandas as pd
-
+import datetime
 
-#侧边栏组件(过滤器和控制选项)
-def sidebar_config(data_frame):
+import streamlit as st
+from config import OPTION_SEARCH_LIMIT
+from filter_index import FilterState
+
+# The default range of the ages slider
+DEFAULT_AGE_RANGE = [8, 90]
+# The values of the gender and season checkboxes
+GENDER_VALUES = ['male', 'female']
+SEASON_VALUES = ['fall/winter', 'spring/summer']
+# The query parameter value of a group of checkboxes all unchecked (no parameter means all checked)
+NO_VALUE_PARAM = 'none'
+# Session key of the filters read from the URL query parameters, per dataset
+URL_FILTERS_KEY = 'url_filters'
+
+
+#侧边栏组件(过滤器和控制选项), 过滤状态与URL查询参数双向同步
+def sidebar_config(model):
     """
-       Configure the sidebar for filtering options and generate a filtered DataFrame.
+       Configure the sidebar for filtering options. The filters are read from the URL query parameters
+       the first time a dataset is shown, and written back to them on every rerun.
 
        Args:
-           data_frame (pd.DataFrame): The original DataFrame containing the data.
+           model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing the data.
 
        Returns:
-           pd.DataFrame: The filtered DataFrame based on the sidebar selections.
+           FilterState: The normalized state of the sidebar selections.
        """
+    # The initial values of the widgets set by the URL of the page (read once per dataset)
+    url_filters = read_query_params(model)
+
     # Set the sidebar's header
     st.sidebar.header('Please Filter Here:')
 
     # Get the inputs from the selects and checkboxes
-    full_name, item_name, category, printing = init_sidebar_selects(data_frame)
+    full_name, item_name, category, printing = init_sidebar_selects(model, url_filters)
 
     # Double end slider for the ages range
-    age_slider = st.sidebar.slider('Choose Range of Ages:', value=[8, 90], max_value=120)
+    age_slider = st.sidebar.slider('Choose Range of Ages:', value=url_filters.get('age', DEFAULT_AGE_RANGE),
+                                   max_value=120, key=widget_key(model, 'age'))
 
-    male_check, female_check, winter_check, summer_check = init_sidebar_checkboxes()
+    male_check, female_check, winter_check, summer_check = init_sidebar_checkboxes(model, url_filters)
     # A divider
     st.sidebar.markdown('---')
 
     # Get the input from the date inputs
-    start_date, end_date = init_sidebar_dates_pickers(data_frame)
+    start_date, end_date = init_sidebar_dates_pickers(model, url_filters)
 
     # Get the values from the checkboxes item tags and season
     gender, season = get_value_from_checkbox_sidebar(male_check, female_check, winter_check, summer_check)
     
-    try:
-        # Convert start_date and end_date to datetime
-        start_date = pd.to_datetime(start_date)
-        end_date = pd.to_datetime(end_date)
-        
-        # Basic filters that should always be applied
-        df_filtered = data_frame.copy()
-        
-        # Apply age filter
-        df_filtered = df_filtered[
-            (df_filtered['age'] >= age_slider[0]) & 
-            (df_filtered['age'] <= age_slider[1])
-        ]
-        
-        # Apply gender filter
-        if gender:
-            df_filtered = df_filtered[df_filtered['gender'].isin(gender)]
-            
-        # Apply season filter
-        if season:
-            df_filtered = df_filtered[df_filtered['season'].isin(season)]
-            
-        # Apply date filter
-        df_filtered = df_filtered[
-            (df_filtered['order_date'] >= start_date) & 
-            (df_filtered['order_date'] <= end_date)
-        ]
-        
-        # Apply optional filters
-        if full_name:
-            df_filtered = df_filtered[df_filtered['full_name'].isin(full_name)]
-            
-        if item_name:
-            df_filtered = df_filtered[df_filtered['item_name'].isin(item_name)]
-            
-        if category:
-            df_filtered = df_filtered[df_filtered['category'].isin(category)]
-            
-        if printing:
-            df_filtered = df_filtered[df_filtered['printing'].isin(printing)]
-        
-        return df_filtered
-        
-    except Exception as e:
-        st.error(f"Error in filtering: {str(e)}")
-        return data_frame
-
-
-def init_selects_queries_dict():
-    """
-        Initialize a dictionary of filtering queries for select options.
+    # Normalize the widgets values to the filter state
+    filter_state = FilterState.from_selection(full_name=full_name, item_name=item_name, category=category,
+                                              printing=printing, gender=gender, season=season,
+                                              age_range=age_slider, start_date=start_date, end_date=end_date)
 
-        Returns:
-            dict: A dictionary containing the filtering queries for select options.
-        """
-    queries = {}
-    queries['item_name_query'] = ' item_name == @item_name '
-    queries['client_name_query'] = ' full_name == @full_name '
-    queries['printing_query'] = ' printing == @printing '
-    queries['category_query'] = ' category == @category '
-    return queries
+    # Share the filters through the URL of the page
+    write_query_params(model, {'full_name': full_name, 'item_name': item_name, 'category': category,
+                               'printing': printing}, age_slider,
+                       {'gender': [male_check, female_check], 'season': [winter_check, summer_check]},
+                       start_date, end_date)
+    return filter_state
 
 
-def build_final_query_string(full_name, item_name, category, printing, queries_dict):
+def widget_key(model, name):
     """
-    Build the final query string based on the selected values.
+    Get the session key of a filter widget. The key holds the dataset token, so the widgets of another
+    file start from their defaults instead of keeping values missing from its options.
 
     Args:
-        full_name (list): The selected client names.
-        item_name (list): The selected item names.
-        category (list): The selected categories.
-        printing (list): The selected printing options.
-        queries_dict (dict): The dictionary of queries for select options.
+        model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing the data.
+        name (str): The name of the widget.
 
     Returns:
-        conditions_query (str): The final query string.
+        str: The widget key.
     """
-    conditions = []
-    # Check if client names are selected and add the corresponding query
-    if full_name:
-        conditions.append(queries_dict['client_name_query'])
+    return f'filter_{name}_{model.dataset_key}'
 
-    # Check if item names are selected and add the corresponding query
-    if item_name:
-        conditions.append(queries_dict['item_name_query'])
 
-    # Check if categories are selected and add the corresponding query
-    if category:
-        conditions.append(queries_dict['category_query'])
+def read_query_params(model):
+    """
+    Read the initial values of the filter widgets from the URL query parameters, the first time the session
+    shows a dataset; the widgets then keep the values the user picks. Values missing from the options of
+    the dataset or malformed are ignored.
 
-    # Check if printing options are selected and add the corresponding query
-    if printing:
-        conditions.append(queries_dict['printing_query'])
+    Args:
+        model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing the data.
 
-    # Join all the conditions using 'and' to form the final query string
-    conditions_query = ' and '.join(conditions)
+    Returns:
+        dict: The widget name to initial value mapping, only for the filters set by the URL.
+    """
+    url_filters = st.session_state.setdefault(URL_FILTERS_KEY, {})
+    if model.dataset_key in url_filters:
+        return url_filters[model.dataset_key]
+    initial = url_filters[model.dataset_key] = {}
+    params = st.query_params
+
+    for name in ('full_name', 'item_name', 'category', 'printing'):
+        if name in params:
+            wanted = set(params.get_all(name))
+            initial[name] = model.option_index[name].find(wanted)
+    if 'age' in params:
+        try:
+            low, high = sorted(min(max(int(bound), 0), 120) for bound in params['age'].split('-'))
+            initial['age'] = [low, high]
+        except ValueError:
+            pass
+    for name, values in (('gender', GENDER_VALUES), ('season', SEASON_VALUES)):
+        if name in params:
+            checked = set(params.get_all(name))
+            for value in values:
+                initial[value] = value in checked
+    min_date, max_date = model.order_date_bounds
+    for name in ('start_date', 'end_date'):
+        if name in params and min_date is not None:
+            try:
+                date = datetime.date.fromisoformat(params[name])
+                initial[name] = min(max(date, min_date.date()), max_date.date())
+            except ValueError:
+                pass
+    return initial
+
+
+def write_query_params(model, selections, age_range, checkboxes, start_date, end_date):
+    """
+    Write the filters to the URL query parameters, only the values differing from the widget defaults.
+
+    Args:
+        model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing the data.
+        selections (dict): The selected values of every multiselect.
+        age_range (list): The min and max age.
+        checkboxes (dict): The values of the gender and season checkboxes.
+        start_date (datetime.date): The first order date.
+        end_date (datetime.date): The last order date.
+
+    Returns:
+        None
+    """
+    params = {name: [str(value) for value in values] for name, values in selections.items() if values}
+    if list(age_range) != DEFAULT_AGE_RANGE:
+        params['age'] = f'{age_range[0]}-{age_range[1]}'
+    for name, values in (('gender', GENDER_VALUES), ('season', SEASON_VALUES)):
+        checked = [value for value, check in zip(values, checkboxes[name]) if check]
+        if len(checked) < len(values):
+            params[name] = checked or [NO_VALUE_PARAM]
+    min_date, max_date = model.order_date_bounds
+    if start_date is not None and min_date is not None and start_date != min_date.date():
+        params['start_date'] = start_date.isoformat()
+    if end_date is not None and max_date is not None and end_date != max_date.date():
+        params['end_date'] = end_date.isoformat()
+    st.query_params.from_dict(params)
+
+
+def filter_transactions(model, filter_state):
+    """
+    Find the transactions matching the filters with the filter index of the model.
 
-    return conditions_query
+    Args:
+        model (SalesModel): The sales model containing the data.
+        filter_state (FilterState): The sidebar filters.
 
+    Returns:
+        range | np.ndarray: The positions of the matching transactions.
+    """
+    return model.filter_index.rows(filter_state)
 
 
-def init_sidebar_selects(data_frame):
+def init_sidebar_selects(model, url_filters):
     """
         Initialize the sidebar select options.
 
         Args:
-            data_frame (pd.DataFrame): The original DataFrame containing the data.
+            model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing
+                the data.
+            url_filters (dict): The initial values set by the URL query parameters.
 
         Returns:
             tuple: The selected client names, item names, categories, and printing options.
         """
-    # Initialize the sidebar select options for client names, item names, printing options, and categories
-    full_name = st.sidebar.multiselect(
-        'Select the client name:',
-        options=data_frame['full_name'].unique(),
-    )
+    # Initialize the sidebar select options for client names, item names, printing options, and categories,
+    # the client and item names searched as the user types (they can be too many to list)
+    full_name = init_type_ahead_select(model, 'full_name', 'Select the client name:', 'client names', url_filters)
 
-    item_name = st.sidebar.multiselect(
-        'Select a specific item:',
-        options=data_frame['item_name'].unique()
-    )
+    item_name = init_type_ahead_select(model, 'item_name', 'Select a specific item:', 'items', url_filters)
     printing = st.sidebar.multiselect(
         'Select the Texture:',
-        options=data_frame['printing'].unique(),
+        options=model.option_index['printing'].values,
+        default=url_filters.get('printing'),
+        key=widget_key(model, 'printing'),
     )
     category = st.sidebar.multiselect(
         'Select the category:',
-        options=data_frame['category'].unique(),
+        options=model.option_index['category'].values,
+        default=url_filters.get('category'),
+        key=widget_key(model, 'category'),
     )
     # Return the selected values as a tuple
     return full_name, item_name, category, printing
 
 
-def init_sidebar_checkboxes():
+def init_type_ahead_select(model, name, label, plural, url_filters):
+    """
+        Initialize a multiselect searched as the user types. Its options are only the best matches of the
+        search in the option index of the model, plus the values already selected.
+
+        Args:
+            model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing
+                the data.
+            name (str): The column of the values.
+            label (str): The label of the multiselect.
+            plural (str): The name of the values in the search placeholder.
+            url_filters (dict): The initial values set by the URL query parameters.
+
+        Returns:
+            list: The selected values.
+        """
+    options = model.option_index[name]
+    key = widget_key(model, name)
+    selected = st.session_state.get(key, url_filters.get(name) or [])
+    search = st.sidebar.text_input(label, placeholder=f'Search the {len(options):,} {plural}...',
+                                   key=widget_key(model, f'{name}_search'))
+    matches = options.search(search, OPTION_SEARCH_LIMIT)
+    return st.sidebar.multiselect(
+        label,
+        options=list(dict.fromkeys([*selected, *matches])),
+        default=url_filters.get(name),
+        key=key,
+        label_visibility='collapsed',
+        placeholder=f'Choose among the {len(matches):,} best matches',
+    )
+
+
+def init_sidebar_checkboxes(model, url_filters):
     """
         Initialize the sidebar checkboxes.
 
+        Args:
+            model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing
+                the data.
+            url_filters (dict): The initial values set by the URL query parameters.
+
         Returns:
             tuple: The selected checkbox values.
         """
     # Initialize the sidebar checkboxes and return the values
     st.sidebar.header('Gender:')
-    male_check = st.sidebar.checkbox('Male', value=True)
-    female_check = st.sidebar.checkbox('Female', value=True)
+    male_check = st.sidebar.checkbox('Male', value=url_filters.get('male', True),
+                                     key=widget_key(model, 'male'))
+    female_check = st.sidebar.checkbox('Female', value=url_filters.get('female', True),
+                                       key=widget_key(model, 'female'))
 
 
     st.sidebar.header('Select a Season:')
-    winter_check = st.sidebar.checkbox('fall/winter', value=True)
-    summer_check = st.sidebar.checkbox('spring/summer', value=True)
+    winter_check = st.sidebar.checkbox('fall/winter', value=url_filters.get('fall/winter', True),
+                                       key=widget_key(model, 'fall/winter'))
+    summer_check = st.sidebar.checkbox('spring/summer', value=url_filters.get('spring/summer', True),
+                                       key=widget_key(model, 'spring/summer'))
     return male_check, female_check, winter_check, summer_check
 
 
-def init_sidebar_dates_pickers(data_frame):
+def init_sidebar_dates_pickers(model, url_filters):
     """
         Initialize the sidebar date pickers.
 
         Args:
-            data_frame (pd.DataFrame): The original DataFrame containing the data.
+            model (SalesModel | SqlSalesStore): The sales model (or the database of the SQL backend) containing
+                the data.
+            url_filters (dict): The initial values set by the URL query parameters.
 
         Returns:
             tuple: The selected start and end dates.
         """
-    # Convert the order_date column to datetime for manipulation and find the min and max value
-    data_frame['order_date'] = pd.to_datetime(data_frame['order_date'])
-    min_date = data_frame['order_date'].min()
-    max_date = data_frame['order_date'].max()
+    # The min and max value of the order dates, found once when the transactions were sorted by date
+    min_date, max_date = model.order_date_bounds
     # Initialize the sidebar date pickers and define the min and max value to choose from
-    start_date = st.sidebar.date_input('Start date', min_value=min_date, max_value=max_date, value=min_date)
-    end_date = st.sidebar.date_input('End date', min_value=min_date, max_value=max_date, value=max_date)
+    start_date = st.sidebar.date_input('Start date', min_value=min_date, max_value=max_date,
+                                       value=url_filters.get('start_date', min_date),
+                                       key=widget_key(model, 'start_date'))
+    end_date = st.sidebar.date_input('End date', min_value=min_date, max_value=max_date,
+                                     value=url_filters.get('end_date', max_date),
+                                     key=widget_key(model, 'end_date'))
     # Return the values
     return start_date, end_date
 
@@ -0,0 +1,354 @@
+import argparse
+import io
+import struct
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from schema import select_columns
+
+#列式快照 (Arrow/Parquet), 替代缓慢的Excel解析
+
+# The file suffixes of a single sheet inside a snapshot
+ARROW_SUFFIXES = ('.arrow', '.feather')
+PARQUET_SUFFIX = '.parquet'
+SHEET_SUFFIXES = ARROW_SUFFIXES + (PARQUET_SUFFIX,)
+# A single file snapshot is an uncompressed zip holding one Arrow file per sheet
+BUNDLE_SUFFIX = '.zip'
+# The alignment of the sheets inside the bundle, so they can be memory-mapped without copies
+BUNDLE_ALIGNMENT = 64
+# The zip extra field id used for the alignment padding (the same one zipalign uses)
+ALIGNMENT_EXTRA_ID = 0xD935
+# The size of the fixed part of a zip local file header
+LOCAL_HEADER_SIZE = 30
+
+
+def is_snapshot(file_name):
+    """
+    Check if a file name or path points to a columnar snapshot instead of an Excel workbook.
+
+    Args:
+        file_name (str | Path): The name of the uploaded file or the path on disk.
+
+    Returns:
+        bool: True for a snapshot bundle, a snapshot directory or a single sheet file.
+    """
+    path = Path(file_name)
+    return path.is_dir() or path.suffix.lower() in SHEET_SUFFIXES + (BUNDLE_SUFFIX,)
+
+
+def sheet_to_table(data_frame):
+    """
+    Convert a sheet to an Arrow table. Object columns holding mixed types (e.g. numbers and text ids)
+    are stored as strings.
+
+    Args:
+        data_frame (pd.DataFrame): The sheet read from the workbook.
+
+    Returns:
+        pa.Table: The sheet as an Arrow table.
+    """
+    data_frame = data_frame.rename(columns=str)
+    try:
+        return pa.Table.from_pandas(data_frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mixed_columns = {col: 'string' for col in data_frame.columns if data_frame[col].dtype == object}
+        return pa.Table.from_pandas(data_frame.astype(mixed_columns), preserve_index=False)
+
+
+def table_to_arrow_bytes(table):
+    """
+    Serialize a table to the (uncompressed) Arrow IPC file format.
+
+    Args:
+        table (pa.Table): The table to serialize.
+
+    Returns:
+        bytes: The Arrow file content.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def alignment_extra(header_offset, file_name):
+    """
+    Build a zip extra field padding the local header, so the member data starts on an aligned offset.
+
+    Args:
+        header_offset (int): The offset of the local file header in the archive.
+        file_name (str): The name of the member.
+
+    Returns:
+        bytes: The extra field.
+    """
+    data_offset = header_offset + LOCAL_HEADER_SIZE + len(file_name.encode()) + 4
+    padding = -data_offset % BUNDLE_ALIGNMENT
+    return struct.pack('<HH', ALIGNMENT_EXTRA_ID, padding) + b'\0' * padding
+
+
+def write_snapshot_bundle(sheets, output):
+    """
+    Write the sheets to a single file snapshot: an uncompressed zip with one aligned Arrow file per sheet.
+
+    Args:
+        sheets (dict): The sheet name to data frame mapping.
+        output (str | Path): The path of the bundle.
+
+    Returns:
+        Path: The path of the bundle.
+    """
+    output = Path(output)
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for sheet_name, data_frame in sheets.items():
+            info = zipfile.ZipInfo(f'{sheet_name}.arrow')
+            info.compress_type = zipfile.ZIP_STORED
+            info.extra = alignment_extra(archive.fp.tell(), info.filename)
+            archive.writestr(info, table_to_arrow_bytes(sheet_to_table(data_frame)))
+    return output
+
+
+def write_snapshot_directory(sheets, output, file_format='arrow'):
+    """
+    Write the sheets to a snapshot directory holding one file per sheet.
+
+    Args:
+        sheets (dict): The sheet name to data frame mapping.
+        output (str | Path): The directory of the snapshot.
+        file_format (str): 'arrow' (memory-mappable) or 'parquet' (smaller on disk).
+
+    Returns:
+        Path: The snapshot directory.
+    """
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    for sheet_name, data_frame in sheets.items():
+        table = sheet_to_table(data_frame)
+        if file_format == 'parquet':
+            pq.write_table(table, output / f'{sheet_name}{PARQUET_SUFFIX}')
+        else:
+            (output / f'{sheet_name}.arrow').write_bytes(table_to_arrow_bytes(table))
+    return output
+
+
+def convert_workbook_to_snapshot(workbook, output, per_sheet=False, file_format='arrow'):
+    """
+    Convert a users/transactions/items workbook to a columnar snapshot.
+
+    Args:
+        workbook (str | Path): The path of the Excel workbook.
+        output (str | Path): The path of the bundle, or of the directory when per_sheet is set.
+        per_sheet (bool): Write one file per sheet in a directory instead of a single bundle.
+        file_format (str): The per sheet format, 'arrow' or 'parquet'. A bundle is always Arrow.
+
+    Returns:
+        Path: The path of the snapshot.
+    """
+    sheets = pd.read_excel(workbook, sheet_name=None)
+    if per_sheet:
+        return write_snapshot_directory(sheets, output, file_format)
+    return write_snapshot_bundle(sheets, output)
+
+
+def read_sheet_buffer(buffer, suffix, columns=None):
+    """
+    Read a single sheet from a buffer. Arrow buffers are read without copying the column data.
+
+    Args:
+        buffer (pa.Buffer): The content of the sheet file.
+        suffix (str): The suffix of the sheet file.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        pa.Table: The sheet.
+    """
+    if suffix == PARQUET_SUFFIX:
+        parquet_file = pq.ParquetFile(pa.BufferReader(buffer))
+        return parquet_file.read(columns=select_columns(parquet_file.schema_arrow.names, columns))
+    table = pa.ipc.open_file(buffer).read_all()
+    return table.select(select_columns(table.column_names, columns))
+
+
+def member_buffer(reader, info):
+    """
+    Slice the data of an uncompressed zip member out of the archive without copying it.
+
+    Args:
+        reader (pa.NativeFile): The memory-mapped archive (or a reader over its bytes).
+        info (zipfile.ZipInfo): The member.
+
+    Returns:
+        pa.Buffer: The data of the member.
+    """
+    reader.seek(info.header_offset)
+    name_length, extra_length = struct.unpack('<HH', reader.read(LOCAL_HEADER_SIZE)[26:30])
+    reader.seek(info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+    return reader.read_buffer(info.file_size)
+
+
+def snapshot_sheet_buffers(source):
+    """
+    List the sheet files of a snapshot as buffers. Files on disk are memory-mapped.
+
+    Args:
+        source (bytes | str | Path): The content of an uploaded bundle, or the path of a bundle,
+            a snapshot directory or a single sheet file.
+
+    Returns:
+        list: The (sheet name, buffer, file suffix) tuples.
+    """
+    if isinstance(source, bytes):
+        return bundle_sheet_buffers(pa.BufferReader(source), io.BytesIO(source))
+
+    path = Path(source)
+    if path.is_dir():
+        return [(sheet_path.stem, pa.memory_map(str(sheet_path)).read_buffer(), sheet_path.suffix.lower())
+                for sheet_path in sorted(path.iterdir()) if sheet_path.suffix.lower() in SHEET_SUFFIXES]
+    if path.suffix.lower() == BUNDLE_SUFFIX:
+        return bundle_sheet_buffers(pa.memory_map(str(path)), path)
+    return [(path.stem, pa.memory_map(str(path)).read_buffer(), path.suffix.lower())]
+
+
+def bundle_sheet_buffers(reader, archive_file):
+    """
+    List the sheet files of a snapshot bundle as buffers.
+
+    Args:
+        reader (pa.NativeFile): The memory-mapped bundle (or a reader over its bytes).
+        archive_file (str | Path | io.BytesIO): The bundle, opened by zipfile to list the members.
+
+    Returns:
+        list: The (sheet name, buffer, file suffix) tuples.
+    """
+    buffers = []
+    with zipfile.ZipFile(archive_file) as archive:
+        for info in archive.infolist():
+            suffix = Path(info.filename).suffix.lower()
+            if suffix not in SHEET_SUFFIXES:
+                continue
+            if info.compress_type == zipfile.ZIP_STORED:
+                buffer = member_buffer(reader, info)
+            else:
+                buffer = pa.py_buffer(archive.read(info))
+            buffers.append((Path(info.filename).stem, buffer, suffix))
+    return buffers
+
+
+def read_snapshot_headers(source):
+    """
+    Read the column names of every sheet of a snapshot from the file schemas, without reading the data.
+
+    Args:
+        source (bytes | str | Path): The content of an uploaded bundle or the path of a snapshot.
+
+    Returns:
+        dict: The sheet name to column names mapping.
+    """
+    headers = {}
+    for sheet_name, buffer, suffix in snapshot_sheet_buffers(source):
+        if suffix == PARQUET_SUFFIX:
+            headers[sheet_name] = pq.ParquetFile(pa.BufferReader(buffer)).schema_arrow.names
+        else:
+            headers[sheet_name] = pa.ipc.open_file(buffer).schema.names
+    return headers
+
+
+def read_snapshot_row_counts(source):
+    """
+    Read the number of rows of every sheet of a snapshot from the file metadata, without reading the data.
+
+    Args:
+        source (bytes | str | Path): The content of an uploaded bundle or the path of a snapshot.
+
+    Returns:
+        dict: The sheet name to row count mapping.
+    """
+    counts = {}
+    for sheet_name, buffer, suffix in snapshot_sheet_buffers(source):
+        if suffix == PARQUET_SUFFIX:
+            counts[sheet_name] = pq.ParquetFile(pa.BufferReader(buffer)).metadata.num_rows
+        else:
+            reader = pa.ipc.open_file(buffer)
+            counts[sheet_name] = sum(reader.get_batch(index).num_rows for index in range(reader.num_record_batches))
+    return counts
+
+
+def read_snapshot_tables(source, columns=None):
+    """
+    Read the tables of a snapshot. Files on disk are memory-mapped.
+
+    Args:
+        source (bytes | str | Path): The content of an uploaded bundle, or the path of a bundle,
+            a snapshot directory or a single sheet file.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to Arrow table mapping.
+    """
+    return {sheet_name: read_sheet_buffer(buffer, suffix, columns)
+            for sheet_name, buffer, suffix in snapshot_sheet_buffers(source)}
+
+
+def read_snapshot(source, columns=None):
+    """
+    Read a snapshot into data frames, the same shape pd.read_excel(sheet_name=None) returns.
+
+    Args:
+        source (bytes | str | Path): The content of an uploaded bundle or the path of a snapshot.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        dict: The sheet name to data frame mapping.
+    """
+    return {sheet_name: table.to_pandas() for sheet_name, table in read_snapshot_tables(source, columns).items()}
+
+
+def iter_snapshot_chunks(source, chunk_rows, columns=None):
+    """
+    Stream the sheets of a snapshot as frames of at most chunk_rows rows. The Arrow files are memory-mapped
+    and sliced without copies, the Parquet files read batch by batch.
+
+    Args:
+        source (bytes | str | Path): The content of an uploaded bundle or the path of a snapshot.
+        chunk_rows (int): The maximum number of rows of a chunk.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Yields:
+        tuple: The sheet name and the frame of a chunk of its rows.
+    """
+    for sheet_name, buffer, suffix in snapshot_sheet_buffers(source):
+        if suffix == PARQUET_SUFFIX:
+            parquet_file = pq.ParquetFile(pa.BufferReader(buffer))
+            batches = parquet_file.iter_batches(chunk_rows, columns=select_columns(parquet_file.schema_arrow.names,
+                                                                                   columns))
+        else:
+            reader = pa.ipc.open_file(buffer)
+            names = select_columns(reader.schema.names, columns)
+            batches = (reader.get_batch(index).select(names) for index in range(reader.num_record_batches))
+        empty = True
+        for batch in batches:
+            for start in range(0, batch.num_rows, chunk_rows):
+                empty = False
+                yield sheet_name, batch.slice(start, chunk_rows).to_pandas()
+        if empty:
+            yield sheet_name, read_sheet_buffer(buffer, suffix, columns).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a sales analytics workbook to a columnar snapshot.')
+    parser.add_argument('workbook', help='the users/transactions/items Excel workbook')
+    parser.add_argument('output', help='the bundle (.zip) to write, or the directory with --per-sheet')
+    parser.add_argument('--per-sheet', action='store_true', help='write one file per sheet in a directory')
+    parser.add_argument('--format', choices=['arrow', 'parquet'], default='arrow',
+                        help='the per sheet file format (a bundle is always Arrow)')
+    args = parser.parse_args()
+    output = convert_workbook_to_snapshot(args.workbook, args.output, args.per_sheet, args.format)
+    print(f'Snapshot written to: {output.absolute()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,693 @@
+import contextlib
+import os
+import sqlite3
+import tempfile
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from aggregation import SalesAggregates, group_item_totals, month_gender_group_totals
+from config import SQL_CACHE_BUDGET_BYTES
+from filter_index import VALUE_FILTERS
+from ingestion import SalesFileError, iter_sheet_chunks, read_file_headers, validate_headers
+from join_engine import JoinReport, numeric_key_values
+from option_index import OPTION_COLUMNS, PREFIX_END
+from sales_model import (TIME_BUCKET_COLUMNS, add_time_buckets, clean_sheet, convert_birth_date_to_age_column,
+                         partitions_in_range)
+from schema import DERIVED_COLUMNS, JOIN_KEYS, REQUIRED_SHEETS, normalize_column_name, select_columns
+from table_view import TOTAL_COLUMN
+
+#嵌入式SQL后端: 工作表分块直接写入SQLite数据库文件 (不构建内存中的模型), 连接, 排序, 过滤, 分组汇总和表格分页都在数据库中执行
+
+# The alias of every table in the queries, and the key of the dimension tables in the fact table
+TABLE_ALIASES = {'transactions': 't', 'users': 'u', 'items': 'i'}
+DIMENSION_KEYS = {'users': 'user_key', 'items': 'item_key'}
+# The date columns, stored as integer nanoseconds since the epoch
+DATE_COLUMNS = ['order_date', 'birth_date']
+# The month bucket of the order date, stored with every transaction for the monthly totals
+MONTH_COLUMN = TIME_BUCKET_COLUMNS['month']
+# The user attributes copied to every transaction, so their filters and groups never join the users table
+FACT_USER_COLUMNS = ['age', 'gender']
+# The covering indexes of the two GROUP BY queries of the aggregates (per item, and per month, age and gender):
+# SQLite groups by sorting, an index already in the order of the groups and holding every filtered and
+# summed column is scanned instead of sorting the transactions
+GROUP_INDEXES = {
+    'transactions_items': ['item_key', 'order_date', 'user_key', 'age', 'gender', 'total', 'amount'],
+    'transactions_months': [MONTH_COLUMN, 'age', 'gender', 'order_date', 'user_key', 'item_key', 'total'],
+}
+# The rows sampled per index by ANALYZE, enough for the query planner to pick the indexes
+ANALYSIS_LIMIT = 1000
+# The rows fetched at once from a cursor
+FETCH_ROWS = 10_000
+
+
+def remove_file(path):
+    """
+    Delete a database file, already deleted or not.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def quote(name):
+    """
+    Quote a column name for SQL.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_values(values):
+    """
+    Convert a column to the list of its SQL values, the missing ones None and the dates integer nanoseconds.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        missing = values.isna().to_numpy()
+        values = values.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(object)
+        values[missing] = None
+        return values.tolist()
+    values = values.astype(object)
+    return values.where(values.notna(), None).tolist()
+
+
+def sql_dates(values):
+    """
+    Convert integer nanoseconds since the epoch (None when missing) to datetime64 values.
+    """
+    values = pd.array(list(values), dtype='Int64').to_numpy(dtype=np.int64, na_value=np.iinfo(np.int64).min)
+    return values.view('datetime64[ns]')
+
+
+def sql_keys(keys):
+    """
+    Convert a join key column to text: whole numbers by their integer value, the other keys by their string.
+    """
+    values, missing = numeric_key_values(keys)
+    if values is None:
+        values, missing = keys.astype(str).to_numpy(dtype=object), keys.isna().to_numpy()
+    else:
+        values = values.astype(str).astype(object)
+    values[missing] = None
+    return values.tolist()
+
+
+def sheet_columns(files_headers, sheet_name, columns):
+    """
+    Get the columns of a sheet read from any of the files, with the derived ones (the age of the birth date).
+
+    Args:
+        files_headers (list): The sheet name to column names mapping of every file.
+        sheet_name (str): The sheet.
+        columns (set | None): The normalized names of the columns to read, None reads every column.
+
+    Returns:
+        list: The normalized names, the join keys excluded.
+    """
+    names = [normalize_column_name(name) for headers in files_headers
+             for name in select_columns(headers[sheet_name], columns)]
+    names = [name for name in dict.fromkeys(names) if name not in JOIN_KEYS]
+    for derived, sources in DERIVED_COLUMNS.items():
+        if sheet_name == 'users' and all(source in names for source in sources):
+            names.append(derived)
+    return names
+
+
+class SqlSalesStore:
+    """
+    The sales data streamed by chunks into an SQLite database file instead of the in-memory model. The
+    filters, the aggregates, the table pages and the sidebar options are SQL queries on it.
+    """
+
+    def __init__(self, files, columns=None, directory=None):
+        """
+        Args:
+            files (list): The (source, file_name) of every file, the source being its content or its path.
+            columns (set | None): The normalized names of the columns to read, None reads every column.
+            directory (str | None): The directory of the database file, None for the temporary directory.
+
+        Raises:
+            SalesFileError: If a required sheet or column is missing from a file.
+        """
+        started = time.perf_counter()
+        files_headers = []
+        for source, file_name in files:
+            try:
+                headers = read_file_headers(source, file_name)
+                validate_headers(headers)
+            except SalesFileError as e:
+                raise SalesFileError(f'{file_name}: {e}' if len(files) > 1 else str(e)) from e
+            files_headers.append(headers)
+        self.source_names = [file_name for _, file_name in files]
+        self.columns = {sheet_name: sheet_columns(files_headers, sheet_name, columns) for sheet_name in REQUIRED_SHEETS}
+        self.fact_user_columns = [col for col in FACT_USER_COLUMNS if col in self.columns['users']]
+        # The table of every column, the user attributes copied to the transactions read from them
+        self.tables = dict.fromkeys(self.fact_user_columns, 'transactions')
+        for table_name in ('transactions', 'users', 'items'):
+            for col in self.columns[table_name]:
+                self.tables.setdefault(col, table_name)
+
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite', dir=directory)
+        os.close(handle)
+        # The file is deleted with the store, when it leaves the cache
+        self.finalizer = weakref.finalize(self, remove_file, self.path)
+        handle, staging_path = tempfile.mkstemp(suffix='.sqlite', dir=directory)
+        os.close(handle)
+        try:
+            with contextlib.closing(sqlite3.connect(self.path)) as connection:
+                # A new file filled once: no rollback journal and no fsync needed
+                connection.execute('PRAGMA journal_mode = OFF')
+                connection.execute('PRAGMA synchronous = OFF')
+                connection.execute(f'PRAGMA cache_size = -{max(1, SQL_CACHE_BUDGET_BYTES // 1024)}')
+                # The raw transactions are staged in a second file, deleted once they are joined
+                connection.execute('ATTACH DATABASE ? AS staging', [staging_path])
+                connection.execute('PRAGMA staging.journal_mode = OFF')
+                connection.execute('PRAGMA staging.synchronous = OFF')
+                self.create_tables(connection)
+                for source, (file_source, file_name) in enumerate(files):
+                    for sheet_name, chunk in iter_sheet_chunks(file_source, file_name, columns):
+                        self.insert_chunk(connection, source, sheet_name, chunk)
+                self.join_report = self.join_tables(connection)
+                self.index_tables(connection)
+                connection.commit()
+                connection.execute('DETACH DATABASE staging')
+        finally:
+            remove_file(staging_path)
+        self.build_seconds = time.perf_counter() - started
+
+    def create_tables(self, connection):
+        """
+        Create the dimension tables, the staged transactions and the fact table, the attributes untyped.
+
+        Args:
+            connection (sqlite3.Connection): The connection building the database.
+
+        Returns:
+            None
+        """
+        user_columns = ''.join(f', {quote(col)}' for col in self.columns['users'])
+        item_columns = ''.join(f', {quote(col)}' for col in self.columns['items'])
+        staged_columns = ''.join(f', {quote(col)}' for col in self.columns['transactions'])
+        fact_columns = staged_columns + ''.join(f', {quote(col)}' for col in self.fact_user_columns)
+        connection.execute(f'CREATE TABLE users (user_key INTEGER PRIMARY KEY, source INTEGER, user_id TEXT'
+                           f'{user_columns})')
+        connection.execute(f'CREATE TABLE items (item_key INTEGER PRIMARY KEY, source INTEGER, item_id TEXT'
+                           f'{item_columns})')
+        connection.execute(f'CREATE TABLE staging.transactions (source INTEGER, user_id TEXT, item_id TEXT, '
+                           f'{MONTH_COLUMN} INTEGER{staged_columns})')
+        connection.execute(f'CREATE TABLE transactions (position INTEGER PRIMARY KEY, source INTEGER, '
+                           f'user_key INTEGER, item_key INTEGER, total REAL, {MONTH_COLUMN} INTEGER{fact_columns})')
+        connection.execute('CREATE TABLE options (name TEXT, value, label TEXT, folded TEXT, transactions INTEGER)')
+
+    def insert_chunk(self, connection, source, sheet_name, chunk):
+        """
+        Clean a chunk of the rows of a sheet and insert it, the transactions into the staged table.
+
+        Args:
+            connection (sqlite3.Connection): The connection building the database.
+            source (int): The position of the file.
+            sheet_name (str): 'users', 'transactions' or 'items'.
+            chunk (pd.DataFrame): The rows.
+
+        Returns:
+            None
+        """
+        chunk = clean_sheet(sheet_name, chunk)
+        if sheet_name == 'users' and 'birth_date' in chunk.columns:
+            chunk = convert_birth_date_to_age_column(chunk)
+            # A whole number of years, None when the birth date is missing
+            chunk['age'] = chunk['age'].astype('Int64')
+        if sheet_name == 'transactions':
+            chunk[MONTH_COLUMN] = add_time_buckets(chunk[['order_date']].copy())[MONTH_COLUMN]
+        keys = [key for key in JOIN_KEYS if key in chunk.columns]
+        names = [col for col in self.columns[sheet_name] if col in chunk.columns]
+        if sheet_name == 'transactions':
+            names.append(MONTH_COLUMN)
+        table_name = 'staging.transactions' if sheet_name == 'transactions' else sheet_name
+        insert = (f"INSERT INTO {table_name} (source, {', '.join(keys + [quote(col) for col in names])}) "
+                  f"VALUES ({', '.join('?' * (1 + len(keys) + len(names)))})")
+        values = [sql_keys(chunk[key]) for key in keys] + [sql_values(chunk[col]) for col in names]
+        connection.executemany(insert, zip([source] * len(chunk), *values))
+
+    def join_tables(self, connection):
+        """
+        Join the staged transactions to the users and items of their file into the fact table, sorted by
+        order date (the undated last) like the in-memory model.
+
+        Args:
+            connection (sqlite3.Connection): The connection building the database.
+
+        Returns:
+            JoinReport: The duplicate keys and the transactions without a user or an item.
+        """
+        connection.execute('CREATE INDEX users_id ON users (source, user_id)')
+        connection.execute('CREATE INDEX items_id ON items (source, item_id)')
+        columns = ''.join(f', {quote(col)}' for col in self.columns['transactions'] + self.fact_user_columns)
+        staged_columns = ''.join(f', s.{quote(col)}' for col in self.columns['transactions'])
+        user_columns = ''.join(f', u.{quote(col)}' for col in self.fact_user_columns)
+        connection.execute(
+            f'INSERT INTO transactions (source, user_key, item_key, total, {MONTH_COLUMN}{columns}) '
+            f'SELECT s.source, u.user_key, i.item_key, s.amount * i.price, '
+            f's.{MONTH_COLUMN}{staged_columns}{user_columns} '
+            f'FROM staging.transactions s '
+            f'JOIN users u ON u.source = s.source AND u.user_id = s.user_id '
+            f'JOIN items i ON i.source = s.source AND i.item_id = s.item_id '
+            f'ORDER BY s.order_date IS NULL, s.order_date, s.rowid, u.user_key, i.item_key')
+
+        def count(sql):
+            return int(connection.execute(sql).fetchone()[0])
+
+        user_match = 'SELECT 1 FROM users u WHERE u.source = s.source AND u.user_id = s.user_id'
+        item_match = 'SELECT 1 FROM items i WHERE i.source = s.source AND i.item_id = s.item_id'
+        return JoinReport(
+            duplicate_user_ids=count('SELECT COUNT(user_id) - (SELECT COUNT(*) FROM (SELECT DISTINCT source, user_id '
+                                     'FROM users WHERE user_id IS NOT NULL)) FROM users'),
+            duplicate_item_ids=count('SELECT COUNT(item_id) - (SELECT COUNT(*) FROM (SELECT DISTINCT source, item_id '
+                                     'FROM items WHERE item_id IS NOT NULL)) FROM items'),
+            orphan_user_transactions=count(f'SELECT COUNT(*) FROM staging.transactions s '
+                                           f'WHERE NOT EXISTS ({user_match})'),
+            orphan_item_transactions=count(f'SELECT COUNT(*) FROM staging.transactions s '
+                                           f'JOIN users u ON u.source = s.source AND u.user_id = s.user_id '
+                                           f'WHERE NOT EXISTS ({item_match})'),
+        )
+
+    def index_tables(self, connection):
+        """
+        Index the fact table, then find the filter bounds, the partitions and the options of the sidebar.
+
+        Args:
+            connection (sqlite3.Connection): The connection building the database.
+
+        Returns:
+            None
+        """
+        # The transactions are sorted by date, so the index of a date range is a range of positions
+        connection.execute('CREATE INDEX transactions_order_date ON transactions (order_date)')
+        fact_columns = {'item_key', 'user_key', 'total', MONTH_COLUMN, *self.columns['transactions'],
+                        *self.fact_user_columns}
+        for index_name, index_columns in GROUP_INDEXES.items():
+            index_columns = [col for col in index_columns if col in fact_columns]
+            connection.execute(f"CREATE INDEX {index_name} ON transactions ({', '.join(index_columns)})")
+        connection.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        connection.execute('ANALYZE')
+        self.row_count, first, last = connection.execute(
+            'SELECT COUNT(*), MIN(order_date), MAX(order_date) FROM transactions').fetchone()
+        self.order_date_bounds = (None, None) if first is None else (pd.Timestamp(first), pd.Timestamp(last))
+        if 'age' in self.columns['users']:
+            missing, low, high = connection.execute(
+                'SELECT COUNT(*) - COUNT(age), MIN(age), MAX(age) FROM users').fetchone()
+            self.age_bounds = (low, high) if not missing and low is not None else None
+        else:
+            self.age_bounds = None
+        self.genders = pd.CategoricalDtype([row[0] for row in connection.execute(
+            'SELECT DISTINCT gender FROM users WHERE gender IS NOT NULL ORDER BY gender')])
+
+        # One partition per year and source, ordered by year (the undated transactions last)
+        partitions = pd.DataFrame(connection.execute(
+            f'SELECT source, CASE WHEN {MONTH_COLUMN} < 0 THEN -1 ELSE {MONTH_COLUMN} / 12 END AS year, COUNT(*), '
+            f'MIN(order_date), MAX(order_date) FROM transactions GROUP BY year < 0, year, source '
+            f'ORDER BY year < 0, year, source').fetchall(),
+            columns=['source', 'year', 'transactions', 'first_date', 'last_date'])
+        partitions['source'] = [self.source_names[source] for source in partitions['source']]
+        for col in ('first_date', 'last_date'):
+            partitions[col] = sql_dates(partitions[col])
+        self.partitions = partitions
+
+        # The number of transactions of every user and item, then of every option
+        for table_name, key in DIMENSION_KEYS.items():
+            connection.execute(f'CREATE TABLE staging.{table_name}_counts AS '
+                               f'SELECT {key}, COUNT(*) AS n FROM transactions GROUP BY {key}')
+        self.option_index = {}
+        for col in OPTION_COLUMNS:
+            table_name = self.tables.get(col)
+            if table_name is None:
+                continue
+            if table_name == 'transactions':
+                query = f'SELECT {quote(col)}, COUNT(*) FROM transactions WHERE {quote(col)} IS NOT NULL GROUP BY 1'
+            else:
+                key = DIMENSION_KEYS[table_name]
+                query = (f'SELECT d.{quote(col)}, SUM(c.n) FROM staging.{table_name}_counts c '
+                         f'JOIN {table_name} d ON d.{key} = c.{key} WHERE d.{quote(col)} IS NOT NULL GROUP BY 1')
+            cursor = connection.execute(query)
+            while rows := cursor.fetchmany(FETCH_ROWS):
+                connection.executemany('INSERT INTO options VALUES (?, ?, ?, ?, ?)',
+                                       [(col, value, str(value), str(value).lower(), count) for value, count in rows])
+            self.option_index[col] = SqlColumnOptions(self, col)
+        connection.execute('CREATE INDEX options_folded ON options (name, folded)')
+        for options in self.option_index.values():
+            options.count = connection.execute('SELECT COUNT(*) FROM options WHERE name = ?',
+                                               [options.name]).fetchone()[0]
+
+    def __len__(self):
+        return self.row_count
+
+    def describe(self):
+        """
+        Report the size and the build time of the database.
+
+        Returns:
+            str: The report.
+        """
+        return (f'SQL backend: SQLite database of {self.row_count:,} transactions, '
+                f'{os.path.getsize(self.path) / 2 ** 20:.1f} MB on disk, loaded in {self.build_seconds:.2f} s')
+
+    def partitions_in_range(self, start_date=None, end_date=None):
+        """
+        Find the partitions holding orders of a date range.
+        """
+        return partitions_in_range(self.partitions, start_date, end_date)
+
+    def connect(self):
+        """
+        Open a read only connection to the database, its page cache bounded by SQL_CACHE_BUDGET_BYTES.
+        """
+        connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+        connection.execute(f'PRAGMA cache_size = -{max(1, SQL_CACHE_BUDGET_BYTES // 1024)}')
+        return connection
+
+    def query(self, sql, params):
+        """
+        Run a query and get its rows.
+
+        Args:
+            sql (str): The query.
+            params (list): The values of its parameters.
+
+        Returns:
+            list: The rows.
+        """
+        with contextlib.closing(self.connect()) as connection:
+            return connection.execute(sql, params).fetchall()
+
+    def column_expression(self, col):
+        """
+        Get the SQL expression of a column of the wide table.
+        """
+        if col == TOTAL_COLUMN:
+            return 't.total'
+        return f'{TABLE_ALIASES[self.tables[col]]}.{quote(col)}'
+
+    def build_query_string(self, state):
+        """
+        Build the WHERE clause of a filter state on the fact table, the conditions on a dimension table
+        selecting the keys of its matching rows.
+
+        Args:
+            state (FilterState): The filters.
+
+        Returns:
+            tuple: The conditions joined by AND ('' without any filter) and the values of their parameters.
+        """
+        table_conditions = {name: ([], []) for name in TABLE_ALIASES}
+        for col, field_name in VALUE_FILTERS.items():
+            values = getattr(state, field_name)
+            if not values:
+                continue
+            table_conditions[self.tables[col]][0].append(f"{quote(col)} IN ({', '.join('?' * len(values))})")
+            table_conditions[self.tables[col]][1].extend(values)
+
+        low, high = state.age_range
+        if self.age_bounds is None or low > self.age_bounds[0] or high < self.age_bounds[1]:
+            # A missing age never matches a range, unless the range covers every user
+            table_conditions[self.tables['age']][0].append('age BETWEEN ? AND ?')
+            table_conditions[self.tables['age']][1].extend([low, high])
+
+        # The conditions on the transactions, then on a dimension table selecting the keys of its matching rows
+        conditions = [f't.{condition}' for condition in table_conditions['transactions'][0]]
+        params = table_conditions['transactions'][1]
+        for table_name in DIMENSION_KEYS:
+            dimension_conditions, dimension_params = table_conditions[table_name]
+            if dimension_conditions:
+                key = DIMENSION_KEYS[table_name]
+                conditions.append(f"t.{key} IN (SELECT {key} FROM {table_name} WHERE "
+                                  f"{' AND '.join(dimension_conditions)})")
+                params.extend(dimension_params)
+
+        # The dates are compared to midnight of the selected days, the way the filter index compares them
+        if state.start_date is not None:
+            conditions.append('t.order_date >= ?')
+            params.append(pd.Timestamp(state.start_date).value)
+        if state.end_date is not None:
+            conditions.append('t.order_date <= ?')
+            params.append(pd.Timestamp(state.end_date).value)
+        return ' AND '.join(conditions), params
+
+    def rows(self, state, count=None):
+        """
+        Get the transactions matching a state.
+
+        Args:
+            state (FilterState): The filters.
+            count (int | None): The number of matching transactions when already known (e.g. from the
+                aggregates), None to count them on use.
+
+        Returns:
+            SqlRows: The matching transactions, queried on use.
+        """
+        where, params = self.build_query_string(state)
+        rows = SqlRows(self, [where] if where else [], params)
+        rows.count = self.row_count if not where else count
+        return rows
+
+    def aggregates(self, state):
+        """
+        Aggregate the transactions matching a state with two GROUP BY queries (per item, and per month, age
+        and gender), then sum the other groups from them.
+
+        Args:
+            state (FilterState): The filters.
+
+        Returns:
+            SalesAggregates: The aggregates.
+        """
+        where, params = self.build_query_string(state)
+        where = f'WHERE {where}' if where else ''
+        item_groups = pd.DataFrame(self.query(
+            f'SELECT i.item_name, i.category, g.n, g.priced, g.total, g.amount FROM (SELECT t.item_key, COUNT(*) AS n, '
+            f'COUNT(t.total) AS priced, TOTAL(t.total) AS total, TOTAL(t.amount) AS amount '
+            f'FROM transactions t INDEXED BY transactions_items {where} GROUP BY t.item_key) g '
+            f'JOIN items i ON i.item_key = g.item_key ORDER BY g.item_key', params),
+            columns=['item_name', 'category', 'n', 'priced', 'total', 'amount'])
+        user_groups = pd.DataFrame(self.query(
+            f'SELECT t.{MONTH_COLUMN}, t.age, t.gender, TOTAL(t.total) FROM transactions t '
+            f'INDEXED BY transactions_months {where} GROUP BY 1, 2, 3', params),
+            columns=['month', 'age', 'gender', 'total'])
+
+        # The totals of every month and gender, and of every age and gender
+        gender_codes = self.genders.categories.get_indexer(user_groups['gender'])
+        month_gender_totals = month_gender_group_totals(user_groups['month'].to_numpy(dtype=np.int64), gender_codes,
+                                                        user_groups['total'].to_numpy(dtype='float64'), self.genders)
+        user_groups['age'] = pd.to_numeric(user_groups['age'])
+        user_groups['gender'] = pd.Categorical.from_codes(gender_codes, dtype=self.genders)
+        age_gender_totals = user_groups.groupby(['age', 'gender'], observed=True)['total'].sum().reset_index()
+
+        total_sales = float(item_groups['total'].sum())
+        priced_count = int(item_groups['priced'].sum())
+        return SalesAggregates(
+            total_sales=total_sales,
+            average_sale=total_sales / priced_count if priced_count else float('nan'),
+            units_sold=float(item_groups['amount'].sum()),
+            transaction_count=int(item_groups['n'].sum()),
+            month_gender_totals=month_gender_totals,
+            age_gender_totals=age_gender_totals,
+            **group_item_totals(item_groups[['item_name', 'category', 'total']].astype({'total': 'float64'})),
+        )
+
+    def wide_view(self, rows, columns):
+        """
+        Query the wide (joined) rows of a page of transactions.
+
+        Args:
+            rows (SqlRows): The transactions, e.g. a page of the table.
+            columns (list): The columns of the frame, TOTAL_COLUMN for the amount times the price.
+
+        Returns:
+            pd.DataFrame: The wide frame, one row per transaction.
+        """
+        expressions = ', '.join(self.column_expression(col) for col in columns)
+        frame = pd.DataFrame(self.query(f'SELECT {expressions} {rows.source()}', rows.source_params()),
+                             columns=columns)
+        for col in columns:
+            if col in DATE_COLUMNS:
+                frame[col] = sql_dates(frame[col])
+            elif col == TOTAL_COLUMN:
+                frame[col] = frame[col].astype('float64')
+            else:
+                frame[col] = frame[col].infer_objects()
+        return frame
+
+
+def join_clause(table_names):
+    """
+    Get the JOIN clauses of some dimension tables to the transactions.
+    """
+    return ''.join(f' JOIN {name} {TABLE_ALIASES[name]} ON {TABLE_ALIASES[name]}.{key} = t.{key}'
+                   for name, key in DIMENSION_KEYS.items() if name in table_names)
+
+
+class SqlRows:
+    """
+    The transactions matching some conditions, in the order of the table, counted and paged by queries.
+    """
+
+    def __init__(self, store, conditions, params, order=(), offset=0, limit=None, joins=frozenset()):
+        """
+        Args:
+            store (SqlSalesStore): The database.
+            conditions (list): The conditions of the transactions, on the t, u and i aliases.
+            params (list): The values of their parameters.
+            order (tuple): The ORDER BY terms before the position of the transactions.
+            offset (int): The number of transactions skipped.
+            limit (int | None): The maximum number of transactions, None for every one.
+            joins (frozenset): The dimension tables the conditions and the order refer to.
+        """
+        self.store = store
+        self.conditions = conditions
+        self.params = params
+        self.order = order
+        self.offset = offset
+        self.limit = limit
+        self.joins = joins
+        self.count = None
+
+    def __len__(self):
+        if self.count is None:
+            where = f"WHERE {' AND '.join(self.conditions)}" if self.conditions else ''
+            total = int(self.store.query(f'SELECT COUNT(*) FROM transactions t{join_clause(self.joins)} {where}',
+                                         self.params)[0][0])
+            total = max(0, total - self.offset)
+            self.count = total if self.limit is None else min(total, self.limit)
+        return self.count
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        page = SqlRows(self.store, self.conditions, self.params, self.order, self.offset + start, max(0, stop - start),
+                       self.joins)
+        page.count = page.limit
+        return page
+
+    def source(self):
+        """
+        Get the FROM and ORDER BY clauses of the rows, the users and items joined to the selected page only.
+        """
+        where = f"WHERE {' AND '.join(self.conditions)}" if self.conditions else ''
+        order = ', '.join([*self.order, 't.position'])
+        return (f'FROM (SELECT t.position FROM transactions t{join_clause(self.joins)} {where} ORDER BY {order} '
+                f'LIMIT ? OFFSET ?) p JOIN transactions t ON t.position = p.position{join_clause(DIMENSION_KEYS)} '
+                f'ORDER BY {order}')
+
+    def source_params(self):
+        """
+        Get the values of the parameters of source().
+        """
+        return [*self.params, -1 if self.limit is None else self.limit, self.offset]
+
+    def searched(self, col, text):
+        """
+        Keep the transactions whose value of a column contains a text, ignoring the case.
+
+        Args:
+            col (str): The column to search.
+            text (str): The text to find, an empty text keeps every transaction.
+
+        Returns:
+            SqlRows: The matching transactions.
+        """
+        if not text:
+            return self
+        expression = self.store.column_expression(col)
+        if col in DATE_COLUMNS:
+            # The text of a date is its timestamp, e.g. 2024-01-31 00:00:00
+            expression = f"strftime('%Y-%m-%d %H:%M:%S', {expression} / 1000000000, 'unixepoch')"
+        return SqlRows(self.store, [*self.conditions, f'instr(lower(CAST({expression} AS TEXT)), ?) > 0'],
+                       [*self.params, text.lower()], self.order, joins=self.joins | self.table_of(col))
+
+    def sorted(self, col, descending=False):
+        """
+        Order the transactions by a column, the missing values last and the transactions of a same value by date.
+
+        Args:
+            col (str): The column to sort by.
+            descending (bool): Sort from the largest value.
+
+        Returns:
+            SqlRows: The sorted transactions.
+        """
+        expression = self.store.column_expression(col)
+        return SqlRows(self.store, self.conditions, self.params,
+                       (f'{expression} IS NULL', f"{expression}{' DESC' if descending else ''}"),
+                       joins=self.joins | self.table_of(col))
+
+    def table_of(self, col):
+        """
+        Get the dimension table to join to read a column, an empty set for a column of the transactions.
+        """
+        table_name = self.store.tables.get(col, 'transactions')
+        return frozenset([table_name]) if table_name in DIMENSION_KEYS else frozenset()
+
+
+class SqlColumnOptions:
+    """
+    The options of a sidebar multiselect in the database, searched the way ColumnOptions searches them.
+    """
+
+    def __init__(self, store, name):
+        """
+        Args:
+            store (SqlSalesStore): The database.
+            name (str): The attribute.
+        """
+        self.store = store
+        self.name = name
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def values(self):
+        return self.select('', [], limit=-1, order='folded, value')
+
+    def select(self, condition, params, limit, order='transactions DESC, folded, value'):
+        """
+        Get the values of the options matching a condition.
+        """
+        rows = self.store.query(f'SELECT value FROM options WHERE name = ? {condition} ORDER BY {order} LIMIT ?',
+                                [self.name, *params, limit])
+        return [row[0] for row in rows]
+
+    def search(self, text, limit):
+        """
+        Find the values containing a text, ignoring the case, the values starting with it first.
+
+        Args:
+            text (str): The text typed, an empty text matches every value.
+            limit (int): The maximum number of values to return.
+
+        Returns:
+            list: The matching values.
+        """
+        text = text.strip().lower()
+        if not text:
+            return self.select('', [], limit)
+        prefix = [text, text + PREFIX_END]
+        picked = self.select('AND folded >= ? AND folded < ?', prefix, limit)
+        if len(picked) < limit:
+            picked += self.select('AND instr(folded, ?) > 0 AND NOT (folded >= ? AND folded < ?)', [text, *prefix],
+                                  limit - len(picked))
+        return picked
+
+    def find(self, labels):
+        """
+        Get the values whose text is one of some labels (e.g. read from the URL), in the sorted order.
+
+        Args:
+            labels (Iterable): The texts of the values.
+
+        Returns:
+            list: The values found.
+        """
+        labels = list(labels)
+        return self.select(f"AND label IN ({', '.join('?' * len(labels))})", labels, limit=-1,
+                           order='folded, value')
+
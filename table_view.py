@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from aggregation import transaction_totals
+from sales_model import row_positions
+
+#服务端表格: 搜索, 排序和分页在过滤后的行上完成, 只构建并发送当前页
+
+# The column of the table computed from the amount and the price, not stored in the model
+TOTAL_COLUMN = 'total'
+
+
+def table_column(model, col, rows):
+    """
+    Get a column of the table for some transactions.
+
+    Args:
+        model (SalesModel): The sales model.
+        col (str): The column name, a model column or TOTAL_COLUMN.
+        rows (range | np.ndarray): The positions of the transactions.
+
+    Returns:
+        pd.Series: The values, with a default index.
+    """
+    if col == TOTAL_COLUMN:
+        return pd.Series(transaction_totals(model, rows))
+    return model.column(col, rows)
+
+
+def search_rows(model, rows, col, text):
+    """
+    Keep the transactions whose value of a column contains a text, ignoring the case. The text of a
+    categorical column is only searched in its distinct values.
+
+    Args:
+        model (SalesModel): The sales model.
+        rows (range | np.ndarray): The positions of the transactions.
+        col (str): The column to search.
+        text (str): The text to find, an empty text keeps every transaction.
+
+    Returns:
+        range | np.ndarray: The positions of the matching transactions.
+    """
+    if not text:
+        return rows
+    values = table_column(model, col, rows)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        matched = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+        codes = values.cat.codes.to_numpy()
+        mask = np.append(np.asarray(matched, dtype=bool), False)[codes]
+    else:
+        mask = (values.notna() & values.astype(str).str.contains(text, case=False, regex=False)).to_numpy()
+    return row_positions(rows)[mask]
+
+
+def sort_rows(model, rows, col, descending=False):
+    """
+    Order the transactions by a column, the missing values last. The sort is stable, so the transactions of
+    a same value keep their order by date. The text of a categorical column is sorted alphabetically.
+
+    Args:
+        model (SalesModel): The sales model.
+        rows (range | np.ndarray): The positions of the transactions.
+        col (str): The column to sort by.
+        descending (bool): Sort from the largest value.
+
+    Returns:
+        np.ndarray: The positions of the transactions in the order of the column.
+    """
+    values = table_column(model, col, rows)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # The alphabetical rank of every category, NaN for the missing values
+        ranks = np.argsort(np.argsort(values.cat.categories.astype(str).to_numpy())).astype('float64')
+        codes = values.cat.codes.to_numpy()
+        values = pd.Series(np.where(codes >= 0, ranks[codes], np.nan))
+    order = values.sort_values(ascending=not descending, kind='stable', na_position='last').index.to_numpy()
+    return row_positions(rows)[order]
+
+
+def page_rows(rows, page, page_size):
+    """
+    Get the transactions of a page.
+
+    Args:
+        rows (range | np.ndarray): The positions of the transactions, in the order of the table.
+        page (int): The page number, from 1.
+        page_size (int): The number of transactions per page.
+
+    Returns:
+        range | np.ndarray: The positions of the transactions of the page.
+    """
+    first = (page - 1) * page_size
+    return rows[first:first + page_size]
+
+
+def page_count(row_count, page_size):
+    """
+    Count the pages of a table, an empty table still has a page.
+    """
+    return max(1, -(-row_count // page_size))
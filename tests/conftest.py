@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import streamlit.config
+import streamlit.logger
+
+# The modules of the dashboard are at the top of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+#测试配置: 导入仓库根目录的模块, 屏蔽在Streamlit应用之外调用Streamlit的警告
+
+# The tested functions call Streamlit outside of a running app: the config is parsed first (it sets the
+# log level), then only the errors are logged
+streamlit.config.get_option('logger.level')
+streamlit.logger.set_log_level('error')
@@ -0,0 +1,253 @@
+import datetime
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import summarize_sales
+from filter_index import DENSE_BITMAP_MAX_VALUES, FilterState, ValueBitmaps
+from ingestion import SalesFileError, read_delta
+from sales_model import append_delta, build_sales_model
+
+# The columns compared between an appended model and the model of the same sheets built at once
+COMPARED_COLUMNS = ['full_name', 'gender', 'age', 'item_name', 'category', 'season', 'printing', 'price', 'amount',
+                    'order_date']
+# The totals compared between the aggregates of the two models
+COMPARED_TOTALS = ['total_sales', 'units_sold', 'transaction_count', 'item_name_count', 'category_count']
+
+
+def users_sheet(first_id, count, rng):
+    return pd.DataFrame({
+        'user_id': np.arange(first_id, first_id + count),
+        'full_name': [f'Client {user_id}' for user_id in range(first_id, first_id + count)],
+        'birth_date': pd.Timestamp('1960-01-01') + pd.to_timedelta(rng.integers(0, 15000, count), unit='D'),
+        'gender': rng.choice(['male', 'female'], count),
+    })
+
+
+def items_sheet(first_id, count, rng, categories=('Tops', 'Pants', 'Shoes')):
+    return pd.DataFrame({
+        'item_id': np.arange(first_id, first_id + count),
+        'item_name': [f'Item {item_id}' for item_id in range(first_id, first_id + count)],
+        'category': rng.choice(list(categories), count),
+        'item_tags': 'tag',
+        'season': rng.choice(['fall/winter', 'spring/summer'], count),
+        'printing': rng.choice(['plain', 'printed'], count),
+        'price': rng.integers(5, 100, count).astype('float64'),
+    })
+
+
+def transactions_sheet(users, items, count, first_date, days, rng):
+    return pd.DataFrame({
+        'user_id': rng.choice(users['user_id'], count),
+        'item_id': rng.choice(items['item_id'], count),
+        'amount': rng.integers(1, 5, count),
+        'order_date': pd.Timestamp(first_date) + pd.to_timedelta(rng.integers(0, days, count), unit='D'),
+    })
+
+
+def filter_states(model):
+    """
+    Some filter states over dense (gender, category) and sparse (client and item names) bitmaps and dates.
+    """
+    options = model.option_index
+    return [
+        FilterState(),
+        FilterState(gender=('female',)),
+        FilterState(age_range=(30, 50)),
+        FilterState(start_date=datetime.date(2024, 2, 1), end_date=datetime.date(2024, 3, 15)),
+        FilterState(category=tuple(options['category'].values[-2:]), season=('spring/summer',)),
+        FilterState(full_name=tuple(options['full_name'].values[::7])),
+        FilterState(item_name=tuple(options['item_name'].values[-10:]), printing=('plain',)),
+    ]
+
+
+def assert_same_model(model, expected):
+    """
+    Check two models hold the same transactions: the same rows for every filter state, the same aggregates
+    and the same sidebar options.
+    """
+    assert len(model) == len(expected)
+    for state in filter_states(expected):
+        rows, expected_rows = model.filter_index.rows(state), expected.filter_index.rows(state)
+        pd.testing.assert_frame_equal(model.wide_view(rows, COMPARED_COLUMNS),
+                                      expected.wide_view(expected_rows, COMPARED_COLUMNS), check_categorical=False)
+        if not len(expected_rows):
+            continue
+        aggregates = summarize_sales(model, state, rows)
+        expected_aggregates = summarize_sales(expected, state, expected_rows)
+        for name in COMPARED_TOTALS:
+            assert getattr(aggregates, name) == pytest.approx(getattr(expected_aggregates, name)), (state, name)
+    for col in expected.option_index.columns:
+        options, expected_options = model.option_index[col], expected.option_index[col]
+        assert dict(zip(map(str, options.values), options.counts)) == \
+            dict(zip(map(str, expected_options.values), expected_options.counts)), col
+
+
+@pytest.fixture
+def base_sheets():
+    rng = np.random.default_rng(0)
+    users, items = users_sheet(1, 120, rng), items_sheet(1, 90, rng)
+    return {'users': users, 'items': items,
+            'transactions': transactions_sheet(users, items, 3000, '2024-01-01', 90, rng)}
+
+
+def rebuilt(base_sheets, deltas):
+    """
+    Build the model of the base sheets and of every delta at once.
+    """
+    sheets = {name: pd.concat([base_sheets[name]] + [delta[name] for delta in deltas if name in delta],
+                              ignore_index=True) for name in ('users', 'items', 'transactions')}
+    return build_sales_model(sheets)
+
+
+def test_deltas_appended_in_order(base_sheets):
+    rng = np.random.default_rng(1)
+    base = build_sales_model({name: sheet.copy() for name, sheet in base_sheets.items()})
+    base_rows = base.filter_index.rows(FilterState(gender=('male',))).copy()
+    model, deltas = base, []
+    for day in range(90, 130, 4):
+        deltas.append({'transactions': transactions_sheet(base_sheets['users'], base_sheets['items'], 150,
+                                                          datetime.date(2024, 1, 1) + datetime.timedelta(day), 4,
+                                                          rng)})
+        previous, model = model, append_delta(model, {name: sheet.copy() for name, sheet in deltas[-1].items()})
+        if previous is not base:
+            # Written after the fact table of the previous model, not copied
+            assert model.fact_storage is previous.fact_storage
+
+    assert_same_model(model, rebuilt(base_sheets, deltas))
+    # The sessions holding the base model keep its transactions
+    assert len(base) == 3000
+    np.testing.assert_array_equal(base.filter_index.rows(FilterState(gender=('male',))), base_rows)
+
+
+def test_delta_with_new_users_items_and_values(base_sheets):
+    rng = np.random.default_rng(2)
+    users, items = users_sheet(121, 40, rng), items_sheet(91, 30, rng, categories=('Hats', 'Tops'))
+    delta = {'users': users, 'items': items,
+             'transactions': transactions_sheet(pd.concat([base_sheets['users'], users]),
+                                                pd.concat([base_sheets['items'], items]), 400, '2024-04-01', 20,
+                                                rng)}
+    base = build_sales_model({name: sheet.copy() for name, sheet in base_sheets.items()})
+
+    model = append_delta(base, {name: sheet.copy() for name, sheet in delta.items()})
+
+    assert_same_model(model, rebuilt(base_sheets, [delta]))
+
+
+def test_back_dated_delta(base_sheets):
+    rng = np.random.default_rng(3)
+    delta = {'transactions': transactions_sheet(base_sheets['users'], base_sheets['items'], 300, '2024-02-01', 60,
+                                                rng)}
+    base = build_sales_model({name: sheet.copy() for name, sheet in base_sheets.items()})
+
+    model = append_delta(base, {name: sheet.copy() for name, sheet in delta.items()})
+
+    assert_same_model(model, rebuilt(base_sheets, [delta]))
+
+
+def test_delta_without_order_dates_is_rejected(base_sheets):
+    rng = np.random.default_rng(5)
+    delta = transactions_sheet(base_sheets['users'], base_sheets['items'], 10, '2024-04-01', 5, rng)
+    workbook = io.BytesIO()
+    with pd.ExcelWriter(workbook) as writer:
+        delta.drop(columns='order_date').to_excel(writer, sheet_name='transactions', index=False)
+
+    with pytest.raises(SalesFileError, match='order_date'):
+        read_delta(workbook.getvalue(), 'delta.xlsx')
+
+
+def test_deltas_appended_to_the_same_model(base_sheets):
+    rng = np.random.default_rng(4)
+    first, second, third = ({'transactions': transactions_sheet(base_sheets['users'], base_sheets['items'], 200,
+                                                                first_date, 10, rng)}
+                            for first_date in ('2024-04-01', '2024-04-11', '2024-04-11'))
+    base = build_sales_model({name: sheet.copy() for name, sheet in base_sheets.items()})
+    model = append_delta(base, {'transactions': first['transactions'].copy()})
+    chained = append_delta(model, {'transactions': second['transactions'].copy()})
+
+    # Two sessions appending to the same model: the second one doesn't write over the rows of the first
+    sibling = append_delta(model, {'transactions': third['transactions'].copy()})
+
+    assert chained.fact_storage is model.fact_storage
+    assert sibling.fact_storage is not model.fact_storage
+    assert_same_model(chained, rebuilt(base_sheets, [first, second]))
+    assert_same_model(sibling, rebuilt(base_sheets, [first, third]))
+    assert_same_model(model, rebuilt(base_sheets, [first]))
+
+
+def test_sparse_segments_same_as_isin():
+    rng = np.random.default_rng(6)
+    values = [f'Value {code}' for code in range(DENSE_BITMAP_MAX_VALUES + 40)]
+    codes = rng.integers(-1, DENSE_BITMAP_MAX_VALUES + 10, 500)
+    bitmaps = ValueBitmaps(pd.Index(values[:DENSE_BITMAP_MAX_VALUES + 10]), codes)
+    assert not bitmaps.dense
+
+    # Appends of every size, some with values the previous rows don't have
+    for append, size in enumerate([1, 7, 40, 3, 300, 2, 2, 90, 1000, 5, 60]):
+        category_count = min(len(values), DENSE_BITMAP_MAX_VALUES + 10 + 3 * append)
+        new_codes = rng.integers(-1, category_count, size)
+        bitmaps = bitmaps.extended(pd.Index(values[:category_count]), new_codes)
+        codes = np.concatenate([codes, new_codes])
+        # The segments shrink at least by half from the first one
+        sizes = [len(positions) for positions, _ in bitmaps.segments]
+        assert all(2 * later < earlier for earlier, later in zip(sizes, sizes[1:])), sizes
+
+        labels = pd.Series(pd.Categorical.from_codes(codes, categories=values[:category_count]))
+        for selected in (values[:3], values[category_count - 5:category_count], values[::9], ['Unknown']):
+            for start, stop in ((0, len(codes)), (len(codes) // 3, len(codes) - 7), (len(codes) - size, len(codes))):
+                expected = labels[start:stop].isin(selected).to_numpy()
+                np.testing.assert_array_equal(bitmaps.mask(tuple(selected), slice(start, stop)), expected)
+
+
+def merged_frame(sheets):
+    """
+    Merge the sheets as the dashboard did before the model: the ids cast to text and joined with pd.merge.
+    """
+    users = sheets['users'].astype({'user_id': str})
+    users['age'] = datetime.datetime.now().year - users['birth_date'].dt.year
+    merged = pd.merge(users, sheets['transactions'].astype({'user_id': str, 'item_id': str}), on='user_id')
+    return pd.merge(merged, sheets['items'].astype({'item_id': str}), on='item_id')
+
+
+def filtered_frame(frame, state):
+    """
+    Apply the filters of a state with the pandas filter chain of the sidebar.
+    """
+    frame = frame[(frame['age'] >= state.age_range[0]) & (frame['age'] <= state.age_range[1])]
+    if state.start_date is not None:
+        frame = frame[(frame['order_date'] >= pd.Timestamp(state.start_date))
+                      & (frame['order_date'] <= pd.Timestamp(state.end_date))]
+    for col in ('gender', 'season', 'full_name', 'item_name', 'category', 'printing'):
+        if getattr(state, col):
+            frame = frame[frame[col].isin(getattr(state, col))]
+    return frame
+
+
+def test_sparse_names_of_appended_users_same_as_the_filtered_merge(base_sheets):
+    rng = np.random.default_rng(7)
+    model, deltas = build_sales_model({name: sheet.copy() for name, sheet in base_sheets.items()}), []
+    users, items = base_sheets['users'], base_sheets['items']
+    for append in range(12):
+        new_users, new_items = users_sheet(121 + 10 * append, 10, rng), items_sheet(91 + 5 * append, 5, rng)
+        users, items = pd.concat([users, new_users]), pd.concat([items, new_items])
+        deltas.append({'users': new_users, 'items': new_items,
+                       'transactions': transactions_sheet(users, items, 100 + 50 * append,
+                                                          datetime.date(2024, 4, 1) + datetime.timedelta(append), 1,
+                                                          rng)})
+        model = append_delta(model, {name: sheet.copy() for name, sheet in deltas[-1].items()})
+
+    frame = merged_frame({name: pd.concat([base_sheets[name]] + [delta[name] for delta in deltas], ignore_index=True)
+                          for name in ('users', 'items', 'transactions')})
+    states = filter_states(model) + [FilterState(full_name=tuple(users['full_name'].iloc[-25:])),
+                                     FilterState(item_name=tuple(items['item_name'].iloc[::4]),
+                                                 start_date=datetime.date(2024, 3, 20),
+                                                 end_date=datetime.date(2024, 4, 8))]
+    for state in states:
+        rows = model.filter_index.rows(state)
+        expected = filtered_frame(frame, state)[COMPARED_COLUMNS]
+        pd.testing.assert_frame_equal(
+            model.wide_view(rows, COMPARED_COLUMNS).astype(object).sort_values(COMPARED_COLUMNS, ignore_index=True),
+            expected.astype(object).sort_values(COMPARED_COLUMNS, ignore_index=True), check_dtype=False,
+            obj=str(state))
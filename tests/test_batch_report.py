@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from batch_report import SUMMARY_FILE, parse_filter_spec, run_batch
+from sidebar import DEFAULT_AGE_RANGE, GENDER_VALUES, SEASON_VALUES
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+
+
+def test_corrupt_file_is_an_error_row(tmp_path):
+    corrupt = tmp_path / 'corrupt.xlsx'
+    corrupt.write_bytes(b'this is not a zip file')
+    output = tmp_path / 'reports'
+
+    summary = run_batch([SAMPLE_WORKBOOK, corrupt], output, parse_filter_spec(''), workers=2, plotlyjs='cdn')
+
+    written = pd.read_csv(output / SUMMARY_FILE)
+    assert len(written) == 2
+    assert written['status'].tolist()[0] == 'ok'
+    assert written['status'].tolist()[1].startswith('error: BadZipFile')
+    assert summary.loc[0, 'transactions'] == 500
+    assert (output / 'sales_analytics_2022.html').exists()
+
+
+def test_filter_spec():
+    state = parse_filter_spec('category=Tops&gender=female&age=20-60&start_date=2024-03-01')
+    assert state.category == ('Tops',)
+    assert state.gender == ('female',)
+    assert state.age_range == (20, 60)
+    assert str(state.start_date) == '2024-03-01'
+
+
+def test_default_filter_spec():
+    state = parse_filter_spec('')
+    assert state.gender == tuple(sorted(GENDER_VALUES)) and state.season == tuple(sorted(SEASON_VALUES))
+    assert state.age_range == tuple(DEFAULT_AGE_RANGE)
+    assert state.start_date is None and state.end_date is None
+    # No value checked, as in a shared link
+    assert parse_filter_spec('?gender=none').gender == ()
+
+
+@pytest.mark.parametrize('spec, message', [
+    ('colour=red', 'Unknown filters: colour'),
+    ('category=Tops&size=M&colour=red', 'Unknown filters: colour, size'),
+    ('gender=female&gender=other', 'Unknown gender values: other'),
+    ('season=winter', 'Unknown season values: winter'),
+    ('age=20', 'Malformed age range: 20'),
+    ('age=20-30-40', 'Malformed age range: 20-30-40'),
+    ('age=twenty-60', 'invalid literal'),
+    ('start_date=2024-13-01', 'month must be in 1..12'),
+    ('end_date=yesterday', 'Invalid isoformat'),
+])
+def test_malformed_filter_spec(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_filter_spec(spec)
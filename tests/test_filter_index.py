@@ -0,0 +1,147 @@
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import FilterState
+from sales_model import build_sales_model
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+# The columns compared between the model and the merged frame
+COMPARED_COLUMNS = ['full_name', 'age', 'gender', 'item_name', 'category', 'season', 'printing', 'price', 'amount',
+                    'order_date']
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    sheets = pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None)
+    users, items, transactions = sheets['users'], sheets['items'], sheets['transactions']
+    # A user without a birth date, a user and an item listed twice, and transactions of an unknown user and item
+    users.loc[2, 'birth_date'] = None
+    users = pd.concat([users, users.iloc[[3]].assign(full_name='Duplicate Client')], ignore_index=True)
+    items = pd.concat([items, items.iloc[[5]]], ignore_index=True)
+    orphans = transactions.iloc[:4].copy()
+    orphans.iloc[:2, orphans.columns.get_loc('user_id')] = 10 ** 6
+    orphans.iloc[2:, orphans.columns.get_loc('item_id')] = 10 ** 6
+    return {'users': users, 'items': items, 'transactions': pd.concat([transactions, orphans], ignore_index=True)}
+
+
+def merged_frame(sheets):
+    """
+    Merge the sheets as the dashboard did before the model: the ids cast to text and joined with pd.merge.
+    """
+    users = sheets['users'].astype({'user_id': str})
+    transactions = sheets['transactions'].astype({'user_id': str, 'item_id': str})
+    items = sheets['items'].astype({'item_id': str})
+    users['age'] = datetime.datetime.now().year - pd.to_datetime(users['birth_date']).dt.year
+    merged = pd.merge(users, transactions, on='user_id', how='inner')
+    merged = pd.merge(merged, items, on='item_id', how='inner')
+    merged['order_date'] = pd.to_datetime(merged['order_date'])
+    return merged
+
+
+def filtered_frame(frame, state):
+    """
+    Apply the filters of a state with the pandas filter chain of the sidebar.
+    """
+    frame = frame[(frame['age'] >= state.age_range[0]) & (frame['age'] <= state.age_range[1])]
+    if state.start_date is not None:
+        frame = frame[frame['order_date'] >= pd.Timestamp(state.start_date)]
+    if state.end_date is not None:
+        frame = frame[frame['order_date'] <= pd.Timestamp(state.end_date)]
+    for col in ('gender', 'season', 'full_name', 'item_name', 'category', 'printing'):
+        if getattr(state, col):
+            frame = frame[frame[col].isin(getattr(state, col))]
+    return frame
+
+
+def sorted_rows(frame):
+    frame = frame.astype({col: object for col in frame.columns if isinstance(frame[col].dtype, pd.CategoricalDtype)})
+    return frame.astype({'age': 'float64'}).sort_values(COMPARED_COLUMNS, ignore_index=True)
+
+
+def filter_states(frame):
+    first, last = frame['order_date'].min(), frame['order_date'].max()
+    categories = frame['category'].unique()
+    return [
+        FilterState(),
+        FilterState.from_selection(age_range=(25, 50)),
+        FilterState.from_selection(gender=['female'], season=['fall/winter']),
+        # Every gender: the filter is skipped, the users without an age are still dropped by the age range
+        FilterState.from_selection(gender=frame['gender'].unique()),
+        FilterState.from_selection(category=categories[:2], start_date=first + pd.Timedelta(days=40),
+                                   end_date=last - pd.Timedelta(days=50)),
+        FilterState.from_selection(full_name=frame['full_name'].unique()[::7], printing=frame['printing'].unique()[:1]),
+        FilterState.from_selection(item_name=frame['item_name'].unique()[:5], age_range=(30, 70), gender=['male']),
+        FilterState.from_selection(category=['no such category']),
+    ]
+
+
+def test_rows_same_as_the_filtered_merge(sheets):
+    model = build_sales_model({name: frame.copy() for name, frame in sheets.items()})
+    frame = merged_frame(sheets)
+
+    for state in filter_states(frame):
+        rows = model.filter_index.rows(state)
+        expected = filtered_frame(frame, state)
+        pd.testing.assert_frame_equal(sorted_rows(model.wide_view(rows, COMPARED_COLUMNS)),
+                                      sorted_rows(expected[COMPARED_COLUMNS]), check_dtype=False, obj=str(state))
+
+
+def test_same_state_whatever_the_selection_order():
+    state = FilterState.from_selection(category=['b', 'a', 'b'], age_range=(np.int64(20), 40.0))
+
+    assert state == FilterState.from_selection(category=['a', 'b'], age_range=(20, 40))
+    assert hash(state) == hash(FilterState(category=('a', 'b'), age_range=(20, 40)))
+
+
+def narrowing_states(frame):
+    """
+    Filter states each tightening the previous one.
+    """
+    first, last = frame['order_date'].min(), frame['order_date'].max()
+    categories = frame['category'].unique()
+    return [
+        FilterState(),
+        FilterState.from_selection(gender=['female']),
+        FilterState.from_selection(gender=['female'], age_range=(30, 60)),
+        FilterState.from_selection(gender=['female'], age_range=(30, 60), category=categories[:3]),
+        FilterState.from_selection(gender=['female'], age_range=(30, 60), category=categories[:3],
+                                   start_date=first + pd.Timedelta(days=30), end_date=last - pd.Timedelta(days=30)),
+        FilterState.from_selection(gender=['female'], age_range=(35, 50), category=categories[:1],
+                                   start_date=first + pd.Timedelta(days=60), end_date=last - pd.Timedelta(days=60)),
+    ]
+
+
+def test_refined_rows_same_as_the_filtered_merge(sheets):
+    model = build_sales_model({name: frame.copy() for name, frame in sheets.items()})
+    frame = merged_frame(sheets)
+    states = narrowing_states(frame)
+
+    for previous, state in zip(states, states[1:]):
+        assert state.narrows(previous) and not previous.narrows(state)
+        previous_rows = model.filter_index.scan(previous)
+        # Refined directly, whatever the share of the window the previous rows hold
+        rows = model.filter_index.refine(previous, previous_rows, state)
+        np.testing.assert_array_equal(np.asarray(rows), np.asarray(model.filter_index.scan(state)))
+        pd.testing.assert_frame_equal(sorted_rows(model.wide_view(rows, COMPARED_COLUMNS)),
+                                      sorted_rows(filtered_frame(frame, state)[COMPARED_COLUMNS]),
+                                      check_dtype=False, obj=str(state))
+
+    # Through the recent results: the states in order, then loosened again
+    for state in states + states[::-1]:
+        np.testing.assert_array_equal(np.asarray(model.filter_index.rows(state)),
+                                      np.asarray(model.filter_index.scan(state)))
+
+
+def test_narrows():
+    state = FilterState.from_selection(category=['a'], age_range=(20, 40))
+
+    assert state.narrows(FilterState())
+    assert state.narrows(FilterState.from_selection(category=['a', 'b'], age_range=(10, 50)))
+    assert not state.narrows(FilterState.from_selection(category=['b']))
+    assert not state.narrows(FilterState.from_selection(age_range=(25, 40)))
+    assert not state.narrows(FilterState.from_selection(start_date='2024-01-01'))
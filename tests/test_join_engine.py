@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from join_engine import join_star_schema, key_codes, positional_join
+
+
+def merged_pairs(dimension_codes, fact_codes):
+    """
+    The fact and dimension row pairs of the inner pd.merge of the codes, missing codes (-1) never matching.
+    """
+    facts = pd.DataFrame({'code': fact_codes, 'fact_row': np.arange(len(fact_codes))})
+    dimensions = pd.DataFrame({'code': dimension_codes, 'dimension_row': np.arange(len(dimension_codes))})
+    merged = pd.merge(facts[facts['code'] >= 0], dimensions[dimensions['code'] >= 0], on='code', how='inner')
+    return merged['fact_row'].to_numpy(), merged['dimension_row'].to_numpy()
+
+
+def test_positional_join_unique_keys_with_orphans():
+    dimension_codes = np.array([4, 0, 2, 7, -1])
+    fact_codes = np.array([2, 2, 5, -1, 7, 0, 9, 4])
+
+    fact_rows, dimension_rows, orphans = positional_join(dimension_codes, fact_codes)
+
+    expected_fact_rows, expected_dimension_rows = merged_pairs(dimension_codes, fact_codes)
+    np.testing.assert_array_equal(fact_rows, expected_fact_rows)
+    np.testing.assert_array_equal(dimension_rows, expected_dimension_rows)
+    assert orphans == 3
+
+
+def test_positional_join_duplicate_keys_like_merge():
+    rng = np.random.default_rng(0)
+    dimension_codes = rng.integers(-1, 40, 60)
+    fact_codes = rng.integers(-1, 50, 500)
+
+    fact_rows, dimension_rows, orphans = positional_join(dimension_codes, fact_codes)
+
+    expected_fact_rows, expected_dimension_rows = merged_pairs(dimension_codes, fact_codes)
+    np.testing.assert_array_equal(fact_rows, expected_fact_rows)
+    np.testing.assert_array_equal(dimension_rows, expected_dimension_rows)
+    assert orphans == np.count_nonzero(~np.isin(fact_codes, dimension_codes[dimension_codes >= 0]))
+
+
+def test_key_codes_match_numbers_by_value_and_text_by_string():
+    # A float id column (a sheet with blank cells) matches the int ids by value
+    dimension_codes, fact_codes = key_codes(pd.Series([1, 2, 3]), pd.Series([3.0, None, 1.0]))
+    assert fact_codes[0] == dimension_codes[2] and fact_codes[2] == dimension_codes[0] and fact_codes[1] == -1
+
+    dimension_codes, fact_codes = key_codes(pd.Series(['a1', 'b2']), pd.Series(['b2', 'c3']))
+    assert fact_codes[0] == dimension_codes[1] and fact_codes[1] not in dimension_codes
+
+
+def test_star_schema_has_the_rows_of_the_merged_frame():
+    rng = np.random.default_rng(1)
+    users = pd.DataFrame({'user_id': [1, 2, 3, 3, 5], 'full_name': ['A', 'B', 'C', 'C2', 'E']})
+    items = pd.DataFrame({'item_id': [10, 11, 11, 12], 'item_name': ['X', 'Y', 'Y2', 'Z']})
+    transactions = pd.DataFrame({'user_id': rng.choice([1, 2, 3, 4, 5], 200),
+                                 'item_id': rng.choice([10, 11, 12, 13], 200),
+                                 'amount': np.arange(200)})
+
+    fact, report = join_star_schema(transactions, users, items, 'user_key', 'item_key')
+
+    joined = pd.DataFrame({'full_name': users['full_name'].to_numpy()[fact['user_key']],
+                           'item_name': items['item_name'].to_numpy()[fact['item_key']],
+                           'amount': fact['amount'].to_numpy()})
+    # The merge of the sheets on their str cast keys
+    string_keys = {'user_id': str, 'item_id': str}
+    user_merged = pd.merge(users.astype({'user_id': str}), transactions.astype(string_keys), on='user_id', how='inner')
+    merged = pd.merge(user_merged, items.astype({'item_id': str}), on='item_id', how='inner')
+    columns = ['full_name', 'item_name', 'amount']
+    pd.testing.assert_frame_equal(joined.sort_values(columns, ignore_index=True),
+                                  merged[columns].sort_values(columns, ignore_index=True))
+    assert (report.duplicate_user_ids, report.duplicate_item_ids) == (1, 1)
+    assert report.orphan_user_transactions == np.count_nonzero(transactions['user_id'] == 4)
+    # The item orphans are counted among the rows joined to the users
+    assert report.orphan_item_transactions == np.count_nonzero(user_merged['item_id'] == '13')
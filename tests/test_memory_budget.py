@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pandas as pd
+
+import dashboard
+from dashboard import spill_message
+from filter_index import FilterState
+from ingestion import read_sheet_sizes, read_sheets
+from memory_budget import (MemoryBudget, MemoryLedger, estimate_sheet_bytes, is_memory_mapped, resident_bytes,
+                           spill_frame, spill_workbooks)
+from sales_model import build_partitioned_sales_model
+from schema import required_columns
+from snapshot import write_snapshot_directory
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+
+
+def test_spilled_model_counts_what_stays_in_memory(tmp_path):
+    sheets = pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None)
+    in_memory = build_partitioned_sales_model([('sample', {name: df.copy() for name, df in sheets.items()})])
+    spilled = build_partitioned_sales_model([('sample', sheets)], lambda frame: spill_frame(frame, str(tmp_path)))
+
+    assert all(is_memory_mapped(spilled.transactions[col].to_numpy()) for col in spilled.transactions.columns)
+    resident = resident_bytes(spilled)
+    assert resident['transactions'] == 0
+    # The spill leaves the indexes and the dimension tables in memory
+    assert resident['indexes'] == resident_bytes(in_memory)['indexes'] > 0
+    assert resident['dimensions'] > 0
+    assert resident_bytes(in_memory)['transactions'] > 0
+
+    budget = MemoryBudget(1)
+    message = spill_message(budget, 10 * 2 ** 20, 'the transactions are memory-mapped from disk', resident)
+    assert 'Still in memory' in message and message.endswith('over the budget too.')
+
+
+def test_sheet_sizes_read_before_parsing(tmp_path):
+    columns = required_columns(['full_name', 'gender', 'item_name', 'price', 'amount', 'order_date'])
+    sheets = read_sheets(SAMPLE_WORKBOOK, SAMPLE_WORKBOOK.name, columns)
+    write_snapshot_directory(pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None), tmp_path)
+
+    for source in (SAMPLE_WORKBOOK, tmp_path):
+        sizes = read_sheet_sizes(source, str(source), columns)
+        assert {name: sizes[name] for name in sheets} == {name: df.shape for name, df in sheets.items()}
+    assert estimate_sheet_bytes(sizes) >= sum(df.memory_usage(deep=True).sum() for df in sheets.values())
+
+
+def test_sheets_parsed_straight_to_disk():
+    in_memory = build_partitioned_sales_model([('sample', read_sheets(SAMPLE_WORKBOOK, SAMPLE_WORKBOOK.name))])
+
+    spilled = spill_workbooks([(SAMPLE_WORKBOOK, SAMPLE_WORKBOOK.name)])[0]
+    sheets = spilled.read()
+    model = build_partitioned_sales_model([('sample', sheets)], spill_frame)
+
+    assert all(is_memory_mapped(sheets['transactions'][col].to_numpy()) for col in sheets['transactions'].columns)
+    for name, df in read_sheets(SAMPLE_WORKBOOK, SAMPLE_WORKBOOK.name).items():
+        pd.testing.assert_frame_equal(sheets[name], df)
+    state = FilterState(gender=('female',))
+    pd.testing.assert_frame_equal(model.wide_view(model.filter_index.rows(state)),
+                                  in_memory.wide_view(in_memory.filter_index.rows(state)))
+
+
+def test_budget_shared_by_the_loads():
+    ledger = MemoryLedger()
+    with MemoryBudget(1000, ledger) as first:
+        first.account('sheets', nbytes=600)
+        with MemoryBudget(1000, ledger) as second:
+            second.account('sheets', nbytes=100)
+            assert second.exceeded(400)
+            assert second.shared_bytes == 600
+        first.release('sheets')
+        assert not MemoryBudget(1000, ledger).exceeded(900)
+    assert ledger.loads == {}
+
+
+def test_load_over_the_budget_parses_to_disk(monkeypatch):
+    monkeypatch.setattr(dashboard, 'MEMORY_BUDGET_BYTES', 1)
+    files = [(str(SAMPLE_WORKBOOK), SAMPLE_WORKBOOK.name, 'test_load_over_the_budget')]
+    projection = ['full_name', 'age', 'gender', 'item_name', 'category', 'item_tags', 'season', 'printing', 'price',
+                  'amount', 'order_date']
+
+    model = dashboard.load_sales_model(files, projection)
+
+    columns = tuple(sorted(required_columns(projection)))
+    cache = dashboard.get_ingestion_cache()
+    assert 'spilled' in cache.get(('test_load_over_the_budget', columns))
+    assert 'parsed straight to disk' in cache.get((('test_load_over_the_budget',), columns))['spill_report']
+    assert resident_bytes(model)['transactions'] == 0
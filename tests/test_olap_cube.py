@@ -0,0 +1,108 @@
+import datetime
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from aggregation import aggregate_cube, aggregate_sales
+from filter_index import FilterState
+from olap_cube import OlapCube
+from sales_model import TIME_BUCKET_COLUMNS, build_sales_model
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+# The totals compared between the cube, the scan and the merged frame
+COMPARED_TOTALS = ['total_sales', 'average_sale', 'units_sold', 'transaction_count', 'item_name_count',
+                   'category_count']
+# The grouped totals compared between the cube and the scan
+COMPARED_GROUPS = ['item_totals', 'category_totals', 'item_name_totals', 'month_gender_totals', 'age_gender_totals']
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    return pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None)
+
+
+@pytest.fixture(scope='module')
+def model(sheets):
+    model = build_sales_model({name: frame.copy() for name, frame in sheets.items()})
+    # Every cell kept, whatever the number of transactions of the sample
+    model.cube = OlapCube(model, model.transactions[TIME_BUCKET_COLUMNS['month']].to_numpy(), max_cell_percent=100)
+    return model
+
+
+def merged_frame(sheets):
+    """
+    Merge the sheets as the dashboard did before the model: the ids cast to text and joined with pd.merge.
+    """
+    users = sheets['users'].astype({'user_id': str})
+    users['age'] = datetime.datetime.now().year - pd.to_datetime(users['birth_date']).dt.year
+    merged = pd.merge(users, sheets['transactions'].astype({'user_id': str, 'item_id': str}), on='user_id')
+    merged = pd.merge(merged, sheets['items'].astype({'item_id': str}), on='item_id')
+    merged['order_date'] = pd.to_datetime(merged['order_date'])
+    return merged
+
+
+def filtered_totals(frame, state):
+    """
+    The totals of the merged frame filtered with the pandas filter chain of the sidebar.
+    """
+    frame = frame[(frame['age'] >= state.age_range[0]) & (frame['age'] <= state.age_range[1])]
+    if state.start_date is not None:
+        frame = frame[(frame['order_date'] >= pd.Timestamp(state.start_date))
+                      & (frame['order_date'] <= pd.Timestamp(state.end_date))]
+    for col in ('gender', 'season', 'category', 'printing'):
+        if getattr(state, col):
+            frame = frame[frame[col].isin(getattr(state, col))]
+    totals = frame['amount'] * frame['price']
+    return {'total_sales': totals.sum(), 'average_sale': totals.mean(), 'units_sold': frame['amount'].sum(),
+            'transaction_count': len(frame), 'item_name_count': frame['item_name'].nunique(),
+            'category_count': frame['category'].nunique(dropna=False)}
+
+
+def without_categories(frame):
+    return frame.astype({col: object for col in frame.columns if isinstance(frame[col].dtype, pd.CategoricalDtype)})
+
+
+def whole_month_states(model):
+    """
+    Filter states the cube answers: no client name and dates from the first to the last day of months.
+    """
+    start = model.transactions['order_date'].min().to_period('M').start_time + pd.DateOffset(months=2)
+    end = start + pd.DateOffset(months=3) - pd.Timedelta(days=1)
+    categories = model.items['category'].dropna().unique()
+    return [
+        FilterState(),
+        FilterState.from_selection(age_range=(25, 50), gender=['female']),
+        FilterState.from_selection(category=categories[:2], printing=model.items['printing'].dropna().unique()[:1]),
+        FilterState.from_selection(season=['spring/summer'], start_date=start, end_date=end),
+        FilterState.from_selection(category=['no such category']),
+    ]
+
+
+def test_cube_same_as_scan_and_merged_frame(sheets, model):
+    frame = merged_frame(sheets)
+
+    for state in whole_month_states(model):
+        cells = model.cube.cell_mask(state)
+        assert cells is not None, state
+        rows = model.filter_index.rows(state)
+        aggregates, scanned = aggregate_cube(model, model.cube, cells), aggregate_sales(model, rows)
+        expected = filtered_totals(frame, state)
+        for name in COMPARED_TOTALS:
+            assert getattr(aggregates, name) == pytest.approx(getattr(scanned, name), nan_ok=True), (state, name)
+            assert getattr(scanned, name) == pytest.approx(expected[name], nan_ok=True), (state, name)
+        for name in COMPARED_GROUPS:
+            pd.testing.assert_frame_equal(without_categories(getattr(aggregates, name)),
+                                          without_categories(getattr(scanned, name)), check_dtype=False, obj=name)
+
+
+def test_cube_falls_back_to_the_scan(model):
+    first, last = model.transactions['order_date'].min(), model.transactions['order_date'].max()
+    mid_month = pd.Timestamp(first).to_period('M').start_time + pd.Timedelta(days=14)
+
+    # Client names are not in the cube, nor are dates ending inside a month
+    assert model.cube.cell_mask(FilterState.from_selection(full_name=model.users['full_name'][:3])) is None
+    assert model.cube.cell_mask(FilterState.from_selection(start_date=first, end_date=mid_month)) is None
+    assert model.cube.cell_mask(FilterState.from_selection(start_date=last + pd.Timedelta(days=40),
+                                                           end_date=last + pd.Timedelta(days=80))) is None
@@ -0,0 +1,72 @@
+import datetime
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from option_index import OPTION_COLUMNS, ColumnOptions
+from sales_model import build_sales_model
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+# The texts searched in the options, with the number of values returned
+SEARCHES = [('', 7), ('a', 5), ('A', 50), (' sh ', 3), ('an', 10), ('e', 1000), ('xyz', 5)]
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    sheets = pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None)
+    # An item sold by no transaction, left out of the options
+    items = sheets['items']
+    sheets['items'] = pd.concat([items, items.iloc[[0]].assign(item_id=10 ** 6, item_name='Unsold Item')],
+                                ignore_index=True)
+    return sheets
+
+
+def merged_frame(sheets):
+    """
+    Merge the sheets as the dashboard did before the model: the ids cast to text and joined with pd.merge.
+    """
+    users = sheets['users'].astype({'user_id': str})
+    users['age'] = datetime.datetime.now().year - pd.to_datetime(users['birth_date']).dt.year
+    merged = pd.merge(users, sheets['transactions'].astype({'user_id': str, 'item_id': str}), on='user_id')
+    return pd.merge(merged, sheets['items'].astype({'item_id': str}), on='item_id')
+
+
+def searched_values(counts, text, limit):
+    """
+    Search the values of a column by scanning them: the values starting with the text first, then those
+    containing it, each from the most sold and then alphabetically.
+    """
+    text = text.strip().lower()
+    options = pd.DataFrame({'value': counts.index, 'count': counts.to_numpy()})
+    folded = options['value'].astype(str).str.lower()
+    options = options.assign(folded=folded, other=~folded.str.startswith(text))[folded.str.contains(text, regex=False)]
+    if not text:
+        options = options.assign(other=False)
+    options = options.sort_values(['other', 'count', 'folded'], ascending=[True, False, True], kind='stable')
+    return options['value'].head(limit).tolist()
+
+
+def test_options_same_as_the_merged_frame(sheets):
+    model = build_sales_model({name: frame.copy() for name, frame in sheets.items()})
+    frame = merged_frame(sheets)
+
+    for col in OPTION_COLUMNS:
+        options, counts = model.option_index[col], frame[col].value_counts()
+        assert dict(zip(options.values, options.counts)) == counts.to_dict(), col
+        assert list(options.values) == sorted(counts.index, key=lambda value: str(value).lower())
+        for text, limit in SEARCHES:
+            assert options.search(text, limit) == searched_values(counts, text, limit), (col, text)
+        labels = [str(value) for value in counts.index[::3]] + ['no such value']
+        assert sorted(options.find(labels)) == sorted(counts.index[::3])
+    assert 'Unsold Item' not in model.option_index['item_name'].values
+
+
+def test_prefix_matches_before_the_most_sold():
+    options = ColumnOptions(['Banana', 'bandana', 'Cabana', 'anna', 'Ann'], [1, 2, 50, 3, 3])
+
+    assert options.search('an', 10) == ['Ann', 'anna', 'Cabana', 'bandana', 'Banana']
+    assert options.search('AN', 2) == ['Ann', 'anna']
+    assert options.search('', 2) == ['Cabana', 'Ann']
+    assert options.find(['Ann', 'banana']) == ['Ann']
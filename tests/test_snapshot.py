@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from ingestion import read_sheets
+from snapshot import (convert_workbook_to_snapshot, is_snapshot, read_snapshot, write_snapshot_bundle,
+                      write_snapshot_directory)
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    return pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None)
+
+
+def assert_same_sheets(snapshot_sheets, sheets):
+    assert set(snapshot_sheets) == set(sheets)
+    for name, data_frame in sheets.items():
+        pd.testing.assert_frame_equal(snapshot_sheets[name], data_frame, check_dtype=False, check_index_type=False)
+
+
+def test_bundle_round_trip(tmp_path, sheets):
+    bundle = write_snapshot_bundle(sheets, tmp_path / 'sample.zip')
+
+    assert is_snapshot(bundle)
+    assert_same_sheets(read_snapshot(bundle), sheets)
+    # An uploaded bundle is read from its bytes
+    assert_same_sheets(read_snapshot(bundle.read_bytes()), sheets)
+
+
+@pytest.mark.parametrize('file_format', ['arrow', 'parquet'])
+def test_directory_round_trip(tmp_path, sheets, file_format):
+    directory = write_snapshot_directory(sheets, tmp_path / 'sample', file_format)
+
+    assert is_snapshot(directory)
+    assert_same_sheets(read_snapshot(directory), sheets)
+
+
+def test_converted_workbook_read_like_the_workbook(tmp_path):
+    bundle = convert_workbook_to_snapshot(SAMPLE_WORKBOOK, tmp_path / 'sample.zip')
+
+    snapshot_sheets = read_sheets(bundle.read_bytes(), 'sample.zip')
+    workbook_sheets = read_sheets(str(SAMPLE_WORKBOOK), SAMPLE_WORKBOOK.name)
+    assert set(snapshot_sheets) == set(workbook_sheets)
+    for name, data_frame in workbook_sheets.items():
+        pd.testing.assert_frame_equal(snapshot_sheets[name], data_frame, check_dtype=False)
+
+
+def test_mixed_column_stored_as_text(tmp_path):
+    users = pd.DataFrame({'user_id': [1, 'u2', 3], 'full_name': ['A', 'B', 'C']})
+
+    snapshot_sheets = read_snapshot(write_snapshot_bundle({'users': users}, tmp_path / 'mixed.zip'))
+
+    assert snapshot_sheets['users']['user_id'].tolist() == ['1', 'u2', '3']
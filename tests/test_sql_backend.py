@@ -0,0 +1,155 @@
+import gc
+import io
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from aggregation import summarize_sales, transaction_totals
+from filter_index import FilterState
+from ingestion import SalesFileError, read_workbooks
+from sales_model import build_partitioned_sales_model
+from schema import required_columns
+from sql_backend import SqlSalesStore
+from table_view import TOTAL_COLUMN, search_rows, sort_rows
+
+# The sample workbooks of the repository
+SAMPLE_DIR = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload'
+# The columns of the table compared between the database and the model
+PROJECTION = ['full_name', 'age', 'gender', 'item_name', 'category', 'item_tags', 'season', 'printing', 'price',
+              'amount', 'order_date']
+# The totals compared between the aggregates of the database and of the model
+COMPARED_TOTALS = ['total_sales', 'average_sale', 'units_sold', 'transaction_count', 'item_name_count',
+                   'category_count']
+# The grouped totals compared between the aggregates of the database and of the model
+COMPARED_GROUPS = ['item_totals', 'category_totals', 'item_name_totals', 'month_gender_totals', 'age_gender_totals']
+
+
+def load(files):
+    """
+    Load files into the database and into the in-memory model.
+    """
+    columns = required_columns(PROJECTION)
+    store = SqlSalesStore(files, columns)
+    model = build_partitioned_sales_model([(file_name, sheets) for (_, file_name), sheets
+                                           in zip(files, read_workbooks(files, columns))])
+    return store, model
+
+
+def without_categories(frame):
+    return frame.astype({col: object for col in frame.columns if isinstance(frame[col].dtype, pd.CategoricalDtype)})
+
+
+def filter_states(model):
+    """
+    Some filter states over the dates, the age range and the values of the users and items.
+    """
+    first, last = model.order_date_bounds
+    options = model.option_index
+    return [
+        FilterState(),
+        FilterState.from_selection(age_range=(20, 60), gender=['female']),
+        FilterState.from_selection(category=options['category'].values[:2], start_date=first + pd.Timedelta(days=40),
+                                   end_date=last - pd.Timedelta(days=50)),
+        FilterState.from_selection(full_name=options['full_name'].values[::9]),
+        FilterState.from_selection(printing=options['printing'].values[:1], season=['fall/winter']),
+    ]
+
+
+def assert_same_as_model(store, model):
+    """
+    Check the database gives the aggregates, the table pages and the sidebar options of the model.
+    """
+    assert len(store) == len(model)
+    assert store.join_report == model.join_report
+    assert store.order_date_bounds == model.order_date_bounds
+    pd.testing.assert_frame_equal(store.partitions, model.partitions, check_dtype=False)
+    for state in filter_states(model):
+        rows = model.filter_index.rows(state)
+        assert len(store.rows(state)) == len(rows)
+        if not len(rows):
+            continue
+        aggregates, expected = store.aggregates(state), summarize_sales(model, state, rows)
+        for name in COMPARED_TOTALS:
+            assert getattr(aggregates, name) == pytest.approx(getattr(expected, name)), (state, name)
+        for name in COMPARED_GROUPS:
+            pd.testing.assert_frame_equal(without_categories(getattr(aggregates, name)),
+                                          without_categories(getattr(expected, name)), check_dtype=False, obj=name)
+
+        for col, text, sort_column in (('item_name', 'sh', 'total'), ('order_date', '-03-', 'full_name'),
+                                       ('price', '.5', 'order_date'), ('age', '3', 'price')):
+            for descending in (False, True):
+                table_rows = sort_rows(model, search_rows(model, rows, col, text), sort_column, descending)
+                store_rows = store.rows(state).searched(col, text).sorted(sort_column, descending)
+                assert len(store_rows) == len(table_rows)
+                page = model.wide_view(table_rows[3:23], PROJECTION)
+                page[TOTAL_COLUMN] = transaction_totals(model, table_rows[3:23])
+                pd.testing.assert_frame_equal(without_categories(store.wide_view(store_rows[3:23],
+                                                                                 PROJECTION + [TOTAL_COLUMN])),
+                                              without_categories(page), check_dtype=False)
+
+    for col in ('full_name', 'item_name', 'category', 'printing'):
+        options, expected = store.option_index[col], model.option_index[col]
+        assert len(options) == len(expected)
+        assert list(options.values) == list(expected.values)
+        for text in ('', 'a', 'sh', 'xyz'):
+            assert options.search(text, 7) == expected.search(text, 7), (col, text)
+        labels = [str(value) for value in expected.values[::3]]
+        assert options.find(labels) == expected.find(labels)
+
+
+def workbook(sheets):
+    data = io.BytesIO()
+    with pd.ExcelWriter(data) as writer:
+        for name, frame in sheets.items():
+            frame.to_excel(writer, sheet_name=name, index=False)
+    return data.getvalue()
+
+
+def test_sample_years_same_as_model():
+    files = [(str(SAMPLE_DIR / name), name) for name in ('sales_analytics_2022.xlsx', 'sales_analytics_2024.xlsx')]
+
+    store, model = load(files)
+
+    assert_same_as_model(store, model)
+
+
+def test_duplicate_and_orphan_keys_same_as_model():
+    sheets = pd.read_excel(SAMPLE_DIR / 'sales_analytics_2022.xlsx', sheet_name=None)
+    users, items, transactions = sheets['users'], sheets['items'], sheets['transactions']
+    # A user and an item listed twice, and transactions of a user and of an item missing from their sheets
+    users = pd.concat([users, users.iloc[[3]].assign(full_name='Duplicate Client')], ignore_index=True)
+    items = pd.concat([items, items.iloc[[5]]], ignore_index=True)
+    orphans = transactions.iloc[:4].copy()
+    orphans.iloc[:2, orphans.columns.get_loc('user_id')] = 10 ** 6
+    orphans.iloc[2:, orphans.columns.get_loc('item_id')] = 10 ** 6
+    transactions = pd.concat([transactions, orphans], ignore_index=True)
+
+    store, model = load([(workbook({'users': users, 'items': items, 'transactions': transactions}), 'keys.xlsx')])
+
+    assert store.join_report.duplicate_user_ids == store.join_report.duplicate_item_ids == 1
+    assert store.join_report.orphan_user_transactions == store.join_report.orphan_item_transactions == 2
+    assert_same_as_model(store, model)
+
+
+def test_missing_column_names_the_file():
+    sheets = pd.read_excel(SAMPLE_DIR / 'sales_analytics_2022.xlsx', sheet_name=None)
+    sheets['items'] = sheets['items'].drop(columns='price')
+    files = [(str(SAMPLE_DIR / 'sales_analytics_2024.xlsx'), 'sales_analytics_2024.xlsx'),
+             (workbook(sheets), 'broken.xlsx')]
+
+    with pytest.raises(SalesFileError, match='broken.xlsx.*price'):
+        SqlSalesStore(files, required_columns(PROJECTION))
+
+
+def test_database_removed_with_the_store():
+    store = SqlSalesStore([(str(SAMPLE_DIR / 'sales_analytics_2022.xlsx'), 'sales_analytics_2022.xlsx')],
+                          required_columns(PROJECTION))
+    path = Path(store.path)
+    assert path.exists()
+
+    # The options of the store refer to it: the store is freed by the garbage collector
+    del store
+    gc.collect()
+
+    assert not path.exists()
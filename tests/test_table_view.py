@@ -0,0 +1,110 @@
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_index import FilterState
+from sales_model import build_sales_model
+from table_view import TOTAL_COLUMN, page_count, page_rows, search_rows, sort_rows, table_column
+
+# The sample workbook of the repository
+SAMPLE_WORKBOOK = Path(__file__).resolve().parent.parent / 'Excel_file_to_upload' / 'sales_analytics_2022.xlsx'
+# The columns of the table compared between the model and the merged frame
+COMPARED_COLUMNS = ['full_name', 'age', 'gender', 'item_name', 'category', 'season', 'printing', 'price', 'amount',
+                    'order_date']
+# The searched column, text and sorted column of the compared tables
+SEARCHES = [('item_name', 'sh', TOTAL_COLUMN), ('category', 'A', 'item_name'), ('order_date', '-03-', 'full_name'),
+            ('price', '9.9', 'order_date'), ('age', '3', 'price'), (TOTAL_COLUMN, '.9', 'category'),
+            ('full_name', '', 'age'), ('printing', 'xyz', 'amount')]
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    sheets = pd.read_excel(SAMPLE_WORKBOOK, sheet_name=None)
+    # A missing category and price, searched and sorted last
+    sheets['items'].loc[1, 'category'] = None
+    sheets['items'].loc[2, 'price'] = None
+    return sheets
+
+
+def merged_frame(sheets):
+    """
+    Merge the sheets as the dashboard did before the model: the ids cast to text and joined with pd.merge.
+    """
+    users = sheets['users'].astype({'user_id': str})
+    users['age'] = datetime.datetime.now().year - pd.to_datetime(users['birth_date']).dt.year
+    merged = pd.merge(users, sheets['transactions'].astype({'user_id': str, 'item_id': str}), on='user_id')
+    merged = pd.merge(merged, sheets['items'].astype({'item_id': str}), on='item_id')
+    merged['order_date'] = pd.to_datetime(merged['order_date'])
+    merged[TOTAL_COLUMN] = merged['amount'] * merged['price']
+    return merged
+
+
+def filtered_frame(frame, state):
+    """
+    Apply the filters of a state with the pandas filter chain of the sidebar.
+    """
+    frame = frame[(frame['age'] >= state.age_range[0]) & (frame['age'] <= state.age_range[1])]
+    for col in ('gender', 'season', 'category'):
+        if getattr(state, col):
+            frame = frame[frame[col].isin(getattr(state, col))]
+    return frame
+
+
+def table(model, rows):
+    """
+    The table of some transactions: the columns of the model and their totals.
+    """
+    data_frame = model.wide_view(rows, COMPARED_COLUMNS)
+    data_frame[TOTAL_COLUMN] = table_column(model, TOTAL_COLUMN, rows).to_numpy()
+    return data_frame.astype({col: object for col in data_frame.columns
+                              if isinstance(data_frame[col].dtype, pd.CategoricalDtype)})
+
+
+def sorted_rows(frame):
+    columns = COMPARED_COLUMNS + [TOTAL_COLUMN]
+    return frame[columns].astype({'age': 'float64'}).sort_values(columns, ignore_index=True)
+
+
+def sorted_values(values, descending):
+    """
+    The values of a column sorted like a table column: the text alphabetically, the missing values last.
+    """
+    values = values.reset_index(drop=True)
+    return values.sort_values(ascending=not descending, na_position='last', ignore_index=True).astype(object)
+
+
+@pytest.mark.parametrize('state', [FilterState(), FilterState.from_selection(gender=['female'], age_range=(20, 50)),
+                                   FilterState.from_selection(season=['spring/summer'])])
+def test_searched_and_sorted_like_the_merged_frame(sheets, state):
+    model = build_sales_model({name: frame.copy() for name, frame in sheets.items()})
+    frame = filtered_frame(merged_frame(sheets), state)
+    rows = model.filter_index.rows(state)
+
+    for col, text, sort_column in SEARCHES:
+        searched = search_rows(model, rows, col, text)
+        expected = frame[frame[col].notna() & frame[col].astype(str).str.contains(text, case=False, regex=False)] \
+            if text else frame
+        pd.testing.assert_frame_equal(sorted_rows(table(model, searched)), sorted_rows(expected),
+                                      check_dtype=False, obj=f'{col} {text}')
+
+        for descending in (False, True):
+            ordered = sort_rows(model, searched, sort_column, descending)
+            values = table(model, ordered)[sort_column]
+            pd.testing.assert_series_equal(values.astype(object), sorted_values(expected[sort_column], descending),
+                                           check_names=False, check_dtype=False, obj=f'{sort_column} {descending}')
+            # Stable: the rows of a same value keep their order by date
+            for _, positions in pd.Series(np.asarray(ordered)).groupby(values.astype(str).to_numpy()):
+                assert positions.is_monotonic_increasing
+
+
+def test_pages_cover_the_rows():
+    rows = np.arange(5, 250, 3)
+
+    pages = [page_rows(rows, page, 20) for page in range(1, page_count(len(rows), 20) + 1)]
+
+    np.testing.assert_array_equal(np.concatenate(pages), rows)
+    assert [len(page) for page in pages] == [20, 20, 20, 20, 2]
+    assert page_count(0, 20) == 1
@@ -8,18 +8,18 @@ GRAPH_WIDTH: int = 550
 TOTAL_COLUMN_STR: str = 'total'
 
 #热销商品图表
-def create_horizontal_bar_chart(data_frame):
+def create_horizontal_bar_chart(aggregates):
     """
     Create a horizontal bar chart to visualize the total amount of money from sales for each item.
 
     Args:
-        data_frame (pd.DataFrame): The DataFrame containing the data.
+        aggregates (SalesAggregates): The totals of the filtered transactions.
 
     Returns:
         plotly.graph_objects.Figure: The horizontal bar chart.
     """
-    # Group by item_name and calculate the total amount
-    grouped_df = data_frame.groupby('item_name')[TOTAL_COLUMN_STR].sum().reset_index()
+    # The total amount per item_name
+    grouped_df = aggregates.item_name_totals
     # Sort the DataFrame by total amount in descending order and show the tail 10 (its ascending order so tail is max)
     grouped_df = grouped_df.sort_values(TOTAL_COLUMN_STR, ascending=True).tail(10)
     # Round the total values